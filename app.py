@@ -1,1115 +1,1755 @@
-import streamlit as st
-import fitparse
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import pydeck as pdk
-import os
-import datetime
-import io
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-
-# Configurazione della pagina
-st.set_page_config(page_title="Coach Dashboard Pro", layout="wide")
-
-# --- LOGIN SEMPLICE ---
-def require_login():
-    if "authenticated" not in st.session_state:
-        st.session_state.authenticated = False
-    if "login_error" not in st.session_state:
-        st.session_state.login_error = ""
-
-    if not st.session_state.authenticated:
-        # Funzione riutilizzabile per login via Enter o bottone
-        def do_login():
-            user_val = st.session_state.get("login_user", "")
-            pwd_val = st.session_state.get("login_pwd", "")
-            auth = st.secrets.get("auth", {})
-            expected_user = auth.get("username", "")
-            expected_password = auth.get("password", "")
-            if user_val == expected_user and pwd_val == expected_password:
-                st.session_state.authenticated = True
-                st.session_state.login_error = ""
-            else:
-                st.session_state.login_error = "Credenziali non valide."
-
-        # Centriamo il form di login
-        col_left, col_center, col_right = st.columns([1, 2, 1])
-        with col_center:
-            st.markdown("### 🔐 Login")
-            user = st.text_input("Utente", key="login_user")
-            pwd = st.text_input(
-                "Password",
-                type="password",
-                key="login_pwd",
-                on_change=do_login  # Invio da tastiera sulla password prova il login
-            )
-            if st.button("Accedi"):
-                do_login()
-
-            if st.session_state.login_error:
-                st.error(st.session_state.login_error)
-            elif st.session_state.authenticated:
-                st.success("Accesso riuscito. Benvenuto!")
-        st.stop()
-
-require_login()
-
-# Titolo mostrato solo dopo login
-st.title("🚴‍♂️ Dashboard Performance & Progressi")
-
-# --- CONFIGURAZIONE ---
-# Folder ID può essere configurato nei secrets o hardcoded qui
-if 'config' in st.secrets and 'google_drive_folder_id' in st.secrets['config']:
-    GOOGLE_DRIVE_FOLDER_ID = st.secrets['config']['google_drive_folder_id']
-else:
-    GOOGLE_DRIVE_FOLDER_ID = "1b-nerBbVjtzxDJnVIeMuVRfg4vlRmrji"
-SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
-
-# --- FUNZIONI GOOGLE DRIVE ---
-@st.cache_resource
-def get_drive_service():
-    """Autentica e restituisce il servizio Google Drive usando Service Account da Streamlit secrets o file locale."""
-    try:
-        # Prova prima a caricare dai secrets di Streamlit (produzione/cloud)
-        if 'google_credentials' in st.secrets:
-            creds_dict = st.secrets['google_credentials']
-            creds = service_account.Credentials.from_service_account_info(
-                creds_dict,
-                scopes=SCOPES
-            )
-        # Fallback: prova a caricare da file locale (sviluppo)
-        elif os.path.exists('credentials.json'):
-            creds = service_account.Credentials.from_service_account_file(
-                'credentials.json',
-                scopes=SCOPES
-            )
-        else:
-            st.error("Credenziali Google non trovate.")
-            st.info("""
-            Configura le credenziali in uno di questi modi:
-            
-            **Per Streamlit Cloud:**
-            1. Vai su https://share.streamlit.io
-            2. Seleziona la tua app
-            3. Vai su Settings > Secrets
-            4. Aggiungi la sezione 'google_credentials' con il contenuto del tuo credentials.json
-            
-            **Per sviluppo locale:**
-            - Metti il file credentials.json nella directory del progetto
-            """)
-            st.stop()
-        
-        return build('drive', 'v3', credentials=creds)
-    except Exception as e:
-        st.error(f"Errore durante l'autenticazione con Service Account: {e}")
-        st.info("Verifica che le credenziali siano corrette e che il Service Account abbia i permessi necessari su Google Drive")
-        st.stop()
-
-@st.cache_data(ttl=300)  # Cache per 5 minuti
-def list_drive_files(folder_id):
-    """Ottiene la lista di file .fit dalla cartella Google Drive."""
-    try:
-        service = get_drive_service()
-        query = f"'{folder_id}' in parents and mimeType != 'application/vnd.google-apps.folder' and name contains '.fit'"
-        results = service.files().list(q=query, fields="files(id, name)").execute()
-        files = results.get('files', [])
-        # Restituisce lista di tuple (nome_file, file_id)
-        return [(f['name'], f['id']) for f in files]
-    except Exception as e:
-        st.error(f"Errore nel recupero file da Google Drive: {e}")
-        return []
-
-def download_file_from_drive(file_id):
-    """Scarica un file da Google Drive e restituisce i dati binari."""
-    try:
-        service = get_drive_service()
-        request = service.files().get_media(fileId=file_id)
-        file_data = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_data, request)
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-        file_data.seek(0)
-        return file_data
-    except Exception as e:
-        st.error(f"Errore nel download del file: {e}")
-        return None
-
-# --- FUNZIONI DI CARICAMENTO E CALCOLO ---
-
-# Smoothing altitudine: solo per ciclocomputer/Bryton (partenza in quota). Soglia: prima quota valida > 50 m
-ALT_SMOOTH_WINDOW = 30   # più finestra = dislivello più vicino a riferimento esterno (es. 180 m)
-ALT_SMOOTH_THRESHOLD_M = 50
-# Pendenza max Bryton: solo segmenti lunghi, 95° percentile e cap 25% per evitare 66% da rumore
-GRADE_MIN_DIST_M_BRYTON = 30
-GRADE_MAX_CAP_PCT = 25
-
-def elevation_gain_m(alt_series, threshold=0):
-    """
-    Calcola dislivello per Indoor/Rulli (Rumore = 0).
-    Sostituzione diretta: somma aritmetica di ogni incremento positivo.
-    """
-    if alt_series is None or len(alt_series) < 2:
-        return 0.0
-    
-    # Calcoliamo le differenze punto per punto
-    diffs = alt_series.diff()
-    
-    # Sommiamo solo dove la differenza è positiva (> 0)
-    # Nessun filtro, nessuna media mobile: prendiamo tutto.
-    gain = diffs[diffs > 0].sum()
-            
-    return gain
-
-def calculate_ftp_estimate(df):
-    """Calcola l'FTP stimato come il 95% della miglior potenza media di 20 minuti."""
-    if 'power' in df.columns and df['power'].max() > 0:
-        # Assumendo campionamento a 1Hz, 20 minuti = 1200 record
-        window = 1200
-        if len(df) >= window:
-            mmp20 = df['power'].rolling(window=window).mean().max()
-            return int(mmp20 * 0.95)
-        else:
-            # Se l'attività è più corta di 20 min, facciamo una stima prudenziale sulla potenza media
-            return int(df['power'].mean())
-    return 250
-
-
-def calculate_ftp_from_last_n_activities(all_files_dict, n):
-    """
-    Calcola l'FTP stimato analizzando le ultime N attività disponibili,
-    concatenando i dati di potenza e riutilizzando la logica di calculate_ftp_estimate.
-    all_files_dict: dict con chiave=nome_file, valore=file_id
-    """
-    if not all_files_dict:
-        return 250
-
-    # Prendiamo le ultime N attività in ordine alfabetico (tipicamente i file hanno data nel nome)
-    sorted_files = sorted(all_files_dict.items())[-n:]
-
-    dfs = []
-    for fname, file_id in sorted_files:
-        df_temp = load_single_fit_from_drive(file_id)
-        if not df_temp.empty and 'power' in df_temp.columns and df_temp['power'].max() > 0:
-            dfs.append(df_temp)
-
-    if not dfs:
-        return 250
-
-    df_all = pd.concat(dfs, ignore_index=True)
-    return calculate_ftp_estimate(df_all)
-
-def load_single_fit(file_data):
-    """Carica i dati completi di un singolo file da dati binari."""
-    try:
-        fitfile = fitparse.FitFile(file_data)
-        data = []
-        for record in fitfile.get_messages("record"):
-            r = {field.name: field.value for field in record}
-            data.append(r)
-        
-        df = pd.DataFrame(data)
-        
-        if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            start = df['timestamp'].iloc[0]
-            df['minuti_trascorsi'] = (df['timestamp'] - start).dt.total_seconds() / 60
-        
-        if 'speed' in df.columns: df['speed_kmh'] = df['speed'] * 3.6
-        # Altitudine: Bryton/cyclocomputer possono avere enhanced_altitude o altitude; nessun fillna(0)
-        # per non creare falsi salti da 0 alla prima quota reale (Bryton parte spesso da quota > 0)
-        if 'enhanced_altitude' in df.columns and df['enhanced_altitude'].notna().any():
-            df['altitude_m'] = df['enhanced_altitude'].astype(float).ffill().bfill()
-        elif 'altitude' in df.columns and df['altitude'].notna().any():
-            df['altitude_m'] = df['altitude'].astype(float).ffill().bfill()
-        elif 'enhanced_altitude' in df.columns:
-            df['altitude_m'] = df['enhanced_altitude'].astype(float).ffill().bfill()
-        elif 'altitude' in df.columns:
-            df['altitude_m'] = df['altitude'].astype(float).ffill().bfill()
-        if 'altitude_m' in df.columns and df['altitude_m'].isna().any():
-            df['altitude_m'] = df['altitude_m'].fillna(0)
-        if 'power' not in df.columns:
-            df['power'] = 0
-
-        return df
-    except Exception as e:
-        return pd.DataFrame()
-
-@st.cache_data
-def load_single_fit_from_drive(file_id):
-    """Scarica e carica un file FIT da Google Drive."""
-    file_data = download_file_from_drive(file_id)
-    if file_data:
-        return load_single_fit(file_data)
-    return pd.DataFrame()
-
-@st.cache_data
-def get_activity_summary(files_dict):
-    """
-    Legge velocemente tutti i file per i trend da Google Drive.
-    files_dict: dict con chiave=nome_file, valore=file_id
-    """
-    summary_data = []
-    progress_bar = st.progress(0)
-    total_files = len(files_dict)
-    
-    for i, (filename, file_id) in enumerate(files_dict.items()):
-        try:
-            file_data = download_file_from_drive(file_id)
-            if file_data:
-                fitfile = fitparse.FitFile(file_data)
-                records = [{field.name: field.value for field in record} for record in fitfile.get_messages("record")]
-                df_temp = pd.DataFrame(records)
-                
-                if not df_temp.empty and 'timestamp' in df_temp.columns:
-                    date = pd.to_datetime(df_temp['timestamp'].iloc[0])
-                    dist = df_temp['distance'].max() / 1000 if 'distance' in df_temp.columns else 0
-                    speed_avg = (df_temp['speed'].mean() * 3.6) if 'speed' in df_temp.columns else 0
-                    power_avg = df_temp['power'].mean() if 'power' in df_temp.columns else 0
-                    cad_avg = df_temp[df_temp['cadence'] > 0]['cadence'].mean() if 'cadence' in df_temp.columns else 0
-                    hr_avg = df_temp['heart_rate'].mean() if 'heart_rate' in df_temp.columns else 0
-                    
-                    ele_gain = 0
-                    if 'enhanced_altitude' in df_temp.columns:
-                        ele_gain = elevation_gain_m(df_temp['enhanced_altitude'])
-                    elif 'altitude' in df_temp.columns:
-                        ele_gain = elevation_gain_m(df_temp['altitude'])
-                    
-                    duration_min = (df_temp['timestamp'].iloc[-1] - df_temp['timestamp'].iloc[0]).total_seconds() / 60
-
-                    # Coerciamo NaN a 0 per file Bryton/cyclocomputer senza alcuni campi
-                    if pd.isna(speed_avg): speed_avg = 0
-                    if pd.isna(power_avg): power_avg = 0
-                    if pd.isna(cad_avg): cad_avg = 0
-                    if pd.isna(hr_avg): hr_avg = 0
-                    if pd.isna(dist): dist = 0
-                    if pd.isna(ele_gain): ele_gain = 0
-                    if pd.isna(duration_min): duration_min = 0
-
-                    summary_data.append({
-                        'Filename': filename, 'Data': date, 'Distanza (km)': round(float(dist), 2),
-                        'Velocità Avg (km/h)': round(float(speed_avg), 1), 'Potenza Avg (W)': int(power_avg),
-                        'Cadenza Avg (rpm)': int(cad_avg), 'FC Avg (bpm)': int(hr_avg),
-                        'Dislivello (m)': int(ele_gain), 'Durata (min)': int(duration_min)
-                    })
-        except Exception as e:
-            st.error(f"Errore durante la lettura del file '{filename}': {e}")
-        progress_bar.progress((i + 1) / total_files)
-    progress_bar.empty()
-    return pd.DataFrame(summary_data).sort_values(by='Data')
-
-# --- LOGICA APPLICAZIONE ---
-
-# Ottieni lista file da Google Drive
-drive_files = list_drive_files(GOOGLE_DRIVE_FOLDER_ID)
-
-if not drive_files:
-    st.warning("Nessun file .fit trovato nella cartella Google Drive.")
-    st.stop()
-
-# Crea dizionario nome_file -> file_id e ordina per nome (decrescente per date AAAAMMGG)
-files_dict = {name: file_id for name, file_id in drive_files}
-all_files = sorted(files_dict.keys(), reverse=True)
-
-with st.sidebar:
-    st.header("🧭 Navigazione")
-    app_mode = st.radio("Seleziona Modalità:", ["📊 Analisi Singola Attività", "📈 Analisi Trend & Progressi"])
-    st.markdown("---")
-
-# ==============================================================================
-# MODALITÀ 1: ANALISI SINGOLA
-# ==============================================================================
-if app_mode == "📊 Analisi Singola Attività":
-    
-    with st.sidebar:
-        st.subheader("Impostazioni Analisi")
-        file_selezionato = st.selectbox("Scegli attività:", all_files)
-        file_id = files_dict[file_selezionato]
-        
-        # Carichiamo i dati della singola attività
-        df = load_single_fit_from_drive(file_id)
-        
-        st.markdown("---")
-        st.write("🔧 **Configurazione Atleta**")
-        
-        # Peso atleta (usato per stima calorie)
-        user_weight = st.number_input(
-            "Peso (kg)",
-            min_value=30,
-            max_value=150,
-            value=60,
-            step=1,
-            help="Peso corporeo utilizzato per stimare il consumo calorico."
-        )
-        
-        # Calcolo stima dinamica FTP sulle ultime 5 attività (non solo su questa)
-        ftp_stimato = calculate_ftp_from_last_n_activities(files_dict, 5)
-        
-        # Input FTP con valore di default stimato (ultime 5 attività)
-        user_ftp = st.number_input(
-            "Il tuo FTP (Watt):",
-            min_value=50,
-            max_value=600,
-            value=ftp_stimato,
-            step=5,
-            help=f"FTP stimato sulle ultime 5 attività: {ftp_stimato}W (≈95% della miglior potenza media di 20 minuti complessiva). Puoi modificarlo se conosci il tuo valore reale."
-        )
-
-        # Rapporto peso/potenza legato all'FTP (mostrato in configurazione atleta)
-        wkg_ftp_sidebar = user_ftp / user_weight if user_weight > 0 else 0
-        st.text_input(
-            "Rapporto peso/potenza FTP (W/kg)",
-            value=f"{wkg_ftp_sidebar:.2f}",
-            help="Calcolato come FTP / peso corporeo. Indica quanti Watt sviluppi per kg di peso: utile per confrontare le prestazioni tra atleti diversi.",
-            disabled=True,
-        )
-
-    if not df.empty:
-        st.markdown(f"## 🔎 Dettaglio: {file_selezionato}")
-        
-        # Calcoli base per KPI (coerciamo NaN a 0 per file Bryton/cyclocomputer senza alcuni campi)
-        dist_km = float(df['distance'].max() / 1000) if 'distance' in df.columns else 0
-        durata_min = (df['timestamp'].iloc[-1] - df['timestamp'].iloc[0]).total_seconds() / 60 if 'timestamp' in df.columns else 0
-        speed_avg = df['speed_kmh'].mean() if 'speed_kmh' in df.columns else 0
-        p_avg = df['power'].mean() if 'power' in df.columns else 0
-        hr_avg = df['heart_rate'].mean() if 'heart_rate' in df.columns else 0
-        cad_avg = df[df['cadence'] > 0]['cadence'].mean() if 'cadence' in df.columns else 0
-        gain = elevation_gain_m(df['altitude_m']) if 'altitude_m' in df.columns else 0
-        if pd.isna(speed_avg): speed_avg = 0
-        if pd.isna(p_avg): p_avg = 0
-        if pd.isna(hr_avg): hr_avg = 0
-        if pd.isna(cad_avg): cad_avg = 0
-        if pd.isna(durata_min): durata_min = 0
-        if pd.isna(dist_km): dist_km = 0
-        if pd.isna(gain): gain = 0
-
-        # Consumo calorico stimato (usato anche nei KPI)
-        kcal = 0
-        if dist_km > 0:
-            kcal = 0.3 * user_weight * dist_km
-
-        # Rapporti peso/potenza
-        wkg_ftp = user_ftp / user_weight if user_weight > 0 else 0
-        wkg_session = p_avg / user_weight if user_weight > 0 else 0
-
-        # KPI - Prima riga
-        r1c1, r1c2, r1c3, r1c4, r1c5, r1c6 = st.columns(6)
-        r1c1.metric("Distanza", f"{dist_km:.2f} km")
-        r1c2.metric("Durata", f"{durata_min:.0f} min")
-        r1c3.metric("Velocità Avg", f"{speed_avg:.1f} km/h")
-        r1c4.metric("Potenza Avg", f"{int(p_avg)} W")
-        r1c5.metric(
-            "FTP Stimato",
-            f"{ftp_stimato} W",
-            help="FTP stimato sulle ultime 5 attività (≈95% della miglior potenza media di 20 minuti complessiva)."
-        )
-        r1c6.metric(
-            "FTP W/kg",
-            f"{wkg_ftp:.2f} W/kg",
-            help="Rapporto peso/potenza basato sull'FTP (FTP / peso). Utile per confrontare le prestazioni tra atleti di peso diverso."
-        )
-
-        # KPI - Seconda riga
-        r2c1, r2c2, r2c3, r2c4, r2c5, r2c6 = st.columns(6)
-        r2c1.metric("FC Media", f"{hr_avg:.0f} bpm")
-        r2c2.metric("Cadenza Avg", f"{int(cad_avg)} rpm")
-        r2c3.metric("Dislivello", f"{int(gain)} m")
-        r2c4.metric("Consumo stimato", f"{kcal:.0f} kcal")
-        r2c5.metric("W/kg Sessione", f"{wkg_session:.2f} W/kg")
-        r2c6.metric("Peso", f"{user_weight:.1f} kg")
-
-        x_axis = 'distance' if 'distance' in df.columns else 'minuti_trascorsi'
-        x_label = 'Distanza (metri)' if 'distance' in df.columns else 'Minuti'
-        
-        st.markdown("---")
-
-        # --- GRAFICO TUTTO IN UNO ---
-        st.subheader("📊 Confronto Tutto in Uno")
-        chk1, chk2, chk3, chk4, chk5, chk_norm = st.columns(6)
-        show_speed = chk1.checkbox("Velocità", value=True) if 'speed_kmh' in df.columns else False
-        show_power = chk2.checkbox("Potenza", value=True) if 'power' in df.columns else False
-        show_cadence = chk3.checkbox("Cadenza", value=False) if 'cadence' in df.columns else False
-        show_altitude = chk4.checkbox("Altitudine", value=False) if 'altitude_m' in df.columns else False
-        show_hr = chk5.checkbox("Freq. Cardiaca", value=False) if 'heart_rate' in df.columns else False
-        normalize = chk_norm.checkbox("Normalizza %", value=True)
-
-        selected_cols = []
-        if show_speed: selected_cols.append('speed_kmh')
-        if show_power: selected_cols.append('power')
-        if show_cadence: selected_cols.append('cadence')
-        if show_altitude: selected_cols.append('altitude_m')
-        if show_hr: selected_cols.append('heart_rate')
-
-        if selected_cols:
-            plot_df = df[[x_axis] + selected_cols].copy()
-            if normalize:
-                for col in selected_cols:
-                    mx, mn = plot_df[col].max(), plot_df[col].min()
-                    if mx > mn: plot_df[col] = (plot_df[col] - mn) / (mx - mn) * 100
-            fig_comp = px.line(plot_df, x=x_axis, y=selected_cols)
-            fig_comp.update_layout(xaxis_title=x_label, template="plotly_white", hovermode="x unified")
-            st.plotly_chart(fig_comp, use_container_width=True)
-
-        st.markdown("---")
-
-            
-           # --- CURVA DI POTENZA (CONFRONTO COMPLETO: ATTUALE vs MEDIA vs BEST) ---
-        if 'power' in df.columns:
-            st.markdown("---")
-            st.subheader("⚡ Curva di Potenza ")
-            
-            # 1. Definiamo gli intervalli critici
-            targets_sec = [
-                1, 5, 10, 30,           # Scatti
-                60, 120, 180, 300,      # 1-5 min
-                600, 1200, 1800, 3600,  # 10-60 min
-                5400, 7200              # Endurance
-            ]
-            
-            def format_duration(s):
-                if s < 60: return f"{s}s"
-                if s < 3600: return f"{int(s/60)}m"
-                h = int(s/3600)
-                m = int((s%3600)/60)
-                return f"{h}h {m}m" if m > 0 else f"{h}h"
-            
-            # --- A. CALCOLO CURVA ATTIVITÀ CORRENTE (ROSSA) ---
-            current_pdc = []
-            valid_durations = []
-            pwr_series = df['power'].fillna(0)
-            
-            for d in targets_sec:
-                if d <= len(df):
-                    val = pwr_series.rolling(window=d).mean().max()
-                    if pd.notna(val) and val > 0:
-                        current_pdc.append(val)
-                        valid_durations.append(d)
-            
-            # --- B. CALCOLO DATI STORICI (MEDIA e BEST) ---
-            avg_pdc = []
-            best_recent_pdc = []
-            
-            try:
-                # Verifichiamo che la lista di tutti i file esista
-                if 'all_files' in locals() and all_files:
-                    
-                    # Prendiamo i primi 5 file (i più recenti in assoluto)
-                    recent_files_names = all_files[:5]
-                    
-                    if recent_files_names:
-                        history_values = {d: [] for d in valid_durations}
-                        
-                        # Spinner informativo
-                        with st.spinner(f"Analisi storico (Media e Best) su {len(recent_files_names)} file..."):
-                            for fname in recent_files_names:
-                                try:
-                                    fid = files_dict.get(fname)
-                                    if not fid: continue
-
-                                    df_hist = load_single_fit_from_drive(fid)
-                                    
-                                    if not df_hist.empty and 'power' in df_hist.columns:
-                                        p_hist = df_hist['power'].fillna(0)
-                                        
-                                        for d in valid_durations:
-                                            if d <= len(df_hist):
-                                                v = p_hist.rolling(window=d).mean().max()
-                                                if pd.notna(v) and v > 0:
-                                                    history_values[d].append(v)
-                                except Exception:
-                                    continue 
-                        
-                        # Calcolo Media e Best per ogni durata
-                        for d in valid_durations:
-                            vals = history_values[d]
-                            if vals:
-                                avg_pdc.append(sum(vals) / len(vals)) # MEDIA
-                                best_recent_pdc.append(max(vals))     # BEST
-                            else:
-                                avg_pdc.append(None)
-                                best_recent_pdc.append(None)
-
-            except Exception as e:
-                st.warning(f"Impossibile calcolare storico: {e}")
-                avg_pdc = [None] * len(valid_durations)
-                best_recent_pdc = [None] * len(valid_durations)
-
-            # --- C. CREAZIONE GRAFICO ---
-            if valid_durations:
-                x_labels = [format_duration(d) for d in valid_durations]
-                
-                fig_pdc = go.Figure()
-                
-                # 1. Linea MEDIA (Grigio Chiaro, Tratteggiata)
-                if any(v is not None for v in avg_pdc):
-                    fig_pdc.add_trace(go.Scatter(
-                        x=valid_durations,
-                        y=avg_pdc,
-                        mode='lines',
-                        name='Media (Ultime 5)',
-                        line=dict(color='rgba(150, 150, 150, 0.6)', width=2, dash='dash'),
-                        hovertemplate="Media: %{y:.0f} W<extra></extra>"
-                    ))
-
-                # 2. Linea BEST (Verde, Tratteggiata)
-                if any(v is not None for v in best_recent_pdc):
-                    fig_pdc.add_trace(go.Scatter(
-                        x=valid_durations,
-                        y=best_recent_pdc,
-                        mode='lines',
-                        name='Record (Ultime 5)',
-                        line=dict(color='rgba(46, 204, 64, 0.8)', width=2, dash='dash'), # Verde
-                        hovertemplate="Record: %{y:.0f} W<extra></extra>"
-                    ))
-
-                # 3. Linea ATTUALE (Rossa, Solida) - SOPRA LE ALTRE
-                fig_pdc.add_trace(go.Scatter(
-                    x=valid_durations,
-                    y=current_pdc,
-                    mode='lines+markers',
-                    name='Attività Selezionata',
-                    line=dict(color='#FF4136', width=3),
-                    marker=dict(size=6),
-                    text=x_labels,
-                    hovertemplate="<b>%{text}</b><br>Max: %{y:.0f} W<extra></extra>"
-                ))
-                
-                fig_pdc.update_layout(
-                    xaxis_title="Durata (Scala Logaritmica)",
-                    yaxis_title="Potenza Media (Watt)",
-                    template="plotly_white",
-                    height=500,
-                    xaxis=dict(
-                        type="log", 
-                        tickvals=valid_durations,
-                        ticktext=x_labels
-                    ),
-                    hovermode="x unified",
-                    legend=dict(orientation="h", y=1.02, x=1, xanchor="right")
-                )
-                
-                st.plotly_chart(fig_pdc, use_container_width=True)
-
-
-                
-
-                
-        # --- ALTIMETRIA ---
-        if 'altitude_m' in df.columns:
-            alt_max = float(df['altitude_m'].max()) if not pd.isna(df['altitude_m'].max()) else 0.0
-            alt_avg = float(df['altitude_m'].mean()) if not pd.isna(df['altitude_m'].mean()) else 0.0
-            alt_min = float(df['altitude_m'].min()) if not pd.isna(df['altitude_m'].min()) else 0.0
-
-            # Dislivello netto (per pendenza media) e distanza
-            total_dist_m = float(df['distance'].max()) if 'distance' in df.columns and df['distance'].max() > 0 else 0.0
-            gain_net = alt_max - alt_min
-            gain_positive = elevation_gain_m(df['altitude_m'])
-
-           # --- NUOVO CALCOLO PENDENZA INDOOR (SEMPLIFICATO) ---
-        if 'altitude_m' in df.columns and 'distance' in df.columns:
-            # 1. Calcolo differenze
-            d_alt = df['altitude_m'].diff()
-            d_dist = df['distance'].diff()
-            
-            # 2. Calcolo Pendenza
-            df['grade_pct'] = (d_alt / d_dist) * 100
-            
-            # 3. Pulizia (NaN e Inf -> 0)
-            df['grade_pct'] = df['grade_pct'].replace([float('inf'), -float('inf')], 0.0)
-            df['grade_pct'] = df['grade_pct'].fillna(0.0)
-            
-            # 4. Se fermo (distanza <=0), pendenza 0
-            df.loc[d_dist <= 0, 'grade_pct'] = 0.0
-            
-            # 5. Clip grafico
-            df['grade_pct'] = df['grade_pct'].clip(-30, 30)
-        else:
-            df['grade_pct'] = 0.0
-
-        # --- GRAFICO ALTIMETRIA (FIX: RIEMPIMENTO SEMPRE VERSO IL BASSO) ---
-        if 'altitude_m' in df.columns:
-            dislivello = elevation_gain_m(df['altitude_m'])
-            st.markdown(f"### Profilo Altimetrico - Dislivello Positivo: {int(dislivello)} m")
-            fig_alt = go.Figure()
-            
-            # 1. Preparazione Asse Y 
-            if 'distance' in df.columns:
-                x_vals = df["distance"] / 1000
-                x_label = "Distanza (km)"
-            else:
-                x_vals = df["timestamp"]
-                x_label = "Tempo"
-
-            # 2. TRUCCO PER IL RIEMPIMENTO
-            # Calcoliamo il punto più basso e scendiamo ancora un po'
-            min_y = df["altitude_m"].min()
-            margin = (df["altitude_m"].max() - min_y) * 0.1 # 10% di margine
-            floor_value = min_y - margin 
-
-            # Aggiungiamo una linea invisibile sul fondo
-            fig_alt.add_trace(go.Scatter(
-                x=x_vals,
-                y=[floor_value] * len(df),
-                mode='lines',
-                line=dict(width=0), # Invisibile
-                showlegend=False,
-                hoverinfo='skip'
-            ))
-
-            # 3. Traccia Principale
-            # Usiamo 'tonexty' che significa "riempi fino alla traccia precedente" (quella invisibile sul fondo)
-            fig_alt.add_trace(go.Scatter(
-                x=x_vals, 
-                y=df["altitude_m"],
-                mode='lines',
-                name='Altitudine',
-                fill='tonexty', # <--- ORA RIEMPIE GIÙ FINO AL FONDO (non fino a 0)
-                fillcolor='rgba(255, 140, 0, 0.4)', 
-                line=dict(color='#FF8C00', width=2),
-                customdata=df['grade_pct'],
-                hovertemplate="<b>%{x:.2f}</b><br>Alt: %{y:.0f} m<br>Pend: %{customdata:.1f}%<extra></extra>"
-            ))
-
-            fig_alt.update_layout(
-                xaxis_title=x_label,
-                yaxis_title="Altitudine (m)",
-                template="plotly_white",
-                height=400,
-                hovermode="x unified",
-                # Impostiamo il range Y per non vedere troppo spazio vuoto sotto
-                yaxis=dict(range=[floor_value, df["altitude_m"].max() + margin])
-            )
-            
-            st.plotly_chart(fig_alt, use_container_width=True)
-
-            # --- DISACCOPPIAMENTO AEROBICO (Pw:HR) ---
-        if 'power' in df.columns and 'heart_rate' in df.columns:
-            st.markdown("---")
-            st.subheader("❤️ Disaccoppiamento Aerobico (Pw:HR)")
-            
-            # 1. PREPARAZIONE DATI
-            # Filtriamo i momenti in cui non pedalavi (potenza < 10W) o il cuore era a riposo (< 60bpm)
-            # per evitare di falsare il calcolo con le discese o le pause caffè.
-            df_active = df[(df['power'] > 10) & (df['heart_rate'] > 60)].copy()
-            
-            if len(df_active) > 600: # Calcoliamo solo se c'è almeno 10 minuti di attività "attiva"
-                
-                # 2. DIVISIONE IN DUE METÀ
-                midpoint = len(df_active) // 2
-                first_half = df_active.iloc[:midpoint]
-                second_half = df_active.iloc[midpoint:]
-                
-                # 3. CALCOLO EFFICIENZA (EF = Power / HR)
-                # Prima Metà
-                p1 = first_half['power'].mean()
-                hr1 = first_half['heart_rate'].mean()
-                ef1 = p1 / hr1 if hr1 > 0 else 0
-                
-                # Seconda Metà
-                p2 = second_half['power'].mean()
-                hr2 = second_half['heart_rate'].mean()
-                ef2 = p2 / hr2 if hr2 > 0 else 0
-                
-                # 4. CALCOLO DISACCOPPIAMENTO (DRIFT)
-                # Formula: (EF1 - EF2) / EF1
-                if ef1 > 0:
-                    decoupling = ((ef1 - ef2) / ef1) * 100
-                else:
-                    decoupling = 0
-                
-                # 5. VISUALIZZAZIONE KPI
-                c_pw1, c_pw2, c_pw3 = st.columns(3)
-                
-                # Colore dinamico in base al risultato
-                if decoupling < 3.5:
-                    status_color = "green"
-                    status_msg = "Ottimo (Base Solida)"
-                elif decoupling < 5.0:
-                    status_color = "orange" # Usiamo orange che è standard per warning leggero
-                    status_msg = "Buono (Accettabile)"
-                else:
-                    status_color = "red" # Rosso standard
-                    status_msg = "Alto (Deriva Cardiaca)"
-                
-                c_pw1.metric("Pw:HR (Decoupling)", f"{decoupling:.1f}%", delta=status_msg, delta_color="inverse")
-                c_pw2.metric("Efficienza 1ª Metà", f"{ef1:.2f}", f"{int(p1)}w @ {int(hr1)}bpm")
-                c_pw3.metric("Efficienza 2ª Metà", f"{ef2:.2f}", f"{int(p2)}w @ {int(hr2)}bpm")
-                
-                # 6. SPIEGAZIONE GRAFICA
-                st.caption(f"""
-                **Analisi:** Nella prima metà hai tenuto **{int(p1)}W** a **{int(hr1)}bpm**. 
-                Nella seconda metà hai tenuto **{int(p2)}W** a **{int(hr2)}bpm**.
-                La tua efficienza è cambiata del **{decoupling:.1f}%**.
-                *(Obiettivo per gare di durata: < 5%)*
-                """)
-                
-                # 7. GRAFICO SCATTER (POTENZA vs CUORE)
-                # Mostriamo come si "apre" la forbice tra potenza e cuore nel tempo
-                
-                # Creiamo un dataset ridotto per il grafico (1 punto ogni 30 secondi per pulizia)
-                if len(df_active) > 30:
-                    df_chart = df_active.iloc[::30].copy()
-                    
-                    # Normalizziamo per visualizzarli insieme (0-100%)
-                    df_chart['Power %'] = (df_chart['power'] / df_chart['power'].max()) * 100
-                    df_chart['HR %'] = (df_chart['heart_rate'] / df_chart['heart_rate'].max()) * 100
-                    
-                    # Usiamo l'indice (o timestamp) per l'asse X
-                    # Se c'è distance o timestamp usiamo quello, altrimenti indice progressivo
-                    if 'timestamp' in df_chart.columns:
-                        x_ax = df_chart['timestamp']
-                    else:
-                        x_ax = df_chart.index
-
-                    fig_dec = go.Figure()
-                    
-                    # Linea Potenza (Trend)
-                    fig_dec.add_trace(go.Scatter(
-                        x=x_ax, y=df_chart['power'],
-                        mode='lines', name='Potenza (W)',
-                        line=dict(color='#1f77b4', width=1.5),
-                        opacity=0.5
-                    ))
-                    
-                    # Linea Cuore (Trend) - Su asse secondario
-                    fig_dec.add_trace(go.Scatter(
-                        x=x_ax, y=df_chart['heart_rate'],
-                        mode='lines', name='Freq. Cardiaca (bpm)',
-                        line=dict(color='#d62728', width=1.5),
-                        yaxis='y2',
-                        opacity=0.8
-                    ))
-                    
-                    fig_dec.update_layout(
-                        title="Andamento Potenza vs Cuore (Cerca la divergenza)",
-                        xaxis_title="Tempo",
-                        yaxis=dict(title="Potenza (Watt)", side="left"),
-                        yaxis2=dict(title="Cuore (bpm)", side="right", overlaying="y", showgrid=False),
-                        template="plotly_white",
-                        hovermode="x unified",
-                        height=400,
-                        legend=dict(orientation="h", y=1.1, x=0.5, xanchor="center")
-                    )
-                    
-                    st.plotly_chart(fig_dec, use_container_width=True)
-
-            else:
-                st.info("Dati insufficienti per calcolare il disaccoppiamento (serve attività continua > 10 min con Potenza e Cardio).")
-
-
-
-        # --- POTENZA E ZONE ---
-        if 'power' in df.columns:
-            p_max, p_avg = df['power'].max(), df['power'].mean()
-            col_p1, col_p2 = st.columns([2, 1])
-            with col_p1:
-                st.subheader(f"⚡ Potenza (Max: {int(p_max)}W | Avg: {int(p_avg)}W)")
-                df['p_smooth'] = df['power'].rolling(10).mean()
-                fig_pwr = px.area(df, x=x_axis, y='p_smooth', color_discrete_sequence=['#FFA500'])
-                fig_pwr.update_traces(fillcolor='rgba(255, 165, 0, 0.3)', line=dict(width=1))
-                fig_pwr.update_layout(xaxis_title=x_label, yaxis_title="Watt", template="plotly_white")
-                st.plotly_chart(fig_pwr, use_container_width=True)
-            with col_p2:
-                st.subheader(f"📊 Zone (FTP: {user_ftp}W)")
-                bins = [-1, user_ftp*0.55, user_ftp*0.75, user_ftp*0.90, user_ftp*1.05, 10000]
-                labels = ['Z1 Recupero', 'Z2 Resistenza', 'Z3 Tempo', 'Z4 Soglia', 'Z5+ VO2Max']
-                colors_zones = ['#A0A0A0', '#00BFFF', '#32CD32', '#FFD700', '#FF4500']
-                df['zone'] = pd.cut(df['power'], bins=bins, labels=labels)
-                z_counts = df['zone'].value_counts(sort=False).reset_index()
-                z_counts.columns = ['Zona', 'Sec']
-                z_counts['Minuti'] = round(z_counts['Sec'] / 60, 1)
-                fig_zones = px.bar(z_counts, x=(z_counts['Sec']/z_counts['Sec'].sum())*100, y='Zona', text='Minuti', orientation='h', color='Zona', color_discrete_sequence=colors_zones)
-                fig_zones.update_traces(texttemplate='%{text} min', textposition='outside')
-                fig_zones.update_layout(showlegend=False, template="plotly_white", xaxis_title="% Tempo", yaxis_title="")
-                st.plotly_chart(fig_zones, use_container_width=True)
-
-        # --- VELOCITÀ & ALTRI ---
-        if 'speed_kmh' in df.columns:
-            s_max, s_avg = df['speed_kmh'].max(), df['speed_kmh'].mean()
-            if pd.isna(s_max): s_max = 0
-            if pd.isna(s_avg): s_avg = 0
-            st.subheader(f"📈 Velocità (Max: {s_max:.1f} km/h | Avg: {s_avg:.1f} km/h)")
-            fig_spd = px.line(df, x=x_axis, y='speed_kmh', color_discrete_sequence=['#00BFFF'])
-            fig_spd.update_layout(xaxis_title=x_label, template="plotly_white")
-            st.plotly_chart(fig_spd, use_container_width=True)
-
-        if 'cadence' in df.columns:
-            cad_valid = df[df['cadence'] > 0]['cadence']
-            cad_max = cad_valid.max() if not cad_valid.empty else 0
-            if pd.isna(cad_max): cad_max = 0
-            st.subheader(f"🦵 Cadenza (Max: {int(cad_max)} rpm | Avg: {int(cad_avg)} rpm)")
-            fig_cad = px.line(df, x=x_axis, y='cadence', color_discrete_sequence=['#32CD32'])
-            fig_cad.update_layout(xaxis_title=x_label, yaxis_title="rpm", template="plotly_white")
-            st.plotly_chart(fig_cad, use_container_width=True)
-
-        if 'heart_rate' in df.columns:
-            hr_max, hr_avg = df['heart_rate'].max(), df['heart_rate'].mean()
-            if pd.isna(hr_max): hr_max = 0
-            if pd.isna(hr_avg): hr_avg = 0
-            st.subheader(f"❤️ Cardio (Max: {int(hr_max)} bpm | Avg: {int(hr_avg)} bpm)")
-            fig_hr = px.line(df, x=x_axis, y='heart_rate', color_discrete_sequence=['red'])
-            fig_hr.update_layout(xaxis_title=x_label, template="plotly_white")
-            st.plotly_chart(fig_hr, use_container_width=True)
-
-            # --- RELAZIONE FC / CADENZA / POTENZA ---
-            if 'cadence' in df.columns and 'power' in df.columns:
-                rel_df = df[['heart_rate', 'cadence', 'power']].dropna().copy()
-                rel_df = rel_df[(rel_df['heart_rate'] > 0) & (rel_df['cadence'] > 0)]
-                if not rel_df.empty:
-                    hr_mean = rel_df['heart_rate'].mean()
-                    cad_mean = rel_df['cadence'].mean()
-                    p_mean = rel_df['power'].mean()
-                    st.subheader(
-                        f"❤️🦵 Frequenza Cardiaca e RPM a potenza – Avg: {hr_mean:.0f} bpm, {cad_mean:.0f} rpm, {p_mean:.0f} W"
-                    )
-
-                    fig_rel = px.scatter(
-                        rel_df,
-                        x='cadence',
-                        y='heart_rate',
-                        color='power',
-                        color_continuous_scale='Viridis',
-                        labels={
-                            'cadence': 'Cadenza (rpm)',
-                            'heart_rate': 'Frequenza cardiaca (bpm)',
-                            'power': 'Potenza (W)'
-                        },
-                        opacity=0.65
-                    )
-                    # Punto medio evidenziato in rosso e più grande
-                    fig_rel.add_scatter(
-                        x=[cad_mean],
-                        y=[hr_mean],
-                        mode="markers",
-                        marker=dict(
-                            color="red",
-                            size=16,
-                            line=dict(color="black", width=1.5)
-                        ),
-                        name="Media",
-                        showlegend=False,
-                    )
-
-                    fig_rel.update_layout(template="plotly_white")
-                    st.plotly_chart(fig_rel, use_container_width=True)
-                else:
-                    st.info("Dati insufficienti per il grafico FC/Cadenza/Potenza (valori mancanti o a zero).")
-
-        if 'position_lat' in df.columns:
-            st.subheader("🗺️ Mappa")
-            map_df = df[['position_lat', 'position_long']].dropna()
-            map_df['lat'] = map_df['position_lat'] * (180 / 2**31)
-            map_df['lon'] = map_df['position_long'] * (180 / 2**31)
-            path_list = map_df[['lon', 'lat']].values.tolist()
-            path_data = [{"path": path_list}]
-            lat_center = map_df['lat'].mean()
-            lon_center = map_df['lon'].mean()
-            view_state = pdk.ViewState(
-                latitude=lat_center,
-                longitude=lon_center,
-                zoom=12,
-                pitch=0,
-                bearing=0,
-            )
-            layer = pdk.Layer(
-                type="PathLayer",
-                data=path_data,
-                get_path="path",
-                get_color=[65, 131, 215],
-                get_width=2,
-                width_units="pixels",
-                width_min_pixels=1,
-            )
-            deck = pdk.Deck(layers=[layer], initial_view_state=view_state, tooltip=False)
-            col_m1, col_m2, col_m3 = st.columns([1, 2, 1])
-            with col_m2:
-                st.pydeck_chart(deck, height=350)
-
-# ==============================================================================
-# MODALITÀ 2: ANALISI TREND
-# ==============================================================================
-elif app_mode == "📈 Analisi Trend & Progressi":
-
-    # Configurazione Trend nel menu laterale (come Analisi Singola)
-    with st.sidebar:
-        st.subheader("Configurazione Trend")
-        trend_weight = st.number_input(
-            "Peso (kg) per analisi trend",
-            min_value=30,
-            max_value=150,
-            value=60,
-            step=1,
-            help="Peso corporeo usato per stimare le calorie totali e il rapporto W/kg nel tempo."
-        )
-
-        # FTP di default stimata sulle ultime 5 attività (stessa logica dell'analisi singola)
-        trend_ftp_default = calculate_ftp_from_last_n_activities(files_dict, 5)
-        trend_ftp = st.number_input(
-            "FTP (W) per analisi trend",
-            min_value=50,
-            max_value=600,
-            value=trend_ftp_default,
-            step=5,
-            help="Valore di FTP usato per stimare FC e cadenza medie a quella potenza in ogni sessione."
-        )
-
-    st.markdown("## 📈 I tuoi Progressi nel Tempo")
-    
-    with st.expander("📂 Seleziona le attività da analizzare", expanded=True):
-        seleziona_tutti = st.checkbox("Seleziona tutti i file", value=True)
-        if seleziona_tutti:
-            files_scelti = all_files
-        else:
-            files_scelti = st.multiselect("Scegli i file:", all_files, default=all_files[:5])
-    
-    if st.button("🚀 Genera Analisi Trend"):
-        if not files_scelti:
-            st.warning("Seleziona almeno un file.")
-        else:
-            # Crea dizionario solo per i file selezionati (sempre da Google Drive)
-            selected_files_dict = {name: files_dict[name] for name in files_scelti}
-            with st.spinner('Analisi in corso...'):
-                df_summary = get_activity_summary(selected_files_dict)
-            
-            if not df_summary.empty:
-                # Ordiniamo per data
-                df_summary = df_summary.sort_values(by="Data")
-
-                # Calcolo kcal stimate per ogni uscita (stessa formula usata nell'analisi singola)
-                if trend_weight > 0:
-                    df_summary["Kcal stimate"] = df_summary["Distanza (km)"] * trend_weight * 0.3
-                else:
-                    df_summary["Kcal stimate"] = 0
-
-                # Totali
-                kcal_tot = df_summary["Kcal stimate"].sum()
-
-                t1, t2, t3, t4, t5 = st.columns(5)
-                t1.metric("Attività", len(df_summary))
-                t2.metric("Km Totali", f"{int(df_summary['Distanza (km)'].sum())} km")
-                t3.metric("Dislivello Tot", f"{int(df_summary['Dislivello (m)'].sum())} m")
-                t4.metric("Ore Totali", f"{df_summary['Durata (min)'].sum()/60:.1f} h")
-                t5.metric("Kcal Totali", f"{kcal_tot:.0f} kcal")
-                
-                st.markdown("---")
-                
-                # 1. Distanza
-                st.subheader("📅 Volume: Distanza per Uscita")
-                fig_vol = px.bar(df_summary, x='Data', y='Distanza (km)', 
-                                 color='Dislivello (m)',
-                                 color_continuous_scale='Bluered')
-                fig_vol.update_layout(template="plotly_white")
-                st.plotly_chart(fig_vol, use_container_width=True)
-                
-                # 2. Scatter Trends
-                c_trend1, c_trend2 = st.columns(2)
-                with c_trend1:
-                    st.subheader("⚡ Trend Potenza")
-                    fig_t_pwr = px.scatter(df_summary, x='Data', y='Potenza Avg (W)',
-                                           size='Distanza (km)', color='Potenza Avg (W)',
-                                           color_continuous_scale='Oranges')
-                    fig_t_pwr.update_layout(template="plotly_white")
-                    st.plotly_chart(fig_t_pwr, use_container_width=True)
-                    
-                with c_trend2:
-                    st.subheader("📈 Trend Velocità")
-                    fig_t_spd = px.scatter(df_summary, x='Data', y='Velocità Avg (km/h)',
-                                           color='Velocità Avg (km/h)',
-                                           color_continuous_scale='Tealgrn')
-                    fig_t_spd.update_layout(template="plotly_white")
-                    st.plotly_chart(fig_t_spd, use_container_width=True)
-
-                # 3. Tabella
-                with st.expander("Tabella Dati"):
-                    st.dataframe(df_summary)
-                    
-                # 4. FTP stimata (proxy) e rapporto peso/potenza nel tempo
-                if 'Potenza Avg (W)' in df_summary.columns and trend_weight > 0:
-                    st.subheader("💪 FTP stimata (proxy) e W/kg nel tempo")
-
-                    # Usiamo la potenza media come proxy di FTP per valutare il trend
-                    trend_df = df_summary[["Data", "Potenza Avg (W)"]].copy()
-                    trend_df["W/kg"] = trend_df["Potenza Avg (W)"] / trend_weight
-
-                    # Tabella di sintesi del miglioramento
-                    st.dataframe(
-                        trend_df.rename(columns={
-                            "Potenza Avg (W)": "Potenza media (W)",
-                            "W/kg": "W/kg (media)"
-                        }),
-                        use_container_width=True
-                    )
-
-                    # Delta tra prima e ultima uscita come indicatore di miglioramento
-                    first = trend_df.iloc[0]
-                    last = trend_df.iloc[-1]
-                    delta_ftp = last["Potenza Avg (W)"] - first["Potenza Avg (W)"]
-                    delta_wkg = last["W/kg"] - first["W/kg"]
-
-                    c1, c2 = st.columns(2)
-                    c1.metric(
-                        "Δ Potenza media (proxy FTP)",
-                        f"{delta_ftp:+.0f} W",
-                        help="Differenza tra la potenza media dell'ultima uscita e la prima nelle attività selezionate."
-                    )
-                    c2.metric(
-                        "Δ W/kg",
-                        f"{delta_wkg:+.2f} W/kg",
-                        help="Differenza del rapporto peso/potenza medio (W/kg) tra prima e ultima uscita."
-                    )
-
-                # 5. Medie a FTP per ogni sessione (un punto per uscita, potenza fissata a trend_ftp)
-                st.markdown("---")
-                st.subheader("🔍 FC e Cadenza medie a FTP per ogni sessione")
-
-                rows_ftp = []
-                # Per ogni attività selezionata, ricalcoliamo FC e cadenza medie in prossimità di trend_ftp
-                for _, row in df_summary.iterrows():
-                    fname = row["Filename"]
-                    file_id = selected_files_dict.get(fname)
-                    if not file_id:
-                        continue
-                    df_act = load_single_fit_from_drive(file_id)
-                    if df_act is None or df_act.empty:
-                        continue
-                    if not all(col in df_act.columns for col in ["power", "heart_rate", "cadence"]):
-                        continue
-
-                    # Finestra di tolleranza intorno a FTP (±5%)
-                    low = trend_ftp * 0.95
-                    high = trend_ftp * 1.05
-                    m = (df_act["power"] >= low) & (df_act["power"] <= high)
-                    sub = df_act[m]
-                    sub = sub[(sub["heart_rate"] > 0) & (sub["cadence"] > 0)]
-                    if sub.empty:
-                        continue
-
-                    rows_ftp.append({
-                        "Data": row["Data"],
-                        "FC a FTP (bpm)": sub["heart_rate"].mean(),
-                        "Cadenza a FTP (rpm)": sub["cadence"].mean(),
-                    })
-
-                if rows_ftp:
-                    ftp_trend_df = pd.DataFrame(rows_ftp).sort_values(by="Data")
-
-                    # Grafico a punti: un punto per uscita, FC vs Cadenza (potenza fissata a FTP)
-                    fig_ftp_rel = px.scatter(
-                        ftp_trend_df,
-                        x="Cadenza a FTP (rpm)",
-                        y="FC a FTP (bpm)",
-                        hover_data=["Data"],
-                        color_discrete_sequence=["red"],
-                        labels={
-                            "Cadenza a FTP (rpm)": "Cadenza media a FTP (rpm)",
-                            "FC a FTP (bpm)": "FC media a FTP (bpm)",
-                        },
-                        opacity=0.9,
-                    )
-                    fig_ftp_rel.update_layout(template="plotly_white")
-                    st.plotly_chart(fig_ftp_rel, use_container_width=True)
-            else:
-                st.warning("Nessun dato valido trovato nei file selezionati (mancano campi come timestamp/distance/power, oppure i file sono vuoti).")
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import io
+import os
+import datetime
+
+from engine import dedup, profiling, singleflight
+from engine.archive import open_archive
+from engine.drive import build_service, download_file, list_fit_metadata
+from engine.charts import (
+    altitude_figure,
+    gap_figure,
+    hr_cadence_density_figure,
+    hr_cadence_power_figure,
+    mark_efforts,
+    overlay_figure,
+    power_curve_figure,
+    zone_bar_figure,
+)
+from engine.cleaning import configure as configure_cleaning
+from engine.compare import COMPARE_CHANNELS, align_activity, comparison_table, gap_curve
+from engine.curves import curve_entry, load_power_curves, save_power_curves, stored_curve
+from engine.density import (
+    density_grid,
+    density_table,
+    grid_entry,
+    load_density_grids,
+    merge_grids,
+    power_range,
+    save_density_grids,
+    stored_grid,
+    table_means,
+)
+from engine.efficiency import EF_WINDOW_S, ef_series, efficiency_metrics
+from engine.derive import derive_fit
+from engine.fit import load_single_fit
+from engine.intervals import (
+    INTERVAL_CHANNELS,
+    INTERVAL_THRESHOLD,
+    analyse,
+    interval_summary,
+    intervals_entry,
+    is_current as intervals_is_current,
+    load_intervals,
+    save_intervals,
+    stored_for,
+)
+from engine.batch import activity_result
+from engine.report import activity_report
+from engine.snapshot import export_snapshot, import_snapshot, restore_snapshot
+from engine.segments import KIND_CLIMB, KIND_MANUAL, discover_climbs, load_segments, save_segments, segment_from_track, simplify_track
+from engine.summaries import load_summaries, save_summaries, stored_summary, summary_entry
+from engine.ranges import index_range, prefix_sums, range_stats
+from engine.zones import (
+    HR_ZONE_FRACTIONS,
+    HR_ZONES,
+    POWER_ZONE_FRACTIONS,
+    POWER_ZONES,
+    ZONE_COLORS,
+    activity_histograms,
+    histograms_entry,
+    load_zone_histograms,
+    save_zone_histograms,
+    stored_histograms,
+    zone_distribution,
+    zone_edges,
+    zone_table,
+)
+from engine.trends import FREQS, auto_freq, load_rollups, period_start, save_rollups
+from engine.metrics import (
+    TARGETS_SEC,
+    active_samples,
+    calculate_ftp_from_activities,
+    elevation_gain_m,
+    format_duration,
+    grade_pct,
+    power_curve,
+)
+
+# Configurazione della pagina
+st.set_page_config(page_title="Coach Dashboard Pro", layout="wide")
+
+# Profilazione del rerun: raccoglie i tempi per fase, il pannello admin è opzionale
+prof = profiling.start_run(label=datetime.datetime.now().isoformat(timespec="seconds"))
+
+# --- LOGIN SEMPLICE ---
+def require_login():
+    if "authenticated" not in st.session_state:
+        st.session_state.authenticated = False
+    if "login_error" not in st.session_state:
+        st.session_state.login_error = ""
+
+    if not st.session_state.authenticated:
+        # Funzione riutilizzabile per login via Enter o bottone
+        def do_login():
+            user_val = st.session_state.get("login_user", "")
+            pwd_val = st.session_state.get("login_pwd", "")
+            auth = st.secrets.get("auth", {})
+            expected_user = auth.get("username", "")
+            expected_password = auth.get("password", "")
+            if user_val == expected_user and pwd_val == expected_password:
+                st.session_state.authenticated = True
+                st.session_state.login_error = ""
+            else:
+                st.session_state.login_error = "Credenziali non valide."
+
+        # Centriamo il form di login
+        col_left, col_center, col_right = st.columns([1, 2, 1])
+        with col_center:
+            st.markdown("### 🔐 Login")
+            user = st.text_input("Utente", key="login_user")
+            pwd = st.text_input(
+                "Password",
+                type="password",
+                key="login_pwd",
+                on_change=do_login  # Invio da tastiera sulla password prova il login
+            )
+            if st.button("Accedi"):
+                do_login()
+
+            if st.session_state.login_error:
+                st.error(st.session_state.login_error)
+            elif st.session_state.authenticated:
+                st.success("Accesso riuscito. Benvenuto!")
+        st.stop()
+
+require_login()
+
+# Titolo mostrato solo dopo login
+st.title("🚴‍♂️ Dashboard Performance & Progressi")
+
+# --- CONFIGURAZIONE ---
+# Folder ID può essere configurato nei secrets o hardcoded qui
+if 'config' in st.secrets and 'google_drive_folder_id' in st.secrets['config']:
+    GOOGLE_DRIVE_FOLDER_ID = st.secrets['config']['google_drive_folder_id']
+else:
+    GOOGLE_DRIVE_FOLDER_ID = "1b-nerBbVjtzxDJnVIeMuVRfg4vlRmrji"
+
+# Soglie della pulizia dati: sezione [config.pulizia] dei secrets (chiavi di CLEANING_RULES)
+if 'config' in st.secrets and 'pulizia' in st.secrets['config']:
+    try:
+        configure_cleaning(st.secrets['config']['pulizia'])
+    except ValueError as e:
+        st.error(f"Configurazione pulizia dati ignorata: {e}")
+
+# --- FUNZIONI GOOGLE DRIVE ---
+@st.cache_resource
+def get_drive_service():
+    """Autentica e restituisce il servizio Google Drive usando Service Account da Streamlit secrets o file locale."""
+    try:
+        # Prova prima a caricare dai secrets di Streamlit (produzione/cloud)
+        if 'google_credentials' in st.secrets:
+            return build_service(creds_info=st.secrets['google_credentials'])
+        # Fallback: prova a caricare da file locale (sviluppo)
+        elif os.path.exists('credentials.json'):
+            return build_service(creds_file='credentials.json')
+        else:
+            st.error("Credenziali Google non trovate.")
+            st.info("""
+            Configura le credenziali in uno di questi modi:
+            
+            **Per Streamlit Cloud:**
+            1. Vai su https://share.streamlit.io
+            2. Seleziona la tua app
+            3. Vai su Settings > Secrets
+            4. Aggiungi la sezione 'google_credentials' con il contenuto del tuo credentials.json
+            
+            **Per sviluppo locale:**
+            - Metti il file credentials.json nella directory del progetto
+            """)
+            st.stop()
+    except Exception as e:
+        st.error(f"Errore durante l'autenticazione con Service Account: {e}")
+        st.info("Verifica che le credenziali siano corrette e che il Service Account abbia i permessi necessari su Google Drive")
+        st.stop()
+
+@st.cache_data(ttl=300)  # Cache per 5 minuti
+def _list_drive_files(folder_id):
+    """Ottiene i metadati dei file .fit dalla cartella Google Drive ({file_id: nome, md5, size})."""
+    profiling.mark_cache_miss()
+    try:
+        return list_fit_metadata(get_drive_service(), folder_id)
+    except Exception as e:
+        st.error(f"Errore nel recupero file da Google Drive: {e}")
+        return {}
+
+def list_drive_files(folder_id):
+    """Lista di tuple (nome_file, file_id) dei file .fit (in cache per 5 minuti), con misura del tempo e hit/miss della cache."""
+    with profiling.stage('list_drive_files', 'download', cached=True):
+        return [(meta['name'], file_id) for file_id, meta in _list_drive_files(folder_id).items()]
+
+def drive_file_hashes(folder_id):
+    """md5 del contenuto per nome file, dai metadati Drive già in cache (nessun download)."""
+    return {meta['name']: meta['md5'] for meta in _list_drive_files(folder_id).values()}
+
+def download_file_from_drive(file_id):
+    """
+    Scarica un file da Google Drive e restituisce i dati binari.
+    Download concorrenti dello stesso file (più sessioni) ne eseguono uno solo.
+    """
+    try:
+        with profiling.stage('download_file_from_drive', 'download', file_id=file_id) as rec:
+            data, shared = singleflight.do(
+                ('download', file_id), lambda: download_file(get_drive_service(), file_id).getvalue()
+            )
+            rec['bytes'] = len(data)
+            rec['coalesced'] = shared
+        # Ogni chiamante ha il proprio BytesIO sugli stessi byte
+        return io.BytesIO(data)
+    except Exception as e:
+        st.error(f"Errore nel download del file: {e}")
+        return None
+
+@st.cache_resource
+def restore_startup_snapshot():
+    """
+    Ripristina una volta per processo lo snapshot dell'archivio locale configurato (file locale da
+    FITSTORAGE_SNAPSHOT o config.snapshot_path, file Drive da config.snapshot_file_id), solo negli
+    archivi ancora vuoti. Resoconto di restore_snapshot, None se non configurato o illeggibile.
+    """
+    config = st.secrets['config'] if 'config' in st.secrets else {}
+    path = os.environ.get('FITSTORAGE_SNAPSHOT') or config.get('snapshot_path')
+    file_id = config.get('snapshot_file_id')
+    with profiling.stage('ripristino snapshot', 'download'):
+        try:
+            if path and os.path.exists(path):
+                with open(path, 'rb') as fh:
+                    return restore_snapshot(fh)
+            if file_id:
+                file_data = download_file_from_drive(file_id)
+                return import_snapshot(file_data.getvalue()) if file_data else None
+        except ValueError as e:
+            st.warning(f"Snapshot ignorato, i dati derivati si ricalcolano dai file: {e}")
+    return None
+
+# --- FUNZIONI DI CARICAMENTO E CALCOLO ---
+
+def calculate_ftp_from_last_n_activities(all_files_dict, n):
+    """
+    Calcola l'FTP stimato analizzando le ultime N attività disponibili,
+    concatenando i dati di potenza e riutilizzando la logica di calculate_ftp_estimate.
+    all_files_dict: dict con chiave=nome_file, valore=file_id
+    """
+    if not all_files_dict:
+        return 250
+
+    with profiling.stage('calculate_ftp_from_last_n_activities', 'compute', n=n):
+        # Prendiamo le ultime N attività in ordine alfabetico (tipicamente i file hanno data nel nome)
+        sorted_files = sorted(all_files_dict.items())[-n:]
+
+        return calculate_ftp_from_activities(load_single_fit_from_drive(file_id) for fname, file_id in sorted_files)
+
+@st.cache_data
+def _load_single_fit_from_drive(file_id):
+    """Scarica e carica un file FIT da Google Drive (una sola volta per richieste concorrenti)."""
+    profiling.mark_cache_miss()
+
+    def parse():
+        file_data = download_file_from_drive(file_id)
+        if file_data:
+            return load_single_fit(file_data)
+        return pd.DataFrame()
+
+    df, shared = singleflight.do(('fit', file_id), parse)
+    # Chi ha atteso riceve lo stesso DataFrame: copia, perché la vista aggiunge colonne
+    return df.copy() if shared else df
+
+def load_single_fit_from_drive(file_id):
+    """Attività da Google Drive (in cache), con misura del tempo e hit/miss della cache."""
+    with profiling.stage('load_single_fit_from_drive', 'parse', cached=True, file_id=file_id):
+        return _load_single_fit_from_drive(file_id)
+
+def derive_file(filename, file_id, products):
+    """
+    Prodotti derivati di un file (riga trend e impronta, canali dell'archivio stagionale...)
+    da un solo download e una sola scansione. {} se il download non riesce.
+    """
+    file_data = download_file_from_drive(file_id)
+    if not file_data:
+        return {}
+    with profiling.stage('fitscan', 'parse', file_id=file_id, prodotti=",".join(products)):
+        return derive_fit(filename, file_data, products)
+
+@st.cache_data
+def _get_activity_summary(files_dict, hashes=None):
+    """
+    Legge velocemente tutti i file per i trend da Google Drive.
+    files_dict: dict con chiave=nome_file, valore=file_id
+    hashes: dict con chiave=nome_file, valore=md5 (copie identiche saltate senza scaricarle;
+    i file con la stessa md5 dell'indice locale riusano la riga salvata)
+    Le colonne 'Duplicato di' e 'Motivo duplicato' segnalano le uscite presenti più volte.
+    Nello stesso passaggio si completano gli altri archivi locali (curve di potenza, istogrammi
+    delle zone, griglie di densità, archivio stagionale): ogni file
+    si scarica solo se gli manca qualcosa, e una volta sola per tutti i prodotti mancanti.
+    """
+    profiling.mark_cache_miss()
+    summary_data = []
+    fingerprints = []
+    progress_bar = st.progress(0)
+    total_files = len(files_dict)
+    copies = dedup.duplicates_by_hash({name: (hashes or {}).get(name) for name in files_dict})
+    salvate = load_summaries()
+    curve = load_power_curves()
+    istogrammi = load_zone_histograms()
+    griglie = load_density_grids()
+    archivio = open_archive()
+    nuove = nuove_curve = nuovi_istogrammi = nuove_griglie = 0
+    
+    for i, (filename, file_id) in enumerate(files_dict.items()):
+        if filename in copies:
+            progress_bar.progress((i + 1) / total_files)
+            continue
+        try:
+            md5 = (hashes or {}).get(filename)
+            stored = stored_summary(salvate, filename, md5)
+            mancanti = [name for name, ok in (
+                ('riga', stored is not None),
+                ('curva', stored_curve(curve, filename, md5) is not None),
+                ('zone', stored_histograms(istogrammi, filename, md5) is not None),
+                ('densita', stored_grid(griglie, filename, md5) is not None),
+                ('archivio', archivio.has(filename, md5)),
+            ) if not ok]
+            prodotti = {}
+            if mancanti:
+                prodotti = singleflight.do(('derive', file_id, tuple(mancanti)),
+                                           lambda: derive_file(filename, file_id, mancanti))[0]
+            if 'curva' in prodotti and md5:
+                curve[filename] = curve_entry(*prodotti['curva'], md5)
+                nuove_curve += 1
+            if 'zone' in prodotti and md5:
+                istogrammi[filename] = histograms_entry(prodotti['zone'], md5)
+                nuovi_istogrammi += 1
+            if 'densita' in prodotti and md5:
+                griglie[filename] = grid_entry(prodotti['densita'], md5)
+                nuove_griglie += 1
+            if 'archivio' in prodotti:
+                archivio.append(filename, prodotti['archivio'], md5)
+            if stored is not None:
+                row, fp = stored
+            else:
+                row, fp = prodotti.get('riga') or (None, None)
+                if row is not None and md5:
+                    salvate[filename] = summary_entry(row, fp, md5)
+                    nuove += 1
+            if row is not None:
+                summary_data.append(dict(row))
+                fingerprints.append(fp)
+        except Exception as e:
+            st.error(f"Errore durante la lettura del file '{filename}': {e}")
+        progress_bar.progress((i + 1) / total_files)
+    progress_bar.empty()
+    if nuove:
+        save_summaries(salvate)
+    if nuove_curve:
+        save_power_curves(curve)
+    if nuovi_istogrammi:
+        save_zone_histograms(istogrammi)
+    if nuove_griglie:
+        save_density_grids(griglie)
+
+    # Duplicati: le copie identiche riprendono la riga del file tenuto, le riesportazioni restano ma segnalate
+    duplicates = dedup.find_duplicates(fingerprints)
+    rows_by_name = {row['Filename']: row for row in summary_data}
+    for name, kept in copies.items():
+        if kept in rows_by_name:
+            summary_data.append(dict(rows_by_name[kept], Filename=name))
+            duplicates[name] = (kept, dedup.REASON_CONTENT)
+    for row in summary_data:
+        kept, reason = duplicates.get(row['Filename'], ("", ""))
+        row['Duplicato di'] = kept
+        row['Motivo duplicato'] = reason
+    return pd.DataFrame(summary_data).sort_values(by='Data')
+
+def get_activity_summary(files_dict, hashes=None):
+    """Tabella riassuntiva per i trend (in cache), con misura del tempo e hit/miss della cache."""
+    with profiling.stage('get_activity_summary', 'compute', cached=True, files=len(files_dict)):
+        return _get_activity_summary(files_dict, hashes)
+
+@st.cache_data
+def _activity_prefix_sums(file_id):
+    """Somme cumulative dell'attività per le statistiche di intervallo (calcolate una volta per file)."""
+    profiling.mark_cache_miss()
+    return prefix_sums(load_single_fit_from_drive(file_id))
+
+def activity_prefix_sums(file_id):
+    """Somme cumulative (in cache), con misura del tempo e hit/miss della cache."""
+    with profiling.stage('activity_prefix_sums', 'derive', cached=True, file_id=file_id):
+        return _activity_prefix_sums(file_id)
+
+@st.cache_data
+def _activity_track(file_id):
+    """Traccia semplificata per i segmenti (None senza GPS), calcolata una volta per file."""
+    profiling.mark_cache_miss()
+    return simplify_track(load_single_fit_from_drive(file_id))
+
+def activity_track(file_id):
+    """Traccia semplificata (in cache), con misura del tempo e hit/miss della cache."""
+    with profiling.stage('activity_track', 'derive', cached=True, file_id=file_id):
+        return _activity_track(file_id)
+
+@st.cache_data
+def _aligned_activity(file_id, axis):
+    """Canali di un'attività sulla griglia comune del confronto (in cache per file e asse)."""
+    profiling.mark_cache_miss()
+    return align_activity(load_single_fit_from_drive(file_id), axis)
+
+def aligned_activity(file_id, axis):
+    """Attività allineata (in cache), con misura del tempo e hit/miss della cache."""
+    with profiling.stage('aligned_activity', 'derive', cached=True, file_id=file_id, axis=axis):
+        return _aligned_activity(file_id, axis)
+
+@st.cache_data
+def _activity_intervals(file_id, ftp):
+    """Intervalli sopra soglia e posizione dei migliori sforzi dall'attività già caricata."""
+    profiling.mark_cache_miss()
+    return analyse(load_single_fit_from_drive(file_id), ftp)
+
+def activity_intervals(file_id, ftp):
+    """Intervalli e migliori sforzi (in cache per file e FTP), con misura del tempo."""
+    with profiling.stage('activity_intervals', 'derive', cached=True, file_id=file_id, ftp=ftp):
+        return _activity_intervals(file_id, ftp)
+
+@st.cache_data
+def _activity_zone_histograms(file_id):
+    """Istogrammi di potenza e FC pesati sulla durata dei campioni, calcolati una volta per file."""
+    profiling.mark_cache_miss()
+    return activity_histograms(load_single_fit_from_drive(file_id))
+
+def activity_zone_histograms(file_id):
+    """Istogrammi per le zone (in cache), con misura del tempo e hit/miss della cache."""
+    with profiling.stage('activity_zone_histograms', 'derive', cached=True, file_id=file_id):
+        return _activity_zone_histograms(file_id)
+
+@st.cache_data
+def _activity_density(file_id):
+    """Griglia FC x cadenza x potenza dell'attività, calcolata una volta per file."""
+    profiling.mark_cache_miss()
+    return density_grid(load_single_fit_from_drive(file_id))
+
+def activity_density(file_id):
+    """Griglia di densità (in cache), con misura del tempo e hit/miss della cache."""
+    with profiling.stage('activity_density', 'derive', cached=True, file_id=file_id):
+        return _activity_density(file_id)
+
+def zone_figure(table, name):
+    """Barre orizzontali del tempo in zona (% e minuti), stile del grafico zone di potenza."""
+    return plot_chart(name, zone_bar_figure(table))
+
+def plot_chart(name, fig, **kwargs):
+    """st.plotly_chart con misura del tempo di serializzazione e invio della figura (kwargs passati a Streamlit)."""
+    with profiling.stage(name, 'render'):
+        return st.plotly_chart(fig, use_container_width=True, **kwargs)
+
+def profiling_enabled():
+    """Pannello di profilazione attivo da secrets ([config] profiling = true) o variabile FITSTORAGE_PROFILING."""
+    if os.environ.get('FITSTORAGE_PROFILING', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return bool('config' in st.secrets and st.secrets['config'].get('profiling', False))
+
+def render_profiling_panel(prof):
+    """Pannello admin nella sidebar: dove ha speso il tempo questo rerun."""
+    records = prof.sorted_records()
+    # Log strutturati (JSON per fase) per analisi esterne
+    prof.log()
+    with st.sidebar:
+        st.markdown("---")
+        with st.expander("⏱️ Profilazione rerun", expanded=False):
+            counts = prof.cache_counts()
+            c1, c2 = st.columns(2)
+            c1.metric("Totale", f"{prof.total_ms():.0f} ms")
+            c2.metric("Cache hit/miss", f"{counts['hit']}/{counts['miss']}")
+            st.dataframe(
+                pd.DataFrame(
+                    [{'Fase': c, 'ms': round(v, 1)} for c, v in prof.by_category().items()]
+                ),
+                hide_index=True,
+                use_container_width=True,
+            )
+            if records:
+                st.dataframe(
+                    pd.DataFrame([
+                        {
+                            'Fase': ("  " * r['depth']) + r['name'],
+                            'Categoria': r['category'],
+                            'ms': round(r['ms'], 1),
+                            'ms propri': round(r['self_ms'], 1),
+                            'Cache': r['cache'] or "",
+                        }
+                        for r in records
+                    ]),
+                    hide_index=True,
+                    use_container_width=True,
+                )
+            flights = singleflight.stats()
+            if flights:
+                # Richieste concorrenti servite da un unico download/parse (tutte le sessioni del processo)
+                st.caption("Richieste coalescenti (processo)")
+                st.dataframe(
+                    pd.DataFrame([
+                        {
+                            'Tipo': f['kind'],
+                            'Esecuzioni': f['runs'],
+                            'Attese': f['waits'],
+                            'Dedup %': f['dedup_pct'],
+                            'Attesa media (ms)': f['avg_wait_ms'],
+                        }
+                        for f in flights
+                    ]),
+                    hide_index=True,
+                    use_container_width=True,
+                )
+            st.download_button(
+                "Esporta log (JSONL)",
+                data=prof.to_jsonl(),
+                file_name="profiling.jsonl",
+                mime="application/json",
+            )
+
+# --- LOGICA APPLICAZIONE ---
+
+# Container appena avviato: righe trend, aggregati e archivio stagione dallo snapshot, se configurato
+snapshot_report = restore_startup_snapshot()
+
+# Ottieni lista file da Google Drive
+drive_files = list_drive_files(GOOGLE_DRIVE_FOLDER_ID)
+
+if not drive_files:
+    st.warning("Nessun file .fit trovato nella cartella Google Drive.")
+    st.stop()
+
+# Crea dizionario nome_file -> file_id e ordina per nome (decrescente per date AAAAMMGG)
+files_dict = {name: file_id for name, file_id in drive_files}
+all_files = sorted(files_dict.keys(), reverse=True)
+
+with st.sidebar:
+    st.header("🧭 Navigazione")
+    app_mode = st.radio("Seleziona Modalità:", ["📊 Analisi Singola Attività", "🆚 Confronto Attività", "📈 Analisi Trend & Progressi"])
+
+    with st.expander("💾 Snapshot dati derivati", expanded=False):
+        if snapshot_report:
+            st.caption(
+                f"Ripristinato all'avvio (snapshot del {snapshot_report['creato']}): "
+                f"{', '.join(snapshot_report['ripristinati']) or 'nessun archivio'}"
+            )
+            for archivio, motivo in snapshot_report['scartati'].items():
+                st.caption(f"Scartato {archivio}: {motivo}")
+        st.caption(
+            "Righe trend, aggregati, curve di potenza, zone, densità, intervalli, segmenti e archivio stagione in un solo file: "
+            "caricalo su Drive (config.snapshot_file_id) per ripartire senza rileggere i FIT dopo un riavvio."
+        )
+        if st.button("Prepara snapshot"):
+            with profiling.stage('export snapshot', 'compute'):
+                st.session_state.snapshot = export_snapshot()
+        if st.session_state.get('snapshot'):
+            st.download_button(
+                f"Scarica snapshot ({len(st.session_state.snapshot) / 1e6:.1f} MB)",
+                data=st.session_state.snapshot,
+                file_name=f"fitstorage_snapshot_{datetime.date.today():%Y%m%d}.tar.gz",
+                mime="application/gzip",
+            )
+    st.markdown("---")
+
+# ==============================================================================
+# MODALITÀ 1: ANALISI SINGOLA
+# ==============================================================================
+if app_mode == "📊 Analisi Singola Attività":
+    
+    with st.sidebar:
+        st.subheader("Impostazioni Analisi")
+        file_selezionato = st.selectbox("Scegli attività:", all_files)
+        file_id = files_dict[file_selezionato]
+        # md5 dai metadati Drive: le voci salvate per la vista trend valgono per questo contenuto
+        file_md5 = drive_file_hashes(GOOGLE_DRIVE_FOLDER_ID).get(file_selezionato)
+        
+        # Carichiamo i dati della singola attività
+        df = load_single_fit_from_drive(file_id)
+        
+        st.markdown("---")
+        st.write("🔧 **Configurazione Atleta**")
+        
+        # Peso atleta (usato per stima calorie)
+        user_weight = st.number_input(
+            "Peso (kg)",
+            min_value=30,
+            max_value=150,
+            value=60,
+            step=1,
+            help="Peso corporeo utilizzato per stimare il consumo calorico."
+        )
+        
+        # Calcolo stima dinamica FTP sulle ultime 5 attività (non solo su questa)
+        ftp_stimato = calculate_ftp_from_last_n_activities(files_dict, 5)
+        
+        # Input FTP con valore di default stimato (ultime 5 attività)
+        user_ftp = st.number_input(
+            "Il tuo FTP (Watt):",
+            min_value=50,
+            max_value=600,
+            value=ftp_stimato,
+            step=5,
+            help=f"FTP stimato sulle ultime 5 attività: {ftp_stimato}W (≈95% della miglior potenza media di 20 minuti complessiva). Puoi modificarlo se conosci il tuo valore reale."
+        )
+
+        user_max_hr = st.number_input(
+            "FC massima (bpm):",
+            min_value=120,
+            max_value=230,
+            value=190,
+            step=1,
+            help="Frequenza cardiaca massima usata per le zone cardio (Z1 < 60%, Z2 60-70%, Z3 70-80%, Z4 80-90%, Z5 > 90%)."
+        )
+
+        # Rapporto peso/potenza legato all'FTP (mostrato in configurazione atleta)
+        wkg_ftp_sidebar = user_ftp / user_weight if user_weight > 0 else 0
+        st.text_input(
+            "Rapporto peso/potenza FTP (W/kg)",
+            value=f"{wkg_ftp_sidebar:.2f}",
+            help="Calcolato come FTP / peso corporeo. Indica quanti Watt sviluppi per kg di peso: utile per confrontare le prestazioni tra atleti diversi.",
+            disabled=True,
+        )
+
+    if not df.empty:
+        st.markdown(f"## 🔎 Dettaglio: {file_selezionato}")
+        
+        # Calcoli base per KPI (coerciamo NaN a 0 per file Bryton/cyclocomputer senza alcuni campi)
+        dist_km = float(df['distance'].max() / 1000) if 'distance' in df.columns else 0
+        durata_min = (df['timestamp'].iloc[-1] - df['timestamp'].iloc[0]).total_seconds() / 60 if 'timestamp' in df.columns else 0
+        speed_avg = df['speed_kmh'].mean() if 'speed_kmh' in df.columns else 0
+        p_avg = df['power'].mean() if 'power' in df.columns else 0
+        hr_avg = df['heart_rate'].mean() if 'heart_rate' in df.columns else 0
+        cad_avg = df[df['cadence'] > 0]['cadence'].mean() if 'cadence' in df.columns else 0
+        gain = elevation_gain_m(df['altitude_m']) if 'altitude_m' in df.columns else 0
+        if pd.isna(speed_avg): speed_avg = 0
+        if pd.isna(p_avg): p_avg = 0
+        if pd.isna(hr_avg): hr_avg = 0
+        if pd.isna(cad_avg): cad_avg = 0
+        if pd.isna(durata_min): durata_min = 0
+        if pd.isna(dist_km): dist_km = 0
+        if pd.isna(gain): gain = 0
+
+        # Consumo calorico stimato (usato anche nei KPI)
+        kcal = 0
+        if dist_km > 0:
+            kcal = 0.3 * user_weight * dist_km
+
+        # Rapporti peso/potenza
+        wkg_ftp = user_ftp / user_weight if user_weight > 0 else 0
+        wkg_session = p_avg / user_weight if user_weight > 0 else 0
+
+        # KPI - Prima riga
+        r1c1, r1c2, r1c3, r1c4, r1c5, r1c6 = st.columns(6)
+        r1c1.metric("Distanza", f"{dist_km:.2f} km")
+        r1c2.metric("Durata", f"{durata_min:.0f} min")
+        r1c3.metric("Velocità Avg", f"{speed_avg:.1f} km/h")
+        r1c4.metric("Potenza Avg", f"{int(p_avg)} W")
+        r1c5.metric(
+            "FTP Stimato",
+            f"{ftp_stimato} W",
+            help="FTP stimato sulle ultime 5 attività (≈95% della miglior potenza media di 20 minuti complessiva)."
+        )
+        r1c6.metric(
+            "FTP W/kg",
+            f"{wkg_ftp:.2f} W/kg",
+            help="Rapporto peso/potenza basato sull'FTP (FTP / peso). Utile per confrontare le prestazioni tra atleti di peso diverso."
+        )
+
+        # KPI - Seconda riga
+        r2c1, r2c2, r2c3, r2c4, r2c5, r2c6 = st.columns(6)
+        r2c1.metric("FC Media", f"{hr_avg:.0f} bpm")
+        r2c2.metric("Cadenza Avg", f"{int(cad_avg)} rpm")
+        r2c3.metric("Dislivello", f"{int(gain)} m")
+        r2c4.metric("Consumo stimato", f"{kcal:.0f} kcal")
+        r2c5.metric("W/kg Sessione", f"{wkg_session:.2f} W/kg")
+        r2c6.metric("Peso", f"{user_weight:.1f} kg")
+
+        # Resoconto della pulizia fatta all'ingestione (grafici e curve usano già i dati corretti)
+        pulizia = df.attrs.get('pulizia', [])
+        if pulizia:
+            with st.expander(f"🧹 Pulizia dati: {sum(r['Campioni'] for r in pulizia)} campioni corretti", expanded=False):
+                st.dataframe(pd.DataFrame(pulizia), hide_index=True, use_container_width=True)
+
+        # Report HTML autosufficiente da mandare all'atleta (stesse pagine di python -m engine.report)
+        if st.button("📄 Prepara report HTML", key=f"report_{file_id}"):
+            with profiling.stage('report attività', 'compute'):
+                risultato = activity_result(file_selezionato, df)
+                if 'error' in risultato:
+                    st.error(f"Report non disponibile: {risultato['error']}")
+                else:
+                    impostazioni = {'ftp': user_ftp, 'max_hr': user_max_hr, 'peso': user_weight}
+                    st.session_state[f"report_{file_id}_html"] = activity_report(risultato, df, impostazioni)[0]
+        if st.session_state.get(f"report_{file_id}_html"):
+            st.download_button(
+                "Scarica report HTML",
+                data=st.session_state[f"report_{file_id}_html"],
+                file_name=f"{os.path.splitext(file_selezionato)[0]}.html",
+                mime="text/html",
+            )
+
+        x_axis = 'distance' if 'distance' in df.columns else 'minuti_trascorsi'
+        x_label = 'Distanza (metri)' if 'distance' in df.columns else 'Minuti'
+        
+        st.markdown("---")
+
+        # --- GRAFICO TUTTO IN UNO ---
+        st.subheader("📊 Confronto Tutto in Uno")
+        chk1, chk2, chk3, chk4, chk5, chk_norm = st.columns(6)
+        show_speed = chk1.checkbox("Velocità", value=True) if 'speed_kmh' in df.columns else False
+        show_power = chk2.checkbox("Potenza", value=True) if 'power' in df.columns else False
+        show_cadence = chk3.checkbox("Cadenza", value=False) if 'cadence' in df.columns else False
+        show_altitude = chk4.checkbox("Altitudine", value=False) if 'altitude_m' in df.columns else False
+        show_hr = chk5.checkbox("Freq. Cardiaca", value=False) if 'heart_rate' in df.columns else False
+        normalize = chk_norm.checkbox("Normalizza %", value=True)
+
+        selected_cols = []
+        if show_speed: selected_cols.append('speed_kmh')
+        if show_power: selected_cols.append('power')
+        if show_cadence: selected_cols.append('cadence')
+        if show_altitude: selected_cols.append('altitude_m')
+        if show_hr: selected_cols.append('heart_rate')
+
+        comp_event = None
+        if selected_cols:
+            plot_df = df[[x_axis] + selected_cols].copy()
+            if normalize:
+                for col in selected_cols:
+                    mx, mn = plot_df[col].max(), plot_df[col].min()
+                    if mx > mn: plot_df[col] = (plot_df[col] - mn) / (mx - mn) * 100
+            fig_comp = px.line(plot_df, x=x_axis, y=selected_cols)
+            fig_comp.update_layout(xaxis_title=x_label, template="plotly_white", hovermode="x unified", dragmode="select")
+            # Selezione a riquadro: l'intervallo scelto alimenta le statistiche qui sotto
+            comp_event = plot_chart("fig_comp", fig_comp, on_select="rerun", selection_mode="box", key="fig_comp")
+
+        # --- STATISTICHE INTERVALLO ---
+        ps = activity_prefix_sums(file_id)
+        range_axis = 'km' if x_axis == 'distance' else 'minuti'
+        range_km = None
+        x_max = round(float(ps[range_axis][-1]), 2) if ps['n'] else 0.0
+        if x_max > 0:
+            st.subheader("✂️ Statistiche Intervallo")
+            range_key = f"range_sel_{file_id}"
+            if range_key not in st.session_state:
+                st.session_state[range_key] = (0.0, x_max)
+            # Un nuovo riquadro sul grafico sposta lo slider; lo slider resta usabile finché il riquadro non cambia
+            box = comp_event.selection.get('box') if comp_event else None
+            if box:
+                x0, x1 = sorted(box[0]['x'])
+                if range_axis == 'km':
+                    x0, x1 = x0 / 1000, x1 / 1000
+                sel = (max(0.0, round(x0, 2)), min(x_max, round(x1, 2)))
+                if sel[0] < sel[1] and st.session_state.get('range_box') != sel:
+                    st.session_state['range_box'] = sel
+                    st.session_state[range_key] = sel
+            lo, hi = st.slider(
+                f"Intervallo ({range_axis})",
+                min_value=0.0,
+                max_value=x_max,
+                step=0.01 if range_axis == 'km' else 0.5,
+                key=range_key,
+                help="Trascina lo slider o seleziona un riquadro sul grafico 'Tutto in Uno' per le statistiche di un tratto."
+            )
+            with profiling.stage('statistiche intervallo', 'compute'):
+                i0, i1 = index_range(ps, lo, hi, axis=range_axis)
+                rs = range_stats(ps, i0, i1)
+            range_km = (float(ps['km'][i0]), float(ps['km'][i1]))
+            wkg_range = rs['Potenza Avg (W)'] / user_weight if user_weight > 0 else 0
+
+            s1, s2, s3, s4 = st.columns(4)
+            s1.metric("Distanza", f"{rs['Distanza (km)']:.2f} km")
+            s2.metric("Durata", f"{rs['Durata (min)']:.0f} min")
+            s3.metric("Potenza Avg", f"{int(rs['Potenza Avg (W)'])} W", delta=f"{rs['Potenza Avg (W)'] - p_avg:+.0f} W vs uscita")
+            s4.metric("W/kg", f"{wkg_range:.2f} W/kg")
+            s5, s6, s7, s8 = st.columns(4)
+            s5.metric("FC Media", f"{rs['FC Avg (bpm)']:.0f} bpm", delta=f"{rs['FC Avg (bpm)'] - hr_avg:+.0f} bpm vs uscita", delta_color="inverse")
+            s6.metric("Cadenza Avg", f"{int(rs['Cadenza Avg (rpm)'])} rpm")
+            s7.metric("Velocità Avg", f"{rs['Velocità Avg (km/h)']:.1f} km/h", delta=f"{rs['Velocità Avg (km/h)'] - speed_avg:+.1f} km/h vs uscita")
+            s8.metric("Dislivello", f"{int(rs['Dislivello (m)'])} m")
+
+        st.markdown("---")
+
+            
+           # --- CURVA DI POTENZA (CONFRONTO COMPLETO: ATTUALE vs MEDIA vs BEST) ---
+        if 'power' in df.columns:
+            st.markdown("---")
+            st.subheader("⚡ Curva di Potenza ")
+            
+            # 1. Intervalli critici
+            targets_sec = TARGETS_SEC
+
+            # --- A. CALCOLO CURVA ATTIVITÀ CORRENTE (ROSSA) ---
+            with profiling.stage('curva di potenza', 'compute'):
+                valid_durations, current_pdc = power_curve(df['power'], targets_sec)
+            curve_salvate = load_power_curves()
+            if file_md5 and stored_curve(curve_salvate, file_selezionato, file_md5) is None:
+                curve_salvate[file_selezionato] = curve_entry(valid_durations, current_pdc, file_md5)
+                save_power_curves(curve_salvate)
+
+            # Intervalli e posizione dei migliori sforzi, salvati per la vista trend
+            # Si salvano solo per un file nuovo o cambiato: cambiare FTP qui non riscrive l'archivio,
+            # la vista trend ricalcola gli intervalli per il proprio FTP dall'archivio stagionale
+            analisi_int = activity_intervals(file_id, user_ftp)
+            risultati_int = load_intervals()
+            if file_md5 and not intervals_is_current(risultati_int, file_selezionato, file_md5):
+                risultati_int[file_selezionato] = intervals_entry(analisi_int, file_md5)
+                save_intervals(risultati_int)
+            
+            # --- B. CALCOLO DATI STORICI (MEDIA e BEST) ---
+            avg_pdc = []
+            best_recent_pdc = []
+            
+            try:
+                # Verifichiamo che la lista di tutti i file esista
+                if 'all_files' in locals() and all_files:
+                    
+                    # Prendiamo i primi 5 file (i più recenti in assoluto)
+                    recent_files_names = all_files[:5]
+                    
+                    if recent_files_names:
+                        history_values = {d: [] for d in valid_durations}
+                        # Curve salvate per file: si decodifica solo chi non ce l'ha ancora
+                        hashes = drive_file_hashes(GOOGLE_DRIVE_FOLDER_ID)
+                        nuove_curve = 0
+                        
+                        # Spinner informativo
+                        with st.spinner(f"Analisi storico (Media e Best) su {len(recent_files_names)} file..."), \
+                                profiling.stage('storico curva di potenza', 'compute', files=len(recent_files_names)):
+                            for fname in recent_files_names:
+                                try:
+                                    fid = files_dict.get(fname)
+                                    if not fid: continue
+
+                                    md5 = hashes.get(fname)
+                                    curva = stored_curve(curve_salvate, fname, md5)
+                                    if curva is None:
+                                        df_hist = load_single_fit_from_drive(fid)
+                                        if df_hist.empty or 'power' not in df_hist.columns:
+                                            continue
+                                        hist_durations, hist_pdc = power_curve(df_hist['power'], targets_sec)
+                                        curva = dict(zip(hist_durations, hist_pdc))
+                                        if md5:
+                                            curve_salvate[fname] = curve_entry(hist_durations, hist_pdc, md5)
+                                            nuove_curve += 1
+
+                                    for d in valid_durations:
+                                        if d in curva:
+                                            history_values[d].append(curva[d])
+                                except Exception:
+                                    continue 
+                        if nuove_curve:
+                            save_power_curves(curve_salvate)
+                        
+                        # Calcolo Media e Best per ogni durata
+                        for d in valid_durations:
+                            vals = history_values[d]
+                            if vals:
+                                avg_pdc.append(sum(vals) / len(vals)) # MEDIA
+                                best_recent_pdc.append(max(vals))     # BEST
+                            else:
+                                avg_pdc.append(None)
+                                best_recent_pdc.append(None)
+
+            except Exception as e:
+                st.warning(f"Impossibile calcolare storico: {e}")
+                avg_pdc = [None] * len(valid_durations)
+                best_recent_pdc = [None] * len(valid_durations)
+
+            # --- C. CREAZIONE GRAFICO ---
+            if valid_durations:
+                with profiling.stage('power_curve_figure', 'compute'):
+                    fig_pdc = power_curve_figure(valid_durations, current_pdc, avg_pdc, best_recent_pdc)
+                plot_chart("fig_pdc", fig_pdc)
+
+            # --- D. DOVE SONO I MIGLIORI SFORZI ---
+            if analisi_int['best']:
+                st.markdown("##### 🏁 Migliori sforzi")
+                st.dataframe(
+                    pd.DataFrame([{
+                        'Durata': format_duration(b['durata_s']),
+                        'Potenza (W)': int(b['potenza_w']),
+                        'Inizio (min)': round(b['inizio_s'] / 60, 1),
+                        'Inizio (km)': round(float(df['distance'].iloc[b['i0']]) / 1000, 2) if 'distance' in df.columns else None,
+                    } for b in analisi_int['best']]),
+                    hide_index=True,
+                    use_container_width=True,
+                )
+
+
+                
+
+                
+        # --- ALTIMETRIA ---
+        if 'altitude_m' in df.columns:
+            alt_max = float(df['altitude_m'].max()) if not pd.isna(df['altitude_m'].max()) else 0.0
+            alt_avg = float(df['altitude_m'].mean()) if not pd.isna(df['altitude_m'].mean()) else 0.0
+            alt_min = float(df['altitude_m'].min()) if not pd.isna(df['altitude_m'].min()) else 0.0
+
+            # Dislivello netto (per pendenza media) e distanza
+            total_dist_m = float(df['distance'].max()) if 'distance' in df.columns and df['distance'].max() > 0 else 0.0
+            gain_net = alt_max - alt_min
+            gain_positive = elevation_gain_m(df['altitude_m'])
+
+           # --- NUOVO CALCOLO PENDENZA INDOOR (SEMPLIFICATO) ---
+        with profiling.stage('grade_pct', 'derive'):
+            df['grade_pct'] = grade_pct(df)
+
+        # --- GRAFICO ALTIMETRIA (FIX: RIEMPIMENTO SEMPRE VERSO IL BASSO) ---
+        if 'altitude_m' in df.columns:
+            dislivello = elevation_gain_m(df['altitude_m'])
+            st.markdown(f"### Profilo Altimetrico - Dislivello Positivo: {int(dislivello)} m")
+            with profiling.stage('altitude_figure', 'compute'):
+                fig_alt = altitude_figure(df)
+            plot_chart("fig_alt", fig_alt)
+
+            # --- DISACCOPPIAMENTO AEROBICO (Pw:HR) ---
+        if 'power' in df.columns and 'heart_rate' in df.columns:
+            st.markdown("---")
+            st.subheader("❤️ Disaccoppiamento Aerobico (Pw:HR)")
+            
+            # 1. PREPARAZIONE DATI
+            # Filtriamo i momenti in cui non pedalavi (potenza < 10W) o il cuore era a riposo (< 60bpm)
+            # per evitare di falsare il calcolo con le discese o le pause caffè.
+            with profiling.stage('aerobic_decoupling', 'compute'):
+                df_active = active_samples(df).copy()
+                pw_hr = efficiency_metrics(df)
+            
+            if pw_hr is not None: # Calcoliamo solo se c'è almeno 10 minuti di attività "attiva"
+                p1, hr1, ef1 = pw_hr['p1'], pw_hr['hr1'], pw_hr['ef1']
+                p2, hr2, ef2 = pw_hr['p2'], pw_hr['hr2'], pw_hr['ef2']
+                decoupling = pw_hr['decoupling']
+                
+                # 5. VISUALIZZAZIONE KPI
+                c_pw1, c_pw2, c_pw3 = st.columns(3)
+                
+                # Colore dinamico in base al risultato
+                if decoupling < 3.5:
+                    status_color = "green"
+                    status_msg = "Ottimo (Base Solida)"
+                elif decoupling < 5.0:
+                    status_color = "orange" # Usiamo orange che è standard per warning leggero
+                    status_msg = "Buono (Accettabile)"
+                else:
+                    status_color = "red" # Rosso standard
+                    status_msg = "Alto (Deriva Cardiaca)"
+                
+                c_pw1.metric("Pw:HR (Decoupling)", f"{decoupling:.1f}%", delta=status_msg, delta_color="inverse")
+                c_pw2.metric("Efficienza 1ª Metà", f"{ef1:.2f}", f"{int(p1)}w @ {int(hr1)}bpm")
+                c_pw3.metric("Efficienza 2ª Metà", f"{ef2:.2f}", f"{int(p2)}w @ {int(hr2)}bpm")
+                
+                # 6. SPIEGAZIONE GRAFICA
+                st.caption(f"""
+                **Analisi:** Nella prima metà hai tenuto **{int(p1)}W** a **{int(hr1)}bpm**. 
+                Nella seconda metà hai tenuto **{int(p2)}W** a **{int(hr2)}bpm**.
+                La tua efficienza è cambiata del **{decoupling:.1f}%**.
+                *(Obiettivo per gare di durata: < 5%)*
+                """)
+                
+                # 7. GRAFICO SCATTER (POTENZA vs CUORE)
+                # Mostriamo come si "apre" la forbice tra potenza e cuore nel tempo
+                
+                # Creiamo un dataset ridotto per il grafico (1 punto ogni 30 secondi per pulizia)
+                if len(df_active) > 30:
+                    df_chart = df_active.iloc[::30].copy()
+                    
+                    # Normalizziamo per visualizzarli insieme (0-100%)
+                    df_chart['Power %'] = (df_chart['power'] / df_chart['power'].max()) * 100
+                    df_chart['HR %'] = (df_chart['heart_rate'] / df_chart['heart_rate'].max()) * 100
+                    
+                    # Usiamo l'indice (o timestamp) per l'asse X
+                    # Se c'è distance o timestamp usiamo quello, altrimenti indice progressivo
+                    if 'timestamp' in df_chart.columns:
+                        x_ax = df_chart['timestamp']
+                    else:
+                        x_ax = df_chart.index
+
+                    fig_dec = go.Figure()
+                    
+                    # Linea Potenza (Trend)
+                    fig_dec.add_trace(go.Scatter(
+                        x=x_ax, y=df_chart['power'],
+                        mode='lines', name='Potenza (W)',
+                        line=dict(color='#1f77b4', width=1.5),
+                        opacity=0.5
+                    ))
+                    
+                    # Linea Cuore (Trend) - Su asse secondario
+                    fig_dec.add_trace(go.Scatter(
+                        x=x_ax, y=df_chart['heart_rate'],
+                        mode='lines', name='Freq. Cardiaca (bpm)',
+                        line=dict(color='#d62728', width=1.5),
+                        yaxis='y2',
+                        opacity=0.8
+                    ))
+                    
+                    fig_dec.update_layout(
+                        title="Andamento Potenza vs Cuore (Cerca la divergenza)",
+                        xaxis_title="Tempo",
+                        yaxis=dict(title="Potenza (Watt)", side="left"),
+                        yaxis2=dict(title="Cuore (bpm)", side="right", overlaying="y", showgrid=False),
+                        template="plotly_white",
+                        hovermode="x unified",
+                        height=400,
+                        legend=dict(orientation="h", y=1.1, x=0.5, xanchor="center")
+                    )
+                    
+                    plot_chart("fig_dec", fig_dec)
+
+                # 8. EF SU FINESTRA MOBILE: dove l'efficienza comincia a calare
+                with profiling.stage('ef_series', 'compute'):
+                    df_ef = ef_series(df)
+                if not df_ef.empty:
+                    fig_ef = go.Figure(go.Scattergl(
+                        x=df_ef['timestamp'], y=df_ef['EF'], mode='lines', name='EF',
+                        line=dict(color='#2ca02c', width=1.5),
+                        hovertemplate="EF: %{y:.2f}<extra></extra>",
+                    ))
+                    fig_ef.add_hline(y=pw_hr['ef'], line=dict(color='rgba(150, 150, 150, 0.8)', dash='dash'),
+                                     annotation_text=f"EF uscita {pw_hr['ef']:.2f}")
+                    fig_ef.update_layout(
+                        title=f"Efficienza (EF) su finestra mobile di {EF_WINDOW_S // 60} min attivi",
+                        xaxis_title="Tempo",
+                        yaxis_title="EF (W/bpm)",
+                        template="plotly_white",
+                        hovermode="x unified",
+                        height=350,
+                    )
+                    plot_chart("fig_ef", fig_ef)
+
+            else:
+                st.info("Dati insufficienti per calcolare il disaccoppiamento (serve attività continua > 10 min con Potenza e Cardio).")
+
+
+
+        # Istogrammi per le zone (potenza e FC), salvati per gli aggregati della vista trend
+        istogrammi = activity_zone_histograms(file_id)
+        istogrammi_salvati = load_zone_histograms()
+        if file_md5 and stored_histograms(istogrammi_salvati, file_selezionato, file_md5) is None:
+            istogrammi_salvati[file_selezionato] = histograms_entry(istogrammi, file_md5)
+            save_zone_histograms(istogrammi_salvati)
+
+        # --- POTENZA E ZONE ---
+        if 'power' in df.columns:
+            p_max, p_avg = df['power'].max(), df['power'].mean()
+            col_p1, col_p2 = st.columns([2, 1])
+            with col_p1:
+                st.subheader(f"⚡ Potenza (Max: {int(p_max)}W | Avg: {int(p_avg)}W)")
+                df['p_smooth'] = df['power'].rolling(10).mean()
+                fig_pwr = px.area(df, x=x_axis, y='p_smooth', color_discrete_sequence=['#FFA500'])
+                fig_pwr.update_traces(fillcolor='rgba(255, 165, 0, 0.3)', line=dict(width=1))
+                fig_pwr.update_layout(xaxis_title=x_label, yaxis_title="Watt", template="plotly_white")
+                best_by_label = {format_duration(b['durata_s']): b for b in analisi_int['best']}
+                best_label = st.selectbox(
+                    "Evidenzia miglior sforzo",
+                    ["Nessuno"] + list(best_by_label),
+                    index=list(best_by_label).index('5m') + 1 if '5m' in best_by_label else 0,
+                    key=f"best_sel_{file_id}",
+                )
+                with profiling.stage('mark_efforts', 'compute', intervalli=len(analisi_int['intervalli'])):
+                    mark_efforts(fig_pwr, df[x_axis], analisi_int['intervalli'], best_by_label.get(best_label))
+                plot_chart("fig_pwr", fig_pwr)
+                if analisi_int['intervalli']:
+                    with st.expander(f"🔁 {len(analisi_int['intervalli'])} intervalli sopra {int(INTERVAL_THRESHOLD * 100)}% FTP"):
+                        st.dataframe(
+                            pd.DataFrame([{
+                                'Inizio (min)': round(i['inizio_s'] / 60, 1),
+                                'Inizio (km)': i['km'],
+                                'Durata': format_duration(int(i['durata_s'])),
+                                'Potenza (W)': int(i['potenza_w']),
+                                '% FTP': i['pct_ftp'],
+                                'FC (bpm)': int(i['fc_bpm']),
+                            } for i in analisi_int['intervalli']]),
+                            hide_index=True,
+                            use_container_width=True,
+                        )
+            with col_p2:
+                st.subheader(f"📊 Zone (FTP: {user_ftp}W)")
+                with profiling.stage('zone di potenza', 'compute'):
+                    z_counts = zone_table(istogrammi.get('potenza'), zone_edges(user_ftp, POWER_ZONE_FRACTIONS), POWER_ZONES)
+                zone_figure(z_counts, "fig_zones")
+
+        # --- VELOCITÀ & ALTRI ---
+        if 'speed_kmh' in df.columns:
+            s_max, s_avg = df['speed_kmh'].max(), df['speed_kmh'].mean()
+            if pd.isna(s_max): s_max = 0
+            if pd.isna(s_avg): s_avg = 0
+            st.subheader(f"📈 Velocità (Max: {s_max:.1f} km/h | Avg: {s_avg:.1f} km/h)")
+            fig_spd = px.line(df, x=x_axis, y='speed_kmh', color_discrete_sequence=['#00BFFF'])
+            fig_spd.update_layout(xaxis_title=x_label, template="plotly_white")
+            plot_chart("fig_spd", fig_spd)
+
+        if 'cadence' in df.columns:
+            cad_valid = df[df['cadence'] > 0]['cadence']
+            cad_max = cad_valid.max() if not cad_valid.empty else 0
+            if pd.isna(cad_max): cad_max = 0
+            st.subheader(f"🦵 Cadenza (Max: {int(cad_max)} rpm | Avg: {int(cad_avg)} rpm)")
+            fig_cad = px.line(df, x=x_axis, y='cadence', color_discrete_sequence=['#32CD32'])
+            fig_cad.update_layout(xaxis_title=x_label, yaxis_title="rpm", template="plotly_white")
+            plot_chart("fig_cad", fig_cad)
+
+        if 'heart_rate' in df.columns:
+            hr_max, hr_avg = df['heart_rate'].max(), df['heart_rate'].mean()
+            if pd.isna(hr_max): hr_max = 0
+            if pd.isna(hr_avg): hr_avg = 0
+            col_h1, col_h2 = st.columns([2, 1])
+            with col_h1:
+                st.subheader(f"❤️ Cardio (Max: {int(hr_max)} bpm | Avg: {int(hr_avg)} bpm)")
+                fig_hr = px.line(df, x=x_axis, y='heart_rate', color_discrete_sequence=['red'])
+                fig_hr.update_layout(xaxis_title=x_label, template="plotly_white")
+                plot_chart("fig_hr", fig_hr)
+            with col_h2:
+                st.subheader(f"📊 Zone Cardio (FC max: {user_max_hr} bpm)")
+                with profiling.stage('zone cardio', 'compute'):
+                    hr_counts = zone_table(istogrammi.get('fc'), zone_edges(user_max_hr, HR_ZONE_FRACTIONS), HR_ZONES)
+                zone_figure(hr_counts, "fig_hr_zones")
+
+            # --- RELAZIONE FC / CADENZA / POTENZA ---
+            if 'cadence' in df.columns and 'power' in df.columns:
+                rel_df = df[['heart_rate', 'cadence', 'power']].dropna().copy()
+                rel_df = rel_df[(rel_df['heart_rate'] > 0) & (rel_df['cadence'] > 0)]
+                if not rel_df.empty:
+                    hr_mean = rel_df['heart_rate'].mean()
+                    cad_mean = rel_df['cadence'].mean()
+                    p_mean = rel_df['power'].mean()
+                    st.subheader(
+                        f"❤️🦵 Frequenza Cardiaca e RPM a potenza – Avg: {hr_mean:.0f} bpm, {cad_mean:.0f} rpm, {p_mean:.0f} W"
+                    )
+
+                    rel_mode = st.radio(
+                        "Visualizzazione",
+                        ["Densità (celle)", "Punti"],
+                        horizontal=True,
+                        key=f"rel_mode_{file_id}",
+                        help="Densità: campioni raggruppati in celle da 2 rpm x 2 bpm, molto più leggera sulle uscite lunghe. Punti: un punto per campione.",
+                    )
+                    if rel_mode == "Punti":
+                        with profiling.stage('hr_cadence_power_figure', 'compute', points=len(rel_df)):
+                            fig_rel = hr_cadence_power_figure(rel_df)
+                    else:
+                        rel_color = st.radio("Colore celle", ["Potenza media (W)", "Campioni"], horizontal=True, key=f"rel_color_{file_id}")
+                        griglia = activity_density(file_id)
+                        with profiling.stage('hr_cadence_density_figure', 'compute', cells=len(griglia['celle'])):
+                            fig_rel = hr_cadence_density_figure(
+                                density_table(griglia), rel_color, {'heart_rate': hr_mean, 'cadence': cad_mean}
+                            )
+                        # Salvata per la vista stagionale della vista trend
+                        griglie_salvate = load_density_grids()
+                        if file_md5 and stored_grid(griglie_salvate, file_selezionato, file_md5) is None:
+                            griglie_salvate[file_selezionato] = grid_entry(griglia, file_md5)
+                            save_density_grids(griglie_salvate)
+                    plot_chart("fig_rel", fig_rel)
+                else:
+                    st.info("Dati insufficienti per il grafico FC/Cadenza/Potenza (valori mancanti o a zero).")
+
+        if 'position_lat' in df.columns:
+            # pydeck serve solo qui: lo importiamo quando la mappa viene davvero mostrata
+            import pydeck as pdk
+
+            st.subheader("🗺️ Mappa")
+            map_df = df[['position_lat', 'position_long']].dropna()
+            map_df['lat'] = map_df['position_lat'] * (180 / 2**31)
+            map_df['lon'] = map_df['position_long'] * (180 / 2**31)
+            path_list = map_df[['lon', 'lat']].values.tolist()
+            path_data = [{"path": path_list}]
+            lat_center = map_df['lat'].mean()
+            lon_center = map_df['lon'].mean()
+            view_state = pdk.ViewState(
+                latitude=lat_center,
+                longitude=lon_center,
+                zoom=12,
+                pitch=0,
+                bearing=0,
+            )
+            layer = pdk.Layer(
+                type="PathLayer",
+                data=path_data,
+                get_path="path",
+                get_color=[65, 131, 215],
+                get_width=2,
+                width_units="pixels",
+                width_min_pixels=1,
+            )
+            deck = pdk.Deck(layers=[layer], initial_view_state=view_state, tooltip=False)
+            col_m1, col_m2, col_m3 = st.columns([1, 2, 1])
+            with col_m2:
+                with profiling.stage('mappa', 'render', points=len(path_list)):
+                    st.pydeck_chart(deck, height=350)
+
+        # --- SEGMENTI ---
+        track = activity_track(file_id)
+        if track is not None:
+            st.markdown("---")
+            st.subheader("🧗 Segmenti")
+            with profiling.stage('segmenti', 'compute'):
+                segs = load_segments()
+                # Nuova attività: solo le celle che attraversa vengono cercate nell'indice dei segmenti
+                if not segs.has_track(file_selezionato):
+                    segs.add_track(file_selezionato, track)
+                    save_segments(segs)
+                efforts = segs.activity_efforts(file_selezionato)
+
+            if efforts.empty:
+                st.info("Nessun segmento riconosciuto su questa attività.")
+            else:
+                st.dataframe(efforts.drop(columns=['Attività']), hide_index=True, use_container_width=True)
+
+            seg_c1, seg_c2 = st.columns(2)
+            with seg_c1:
+                if range_km and range_km[1] > range_km[0]:
+                    nome_segmento = st.text_input("Nome segmento", value=f"Tratto km {range_km[0]:.1f}-{range_km[1]:.1f}")
+                    if st.button("➕ Salva intervallo come segmento"):
+                        seg = segment_from_track(track, range_km[0] * 1000, range_km[1] * 1000, nome_segmento, KIND_MANUAL, file_selezionato)
+                        if seg is None:
+                            st.warning("Intervallo troppo corto per un segmento.")
+                        else:
+                            segs.add_segment(seg)
+                            save_segments(segs)
+                            st.rerun()
+            with seg_c2:
+                if st.button("🔍 Scopri salite su questa attività"):
+                    nuove = 0
+                    for d0, d1, gain_c, grade_c in discover_climbs(track):
+                        seg = segment_from_track(track, d0, d1, f"Salita km {d0 / 1000:.1f} ({gain_c:.0f} m, {grade_c:.1f}%)", KIND_CLIMB, file_selezionato)
+                        if seg is not None and segs.find_similar(seg) is None:
+                            segs.add_segment(seg)
+                            nuove += 1
+                    if nuove:
+                        save_segments(segs)
+                        st.rerun()
+                    st.info("Nessuna nuova salita trovata.")
+
+            if segs.segments:
+                seg_scelto = st.selectbox(
+                    "Storico segmento:",
+                    list(segs.segments),
+                    format_func=lambda sid: segs.segments[sid]['nome'],
+                )
+                hist = segs.history(seg_scelto)
+                if not hist.empty:
+                    fig_seg = px.scatter(hist, x='Data', y='Tempo (s)', color='Potenza Avg (W)', symbol='PR',
+                                         hover_data=['Attività', 'FC Avg (bpm)', 'Velocità Avg (km/h)'],
+                                         color_continuous_scale='Oranges')
+                    fig_seg.update_layout(template="plotly_white")
+                    plot_chart("fig_seg", fig_seg)
+                    st.dataframe(hist.drop(columns=['Segmento']), hide_index=True, use_container_width=True)
+
+                # Le attività mai aperte non sono ancora nell'indice delle tracce
+                da_indicizzare = [f for f in all_files if not segs.has_track(f)]
+                if da_indicizzare and st.button(f"📥 Cerca i segmenti nelle altre {len(da_indicizzare)} attività"):
+                    progress_seg = st.progress(0)
+                    for i, fname in enumerate(da_indicizzare):
+                        # Solo GPS e canali della traccia, un file alla volta e fuori dalla cache delle
+                        # attività: su un archivio grande la memoria non cresce con il numero di file
+                        prodotti = derive_file(fname, files_dict[fname], ['traccia'])
+                        if prodotti:
+                            segs.add_track(fname, prodotti['traccia'])
+                        progress_seg.progress((i + 1) / len(da_indicizzare))
+                    save_segments(segs)
+                    st.rerun()
+
+# ==============================================================================
+# MODALITÀ 2: CONFRONTO ATTIVITÀ
+# ==============================================================================
+elif app_mode == "🆚 Confronto Attività":
+
+    with st.sidebar:
+        st.subheader("Impostazioni Confronto")
+        files_confronto = st.multiselect("Scegli le attività:", all_files, default=all_files[:2])
+        asse_confronto = st.radio(
+            "Allinea per",
+            ["Distanza", "Tempo"],
+            help="Distanza: stesso percorso, distacco in secondi a ogni punto. Tempo: distacco in metri a ogni minuto."
+        )
+        axis = 'distanza' if asse_confronto == "Distanza" else 'tempo'
+        riferimento = st.selectbox("Riferimento per il distacco:", files_confronto) if files_confronto else None
+
+    st.markdown("## 🆚 Confronto Attività")
+
+    if len(files_confronto) < 2:
+        st.info("Seleziona almeno due attività da confrontare.")
+    else:
+        # Ogni uscita è allineata e in cache da sola: aggiungerne una non ricalcola le altre
+        aligned = {}
+        for fname in files_confronto:
+            a = aligned_activity(files_dict[fname], axis)
+            if a is None:
+                st.warning(f"'{fname}' non ha dati di {asse_confronto.lower()}: esclusa dal confronto.")
+            else:
+                aligned[fname] = a
+
+        if len(aligned) < 2:
+            st.warning("Servono almeno due attività con dati validi per il confronto.")
+        else:
+            st.dataframe(comparison_table(aligned), hide_index=True, use_container_width=True)
+
+            # Distacco cumulativo rispetto al riferimento
+            ref_name = riferimento if riferimento in aligned else next(iter(aligned))
+            with profiling.stage('distacchi', 'compute', rides=len(aligned)):
+                gaps = {}
+                for fname, a in aligned.items():
+                    if fname != ref_name:
+                        gap = gap_curve(aligned[ref_name], a, axis)
+                        if gap is not None:
+                            gaps[fname] = gap
+            if gaps:
+                st.subheader("⏱️ Distacco dal riferimento")
+                plot_chart("fig_gap", gap_figure(gaps, ref_name, axis))
+
+            for col, label in COMPARE_CHANNELS.items():
+                if any(col in a for a in aligned.values()):
+                    st.subheader(label)
+                    plot_chart(f"fig_cmp_{col}", overlay_figure(aligned, col, label, axis))
+
+# ==============================================================================
+# MODALITÀ 3: ANALISI TREND
+# ==============================================================================
+elif app_mode == "📈 Analisi Trend & Progressi":
+
+    # Configurazione Trend nel menu laterale (come Analisi Singola)
+    with st.sidebar:
+        st.subheader("Configurazione Trend")
+        trend_weight = st.number_input(
+            "Peso (kg) per analisi trend",
+            min_value=30,
+            max_value=150,
+            value=60,
+            step=1,
+            help="Peso corporeo usato per stimare le calorie totali e il rapporto W/kg nel tempo."
+        )
+
+        # FTP di default stimata sulle ultime 5 attività (stessa logica dell'analisi singola)
+        trend_ftp_default = calculate_ftp_from_last_n_activities(files_dict, 5)
+        trend_ftp = st.number_input(
+            "FTP (W) per analisi trend",
+            min_value=50,
+            max_value=600,
+            value=trend_ftp_default,
+            step=5,
+            help="Valore di FTP usato per stimare FC e cadenza medie a quella potenza in ogni sessione."
+        )
+
+        trend_max_hr = st.number_input(
+            "FC massima (bpm) per analisi trend",
+            min_value=120,
+            max_value=230,
+            value=190,
+            step=1,
+            help="Frequenza cardiaca massima usata per la distribuzione nelle zone cardio."
+        )
+
+        # Granularità dei grafici: con archivi lunghi un punto per uscita diventa illeggibile
+        trend_granularity = st.radio(
+            "Aggregazione grafici",
+            ["Automatica", "Per uscita", "Settimanale", "Mensile"],
+            help="Automatica: un punto per uscita fino a 60 attività, poi per settimana (fino a 2 anni) o per mese."
+        )
+
+        escludi_duplicati = st.checkbox(
+            "Escludi attività duplicate",
+            value=True,
+            help="La stessa uscita presente più volte (es. export del ciclocomputer e riesportazione da una piattaforma) viene contata una sola volta."
+        )
+
+    st.markdown("## 📈 I tuoi Progressi nel Tempo")
+    
+    with st.expander("📂 Seleziona le attività da analizzare", expanded=True):
+        seleziona_tutti = st.checkbox("Seleziona tutti i file", value=True)
+        if seleziona_tutti:
+            files_scelti = all_files
+        else:
+            files_scelti = st.multiselect("Scegli i file:", all_files, default=all_files[:5])
+    
+    if st.button("🚀 Genera Analisi Trend"):
+        # La selezione resta in sessione: i widget dei grafici e delle query qui sotto rieseguono
+        # lo script senza il pulsante premuto, e l'analisi deve restare visibile
+        st.session_state.trend_files = list(files_scelti)
+    if 'trend_files' in st.session_state:
+        files_trend = [name for name in st.session_state.trend_files if name in files_dict]
+        if not files_trend:
+            st.warning("Seleziona almeno un file.")
+        else:
+            # Crea dizionario solo per i file selezionati (sempre da Google Drive)
+            selected_files_dict = {name: files_dict[name] for name in files_trend}
+            with st.spinner('Analisi in corso...'):
+                hashes_trend = drive_file_hashes(GOOGLE_DRIVE_FOLDER_ID)
+                df_summary = get_activity_summary(selected_files_dict, hashes_trend)
+            
+            if not df_summary.empty:
+                # Ordiniamo per data
+                df_summary = df_summary.sort_values(by="Data")
+
+                # Duplicati: stessa uscita in più file, altrimenti km, dislivello e kcal contati due volte
+                duplicati = df_summary[df_summary['Duplicato di'] != ""]
+                if not duplicati.empty:
+                    stato = "escluse dai totali" if escludi_duplicati else "incluse nei totali"
+                    with st.expander(f"🔁 {len(duplicati)} attività duplicate ({stato})", expanded=False):
+                        st.dataframe(
+                            duplicati[['Filename', 'Data', 'Duplicato di', 'Motivo duplicato']],
+                            hide_index=True,
+                            use_container_width=True,
+                        )
+                    if escludi_duplicati:
+                        df_summary = df_summary[df_summary['Duplicato di'] == ""]
+
+                # Calcolo kcal stimate per ogni uscita (stessa formula usata nell'analisi singola)
+                if trend_weight > 0:
+                    df_summary["Kcal stimate"] = df_summary["Distanza (km)"] * trend_weight * 0.3
+                else:
+                    df_summary["Kcal stimate"] = 0
+
+                # Intervalli per uscita: dai risultati salvati, ricalcolati dall'archivio stagionale
+                # (completato dal riepilogo) se mancano per questo FTP o per questo contenuto del file
+                archivio = open_archive()
+                with profiling.stage('intervalli trend', 'compute'):
+                    risultati_int = load_intervals()
+                    mancanti = 0
+                    righe_int = []
+                    for fname in df_summary['Filename']:
+                        md5 = hashes_trend.get(fname)
+                        entry = stored_for(risultati_int, fname, trend_ftp, md5)
+                        if entry is None and archivio.has(fname, md5):
+                            entry = intervals_entry(analyse(archivio.activity_frame(fname, INTERVAL_CHANNELS), trend_ftp), md5)
+                            risultati_int[fname] = entry
+                            mancanti += 1
+                        righe_int.append(interval_summary(entry['intervalli'] if entry else []))
+                    if mancanti:
+                        save_intervals(risultati_int)
+                    df_int = pd.DataFrame(righe_int, index=df_summary.index)
+                    df_summary['Intervalli'] = df_int['Intervalli']
+                    df_summary['Tempo in intervalli (min)'] = df_int['Tempo in intervalli (min)']
+
+                # Istogrammi delle zone per uscita: salvati dal riepilogo, nessun file da rileggere
+                with profiling.stage('istogrammi zone trend', 'compute'):
+                    istogrammi_salvati = load_zone_histograms()
+                    istogrammi_trend = {
+                        fname: stored_histograms(istogrammi_salvati, fname, hashes_trend.get(fname)) or {}
+                        for fname in df_summary['Filename']
+                    }
+
+                # Totali
+                kcal_tot = df_summary["Kcal stimate"].sum()
+
+                t1, t2, t3, t4, t5 = st.columns(5)
+                t1.metric("Attività", len(df_summary))
+                t2.metric("Km Totali", f"{int(df_summary['Distanza (km)'].sum())} km")
+                t3.metric("Dislivello Tot", f"{int(df_summary['Dislivello (m)'].sum())} m")
+                t4.metric("Ore Totali", f"{df_summary['Durata (min)'].sum()/60:.1f} h")
+                t5.metric("Kcal Totali", f"{kcal_tot:.0f} kcal")
+                
+                st.markdown("---")
+
+                # Aggregati settimanali/mensili: aggiorniamo solo i bucket delle uscite nuove
+                with profiling.stage('aggregati trend', 'compute'):
+                    rollups = load_rollups()
+                    # Uscite cancellate o rinominate su Drive: fuori dagli aggregati (elenco completo, non solo i file scelti)
+                    changed = rollups.prune(files_dict) + rollups.update_from_summary(df_summary)
+                    if escludi_duplicati:
+                        # Duplicati entrati negli aggregati prima che fossero riconosciuti
+                        changed += sum(rollups.remove(name) for name in duplicati['Filename'])
+                    if changed:
+                        save_rollups(rollups)
+                    freq = {"Per uscita": None, "Settimanale": 'W', "Mensile": 'M'}.get(
+                        trend_granularity, auto_freq(df_summary['Data'])
+                    )
+                    df_roll = rollups.table(freq, trend_ftp, filenames=df_summary['Filename']) if freq else None
+
+                if freq is None:
+                    # 1. Distanza
+                    st.subheader("📅 Volume: Distanza per Uscita")
+                    fig_vol = px.bar(df_summary, x='Data', y='Distanza (km)', 
+                                     color='Dislivello (m)',
+                                     color_continuous_scale='Bluered')
+                    fig_vol.update_layout(template="plotly_white")
+                    plot_chart("fig_vol", fig_vol)
+                    
+                    # 2. Scatter Trends
+                    c_trend1, c_trend2 = st.columns(2)
+                    with c_trend1:
+                        st.subheader("⚡ Trend Potenza")
+                        fig_t_pwr = px.scatter(df_summary, x='Data', y='Potenza Avg (W)',
+                                               size='Distanza (km)', color='Potenza Avg (W)',
+                                               color_continuous_scale='Oranges')
+                        fig_t_pwr.update_layout(template="plotly_white")
+                        plot_chart("fig_t_pwr", fig_t_pwr)
+                        
+                    with c_trend2:
+                        st.subheader("📈 Trend Velocità")
+                        fig_t_spd = px.scatter(df_summary, x='Data', y='Velocità Avg (km/h)',
+                                               color='Velocità Avg (km/h)',
+                                               color_continuous_scale='Tealgrn')
+                        fig_t_spd.update_layout(template="plotly_white")
+                        plot_chart("fig_t_spd", fig_t_spd)
+                else:
+                    periodo = FREQS[freq]
+                    # 1. Volume e carico per periodo
+                    st.subheader(f"📅 Volume: Distanza per {periodo}")
+                    fig_vol = px.bar(df_roll, x='Periodo', y='Distanza (km)',
+                                     color='Dislivello (m)',
+                                     hover_data=['Attività', 'Durata (h)', 'TSS'],
+                                     color_continuous_scale='Bluered')
+                    fig_vol.update_layout(template="plotly_white")
+                    plot_chart("fig_vol", fig_vol)
+
+                    c_trend1, c_trend2 = st.columns(2)
+                    with c_trend1:
+                        st.subheader(f"⚡ Trend Potenza per {periodo}")
+                        fig_t_pwr = px.line(df_roll, x='Periodo',
+                                            y=['Best 5min (W)', 'Best 20min (W)', 'Potenza Avg (W)'],
+                                            markers=True)
+                        fig_t_pwr.update_layout(template="plotly_white", yaxis_title="Watt", legend_title="")
+                        plot_chart("fig_t_pwr", fig_t_pwr)
+
+                    with c_trend2:
+                        st.subheader(f"🏋️ Carico (TSS) per {periodo}")
+                        fig_t_tss = px.bar(df_roll, x='Periodo', y='TSS', color='TSS',
+                                           color_continuous_scale='Oranges')
+                        fig_t_tss.update_layout(template="plotly_white")
+                        plot_chart("fig_t_tss", fig_t_tss)
+
+                    st.subheader(f"📈 Trend Velocità per {periodo}")
+                    fig_t_spd = px.line(df_roll, x='Periodo', y='Velocità Avg (km/h)', markers=True,
+                                        color_discrete_sequence=['#00BFFF'])
+                    fig_t_spd.update_layout(template="plotly_white")
+                    plot_chart("fig_t_spd", fig_t_spd)
+
+                # Efficienza aerobica: valori salvati negli aggregati all'ingestione, nessun file riletto
+                st.subheader("💓 Efficienza aerobica (EF) e disaccoppiamento Pw:HR")
+                if freq is None:
+                    df_ef_trend = pd.DataFrame([
+                        {'Data': pd.Timestamp(e['data']), 'EF': e['ef'], 'Pw:HR (%)': e['disaccoppiamento']}
+                        for name, e in rollups.activities.items()
+                        if name in set(df_summary['Filename']) and e.get('ef', 0) > 0
+                    ], columns=['Data', 'EF', 'Pw:HR (%)']).sort_values('Data')
+                    x_ef = 'Data'
+                else:
+                    df_ef_trend = df_roll.dropna(subset=['EF'])
+                    x_ef = 'Periodo'
+                if df_ef_trend.empty:
+                    st.info("Nessuna attività con potenza e cardio sufficienti (almeno 10 minuti attivi).")
+                else:
+                    fig_t_ef = go.Figure()
+                    fig_t_ef.add_trace(go.Scatter(x=df_ef_trend[x_ef], y=df_ef_trend['EF'], mode='lines+markers',
+                                                  name='EF (W/bpm)', line=dict(color='#2ca02c')))
+                    fig_t_ef.add_trace(go.Bar(x=df_ef_trend[x_ef], y=df_ef_trend['Pw:HR (%)'], name='Pw:HR (%)',
+                                              marker_color='rgba(214, 39, 40, 0.35)', yaxis='y2'))
+                    fig_t_ef.update_layout(
+                        yaxis=dict(title="EF (W/bpm)"),
+                        yaxis2=dict(title="Pw:HR (%)", overlaying="y", side="right", showgrid=False),
+                        template="plotly_white",
+                        hovermode="x unified",
+                        legend=dict(orientation="h", y=1.1, x=0.5, xanchor="center"),
+                    )
+                    plot_chart("fig_t_ef", fig_t_ef)
+
+                # Intervalli sopra soglia: tempo e numero per uscita o per periodo
+                st.subheader(f"🔁 Intervalli sopra {int(INTERVAL_THRESHOLD * 100)}% FTP ({trend_ftp} W)")
+                if freq is None:
+                    df_int_plot = df_summary
+                    x_int = 'Data'
+                else:
+                    df_int_plot = (
+                        df_summary.assign(Periodo=pd.to_datetime(df_summary['Data'].map(lambda d: period_start(d, freq))))
+                        .groupby('Periodo', as_index=False)[['Intervalli', 'Tempo in intervalli (min)']].sum()
+                    )
+                    x_int = 'Periodo'
+                fig_t_int = px.bar(df_int_plot, x=x_int, y='Tempo in intervalli (min)',
+                                   hover_data=['Intervalli'], color='Intervalli',
+                                   color_continuous_scale='Reds')
+                fig_t_int.update_layout(template="plotly_white")
+                plot_chart("fig_t_int", fig_t_int)
+
+                # Tempo nelle zone per uscita o per periodo: somme degli istogrammi salvati
+                with profiling.stage('zone trend', 'compute'):
+                    if freq is None:
+                        chiavi_zone = df_summary['Data']
+                    else:
+                        chiavi_zone = pd.to_datetime(df_summary['Data'].map(lambda d: period_start(d, freq)))
+                    gruppi_zone = {}
+                    for chiave, fname in zip(chiavi_zone, df_summary['Filename']):
+                        gruppi_zone.setdefault(chiave, []).append(istogrammi_trend[fname])
+                    zone_trend = {
+                        'potenza': (zone_edges(trend_ftp, POWER_ZONE_FRACTIONS), POWER_ZONES, f"⚡ Zone di potenza (FTP {trend_ftp} W)"),
+                        'fc': (zone_edges(trend_max_hr, HR_ZONE_FRACTIONS), HR_ZONES, f"❤️ Zone cardio (FC max {trend_max_hr} bpm)"),
+                    }
+                    tabelle_zone = {
+                        key: zone_distribution(
+                            {k: [h.get(key) for h in hists] for k, hists in gruppi_zone.items()}, edges, labels
+                        )
+                        for key, (edges, labels, _) in zone_trend.items()
+                    }
+                c_zone1, c_zone2 = st.columns(2)
+                for col, (key, (edges, labels, titolo)) in zip((c_zone1, c_zone2), zone_trend.items()):
+                    with col:
+                        df_zone = tabelle_zone[key]
+                        ore_tot = df_zone.groupby('Zona', sort=False)['Ore'].sum()
+                        st.subheader(titolo)
+                        st.caption(" | ".join(f"{zona.split()[0]}: {ore:.1f} h" for zona, ore in ore_tot.items()))
+                        fig_t_zone = px.bar(df_zone, x='Periodo', y='Ore', color='Zona',
+                                            color_discrete_sequence=ZONE_COLORS,
+                                            category_orders={'Zona': labels})
+                        fig_t_zone.update_layout(template="plotly_white", barmode='stack', legend_title="")
+                        plot_chart(f"fig_t_zone_{key}", fig_t_zone)
+
+                # FC e cadenza a potenza su tutte le uscite scelte: somma delle griglie salvate
+                # (il riepilogo le ha già completate, nessun file da rileggere)
+                with profiling.stage('griglie densità trend', 'compute'):
+                    griglie_salvate = load_density_grids()
+                    griglia_stagione = merge_grids(griglie_salvate.get(fname) for fname in df_summary['Filename'])
+                if griglia_stagione:
+                    st.subheader("❤️🦵 FC e cadenza a potenza (tutte le uscite scelte)")
+                    p_lo, p_hi = power_range(griglia_stagione)
+                    c_den1, c_den2 = st.columns([2, 1])
+                    fascia = c_den1.slider("Fascia di potenza (W)", min_value=int(p_lo), max_value=int(p_hi),
+                                           value=(int(p_lo), int(p_hi)), step=20)
+                    den_color = c_den2.radio("Colore celle", ["Potenza media (W)", "Campioni"], horizontal=True,
+                                             key="den_color_trend")
+                    with profiling.stage('hr_cadence_density_figure', 'compute', cells=len(griglia_stagione['celle'])):
+                        tab_den = density_table(griglia_stagione, *fascia)
+                        medie_den = table_means(tab_den)
+                        fig_t_den = hr_cadence_density_figure(tab_den, den_color, medie_den) if medie_den else None
+                    if fig_t_den is None:
+                        st.info("Nessun campione nella fascia di potenza scelta.")
+                    else:
+                        st.caption(
+                            f"{int(tab_den['Campioni'].sum())} campioni – Avg: {medie_den['heart_rate']:.0f} bpm, "
+                            f"{medie_den['cadence']:.0f} rpm, {medie_den['power']:.0f} W"
+                        )
+                        plot_chart("fig_t_den", fig_t_den)
+
+                # Domande su tutta la stagione: archivio a colonne mappato in memoria, query NumPy
+                st.subheader("🗄️ Archivio stagione")
+                scelte = archivio.select(filenames=df_summary['Filename'])
+                st.caption(f"{len(scelte)} attività, {archivio.samples} campioni in archivio")
+                tab_soglia, tab_fc, tab_best = st.tabs(["Tempo sopra soglia", "FC a potenza", "Miglior sforzo"])
+                with tab_soglia:
+                    soglia = st.number_input("Potenza minima (W)", min_value=50, max_value=1500, value=300, step=10)
+                    with profiling.stage('query tempo sopra soglia', 'compute'):
+                        df_q = archivio.time_in_range('power', lo=soglia, acts=scelte)
+                    st.metric(f"Tempo sopra {soglia} W", f"{df_q['Secondi'].sum() / 60:.0f} min")
+                    df_q['Minuti'] = (df_q['Secondi'] / 60).round(1)
+                    fig_q = px.bar(df_q, x='Data', y='Minuti', hover_data=['Filename'], color_discrete_sequence=['#FF4500'])
+                    fig_q.update_layout(template="plotly_white")
+                    plot_chart("fig_q_soglia", fig_q)
+                with tab_fc:
+                    potenza_rif = st.number_input("Potenza (W, ±10 W)", min_value=50, max_value=1000, value=int(trend_ftp * 0.9 // 10 * 10), step=10)
+                    with profiling.stage('query FC a potenza', 'compute'):
+                        df_q = archivio.mean_where('heart_rate', 'power', potenza_rif - 10, potenza_rif + 10, acts=scelte)
+                    if df_q.empty:
+                        st.info("Nessun campione a questa potenza.")
+                    else:
+                        fig_q = px.line(df_q, x='Data', y='Media', markers=True, hover_data=['Filename', 'Secondi'],
+                                        labels={'Media': f'FC media a {potenza_rif} W (bpm)'}, color_discrete_sequence=['red'])
+                        fig_q.update_layout(template="plotly_white")
+                        plot_chart("fig_q_fc", fig_q)
+                with tab_best:
+                    c_b1, c_b2 = st.columns(2)
+                    durata_best = c_b1.selectbox("Durata", TARGETS_SEC, index=TARGETS_SEC.index(300), format_func=format_duration)
+                    km_min = c_b2.number_input("Solo uscite oltre (km)", min_value=0, max_value=400, value=0, step=10)
+                    with profiling.stage('query miglior sforzo', 'compute'):
+                        df_q = archivio.best_effort(durata_best, archivio.select(filenames=df_summary['Filename'], min_km=km_min or None))
+                    if df_q.empty:
+                        st.info("Nessuna uscita abbastanza lunga con questi filtri.")
+                    else:
+                        migliore = df_q.loc[df_q['Potenza (W)'].idxmax()]
+                        st.metric(f"Miglior {format_duration(durata_best)}", f"{migliore['Potenza (W)']:.0f} W",
+                                  help=f"{migliore['Filename']} ({migliore['Data']:%d/%m/%Y})")
+                        fig_q = px.scatter(df_q, x='Data', y='Potenza (W)', size='Distanza (km)', hover_data=['Filename'],
+                                           color_discrete_sequence=['#FFA500'])
+                        fig_q.update_layout(template="plotly_white")
+                        plot_chart("fig_q_best", fig_q)
+
+                # 3. Tabella
+                with st.expander("Tabella Dati"):
+                    st.dataframe(df_summary)
+                    
+                # 4. FTP stimata (proxy) e rapporto peso/potenza nel tempo
+                if 'Potenza Avg (W)' in df_summary.columns and trend_weight > 0:
+                    st.subheader("💪 FTP stimata (proxy) e W/kg nel tempo")
+
+                    # Usiamo la potenza media come proxy di FTP per valutare il trend
+                    # (con l'aggregazione attiva: media pesata sul tempo di ogni periodo)
+                    if freq is None:
+                        trend_df = df_summary[["Data", "Potenza Avg (W)"]].copy()
+                    else:
+                        trend_df = df_roll[["Periodo", "Potenza Avg (W)"]].rename(columns={"Periodo": "Data"})
+                    trend_df["W/kg"] = trend_df["Potenza Avg (W)"] / trend_weight
+
+                    # Tabella di sintesi del miglioramento
+                    st.dataframe(
+                        trend_df.rename(columns={
+                            "Potenza Avg (W)": "Potenza media (W)",
+                            "W/kg": "W/kg (media)"
+                        }),
+                        use_container_width=True
+                    )
+
+                    # Delta tra prima e ultima uscita (o periodo) come indicatore di miglioramento
+                    first = trend_df.iloc[0]
+                    last = trend_df.iloc[-1]
+                    delta_ftp = last["Potenza Avg (W)"] - first["Potenza Avg (W)"]
+                    delta_wkg = last["W/kg"] - first["W/kg"]
+
+                    c1, c2 = st.columns(2)
+                    c1.metric(
+                        "Δ Potenza media (proxy FTP)",
+                        f"{delta_ftp:+.0f} W",
+                        help="Differenza tra la potenza media dell'ultima uscita (o periodo) e la prima nelle attività selezionate."
+                    )
+                    c2.metric(
+                        "Δ W/kg",
+                        f"{delta_wkg:+.2f} W/kg",
+                        help="Differenza del rapporto peso/potenza medio (W/kg) tra prima e ultima uscita."
+                    )
+
+                # 5. Medie a FTP per ogni sessione (un punto per uscita, potenza fissata a trend_ftp)
+                st.markdown("---")
+                st.subheader("🔍 FC e Cadenza medie a FTP per ogni sessione")
+
+                # FC e cadenza medie in prossimità di trend_ftp (±5%) per ogni attività selezionata,
+                # dall'archivio stagionale: nessun file da rileggere, solo campioni con FC e cadenza
+                with profiling.stage('FC e cadenza a FTP', 'compute', files=len(df_summary)):
+                    low = trend_ftp * 0.95
+                    high = trend_ftp * 1.05
+                    attivi = ('heart_rate', 'cadence')
+                    fc_ftp = archivio.mean_where('heart_rate', 'power', low, high, acts=scelte, positive=attivi)
+                    cad_ftp = archivio.mean_where('cadence', 'power', low, high, acts=scelte, positive=attivi)
+                    ftp_trend_df = pd.DataFrame({
+                        "Data": fc_ftp['Filename'].map(df_summary.set_index('Filename')['Data']),
+                        "FC a FTP (bpm)": fc_ftp['Media'],
+                        "Cadenza a FTP (rpm)": cad_ftp['Media'],
+                    })
+
+                if not ftp_trend_df.empty:
+                    ftp_trend_df = ftp_trend_df.sort_values(by="Data")
+
+                    # Grafico a punti: un punto per uscita, FC vs Cadenza (potenza fissata a FTP)
+                    fig_ftp_rel = px.scatter(
+                        ftp_trend_df,
+                        x="Cadenza a FTP (rpm)",
+                        y="FC a FTP (bpm)",
+                        hover_data=["Data"],
+                        color_discrete_sequence=["red"],
+                        labels={
+                            "Cadenza a FTP (rpm)": "Cadenza media a FTP (rpm)",
+                            "FC a FTP (bpm)": "FC media a FTP (bpm)",
+                        },
+                        opacity=0.9,
+                    )
+                    fig_ftp_rel.update_layout(template="plotly_white")
+                    plot_chart("fig_ftp_rel", fig_ftp_rel)
+            else:
+                st.warning("Nessun dato valido trovato nei file selezionati (mancano campi come timestamp/distance/power, oppure i file sono vuoti).")
+
+# --- PROFILAZIONE (solo admin) ---
+if profiling_enabled():
+    render_profiling_panel(prof)
@@ -0,0 +1,216 @@
+"""
+Benchmark delle fasi di calcolo della dashboard su file FIT sintetici.
+
+Uso:
+    python -m benchmarks.run                      # tutti i casi, confronto con la baseline salvata
+    python -m benchmarks.run --quick              # solo 1h/6h e archivi da 10/100 file
+    python -m benchmarks.run --save-baseline      # salva i tempi correnti come nuova baseline
+
+Attività singole (1h, 6h, 24h a 1Hz): parse (pulizia dati inclusa), cleaning (la sola pulizia),
+summary, summary_fast, summary_tail, power curve, elevation, decoupling, efficiency (EF, Pw:HR e serie EF a finestra mobile), prefix_sums,
+range_stats (100 intervalli), intervals (intervalli sopra soglia e posizione dei migliori sforzi),
+zone_histograms e zone_split (istogrammi per le zone e ripartizione per un FTP), density_grid e
+density_figure (FC/cadenza/potenza a celle, da confrontare con lo scatter in figures), figures.
+summary decodifica tutti i record con fitparse (riferimento), summary_fast usa i totali session
+più la sola colonna potenza, summary_tail la sola coda del file.
+Archivi (10, 100, 1000 file): riepilogo trend con fitparse e con il percorso veloce della dashboard
+(download escluso).
+Esce con codice 1 se almeno una fase è più lenta della baseline oltre la tolleranza.
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic_fit import make_fit_bytes, write_archive
+from engine.cleaning import clean_activity
+from engine.charts import altitude_figure, hr_cadence_density_figure, hr_cadence_power_figure, power_curve_figure
+from engine.batch import TAIL_BYTES
+from engine.fit import load_single_fit, read_records, read_summary, read_summary_tail
+from engine.density import density_grid, density_table
+from engine.efficiency import ef_series, efficiency_metrics
+from engine.intervals import analyse
+from engine.zones import POWER_ZONE_FRACTIONS, activity_histograms, zone_edges, zone_seconds
+from engine.metrics import active_samples, aerobic_decoupling, elevation_gain_m, grade_pct, power_curve, summary_row
+from engine.ranges import index_range, prefix_sums, range_stats
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+ACTIVITY_HOURS = [1, 6, 24]
+ARCHIVE_SIZES = [10, 100, 1000]
+ARCHIVE_FILE_DURATION_S = 1800
+# Sotto questa differenza assoluta (secondi) non segnaliamo regressioni: è rumore di misura
+NOISE_FLOOR_S = 0.005
+
+
+def _timeit(fn, repeat):
+    """Mediana dei tempi di esecuzione (secondi) e ultimo risultato."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times), result
+
+
+def _build_figures(df):
+    """Figure più pesanti della vista singola attività, serializzate come fa Streamlit."""
+    valid_durations, current_pdc = power_curve(df['power'])
+    figs = [power_curve_figure(valid_durations, current_pdc, [None] * len(valid_durations), [None] * len(valid_durations))]
+    if 'altitude_m' in df.columns:
+        df = df.assign(grade_pct=grade_pct(df))
+        figs.append(altitude_figure(df))
+    rel_df = df[['heart_rate', 'cadence', 'power']].dropna()
+    rel_df = rel_df[(rel_df['heart_rate'] > 0) & (rel_df['cadence'] > 0)]
+    if not rel_df.empty:
+        figs.append(hr_cadence_power_figure(rel_df))
+    return [fig.to_json() for fig in figs]
+
+
+def _range_queries(ps, n=100):
+    """n selezioni di intervallo su km diversi, come trascinando lo slider."""
+    km = ps['km'][-1]
+    return [range_stats(ps, *index_range(ps, km * i / (2 * n), km * (0.5 + i / (2 * n)))) for i in range(n)]
+
+
+def bench_activity(hours, repeat):
+    """Tempi delle singole fasi per un'attività sintetica di 'hours' ore."""
+    data = make_fit_bytes(duration_s=int(hours * 3600))
+    results = {}
+
+    results['parse'], df = _timeit(lambda: load_single_fit(io.BytesIO(data)), repeat)
+    results['cleaning'], _ = _timeit(lambda: clean_activity(df), repeat)
+    results['summary'], _ = _timeit(lambda: summary_row('bench.fit', read_records(io.BytesIO(data))), repeat)
+    results['summary_fast'], _ = _timeit(lambda: read_summary('bench.fit', data), repeat)
+    results['summary_tail'], _ = _timeit(lambda: read_summary_tail('bench.fit', data[-TAIL_BYTES:]), repeat)
+    results['power_curve'], _ = _timeit(lambda: power_curve(df['power']), repeat)
+    results['elevation'], _ = _timeit(lambda: elevation_gain_m(df['altitude_m']), repeat)
+    results['decoupling'], _ = _timeit(lambda: aerobic_decoupling(active_samples(df)), repeat)
+    results['efficiency'], _ = _timeit(lambda: (efficiency_metrics(df), ef_series(df)), repeat)
+    results['prefix_sums'], ps = _timeit(lambda: prefix_sums(df), repeat)
+    results['range_stats'], _ = _timeit(lambda: _range_queries(ps), repeat)
+    results['intervals'], _ = _timeit(lambda: analyse(df, 230), repeat)
+    results['zone_histograms'], hists = _timeit(lambda: activity_histograms(df), repeat)
+    results['zone_split'], _ = _timeit(lambda: zone_seconds(hists['potenza'], zone_edges(230, POWER_ZONE_FRACTIONS)), repeat)
+    results['density_grid'], grid = _timeit(lambda: density_grid(df), repeat)
+    results['density_figure'], _ = _timeit(lambda: hr_cadence_density_figure(density_table(grid)).to_json(), repeat)
+    results['figures'], _ = _timeit(lambda: _build_figures(df), repeat)
+    return results
+
+
+def bench_archive(n_files, data_dir, repeat):
+    """Tempo del riepilogo trend su un archivio di n_files attività (file già su disco), fitparse e veloce."""
+    paths = write_archive(os.path.join(data_dir, f'archive_{n_files}'), n_files, duration_s=ARCHIVE_FILE_DURATION_S)
+
+    def summarize():
+        rows = []
+        for path in paths:
+            with open(path, 'rb') as fh:
+                row = summary_row(os.path.basename(path), read_records(io.BytesIO(fh.read())))
+            if row is not None:
+                rows.append(row)
+        return rows
+
+    def summarize_fast():
+        rows = []
+        for path in paths:
+            with open(path, 'rb') as fh:
+                row = read_summary(os.path.basename(path), fh.read())
+            if row is not None:
+                rows.append(row)
+        return rows
+
+    elapsed, _ = _timeit(summarize, repeat)
+    elapsed_fast, _ = _timeit(summarize_fast, repeat)
+    return {'summary': elapsed, 'summary_fast': elapsed_fast}
+
+
+def run(hours_list, archive_sizes, data_dir, repeat):
+    """Esegue tutti i casi e restituisce {"caso/fase": secondi}."""
+    results = {}
+    for hours in hours_list:
+        for stage, secs in bench_activity(hours, repeat).items():
+            results[f'activity_{hours}h/{stage}'] = secs
+            print(f"  activity_{hours}h/{stage}: {secs * 1000:.1f} ms", flush=True)
+    for n_files in archive_sizes:
+        # Archivi grandi: una sola ripetizione, il tempo è già lungo e stabile
+        reps = repeat if n_files <= 100 else 1
+        for stage, secs in bench_archive(n_files, data_dir, reps).items():
+            results[f'archive_{n_files}/{stage}'] = secs
+            print(f"  archive_{n_files}/{stage}: {secs * 1000:.1f} ms", flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Righe di confronto con la baseline e lista delle regressioni."""
+    lines = []
+    regressions = []
+    for key, secs in results.items():
+        base = baseline.get(key)
+        if base is None:
+            lines.append(f"{key:<32} {secs * 1000:>10.1f} ms   (nessuna baseline)")
+            continue
+        ratio = secs / base if base > 0 else float('inf')
+        flag = ''
+        if secs > base * (1 + tolerance) and secs - base > NOISE_FLOOR_S:
+            flag = '  <-- REGRESSIONE'
+            regressions.append(key)
+        lines.append(f"{key:<32} {secs * 1000:>10.1f} ms   baseline {base * 1000:>10.1f} ms   x{ratio:.2f}{flag}")
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dashboard su file FIT sintetici")
+    parser.add_argument('--quick', action='store_true', help="solo attività 1h/6h e archivi da 10/100 file")
+    parser.add_argument('--repeat', type=int, default=3, help="ripetizioni per fase (si usa la mediana)")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="file JSON della baseline")
+    parser.add_argument('--save-baseline', action='store_true', help="salva i risultati come nuova baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="rallentamento tollerato (0.25 = +25%%)")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'fitstorage-bench'),
+                        help="cartella per gli archivi sintetici (riutilizzati tra le esecuzioni)")
+    parser.add_argument('--output', help="scrive i risultati anche in questo file JSON")
+    args = parser.parse_args(argv)
+
+    hours_list = ACTIVITY_HOURS[:2] if args.quick else ACTIVITY_HOURS
+    archive_sizes = ARCHIVE_SIZES[:2] if args.quick else ARCHIVE_SIZES
+
+    print("Benchmark in corso...")
+    results = run(hours_list, archive_sizes, args.data_dir, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as fh:
+                baseline = json.load(fh)
+        baseline.update(results)
+        with open(args.baseline, 'w') as fh:
+            json.dump(baseline, fh, indent=2, sort_keys=True)
+        print(f"Baseline salvata in {args.baseline}")
+        return 0
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+    else:
+        print(f"Nessuna baseline in {args.baseline}: usa --save-baseline per crearla.")
+
+    lines, regressions = compare(results, baseline, args.tolerance)
+    print()
+    print("\n".join(lines))
+    if regressions:
+        print(f"\n{len(regressions)} regressioni oltre il {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
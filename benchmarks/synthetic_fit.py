@@ -0,0 +1,236 @@
+"""
+Generatore di file FIT sintetici per i benchmark.
+
+Scrive file FIT validi (header, definizioni, record e CRC) leggibili da fitparse,
+con durata, frequenza di campionamento e campi presenti configurabili.
+Con bryton=True simula i ciclocomputer Bryton: solo 'altitude' (niente enhanced_altitude),
+partenza in quota e primi campioni senza altitudine; i messaggi lap/session non riportano
+il dislivello totale né la Normalized Power.
+"""
+import datetime
+import os
+import struct
+
+import numpy as np
+
+# Epoca FIT: 31/12/1989 00:00 UTC
+FIT_EPOCH = datetime.datetime(1989, 12, 31, tzinfo=datetime.timezone.utc)
+
+# Campi del messaggio 'record' (global 20): nome -> (numero campo, base type FIT, dtype numpy)
+RECORD_FIELDS = {
+    'timestamp': (253, 0x86, '<u4'),
+    'position_lat': (0, 0x85, '<i4'),
+    'position_long': (1, 0x85, '<i4'),
+    'altitude': (2, 0x84, '<u2'),
+    'heart_rate': (3, 0x02, 'u1'),
+    'cadence': (4, 0x02, 'u1'),
+    'distance': (5, 0x86, '<u4'),
+    'speed': (6, 0x84, '<u2'),
+    'power': (7, 0x84, '<u2'),
+    'enhanced_altitude': (78, 0x86, '<u4'),
+}
+# Valori "invalid" FIT per tipo (fitparse li restituisce come None)
+INVALID = {'u1': 0xFF, '<u2': 0xFFFF, '<u4': 0xFFFFFFFF, '<i4': 0x7FFFFFFF}
+
+ALL_FIELDS = ('power', 'heart_rate', 'cadence', 'speed', 'distance', 'enhanced_altitude', 'position')
+BRYTON_MISSING_ALT_SAMPLES = 20
+# Da incrementare quando cambia il contenuto dei file generati (campi, messaggi, valori):
+# write_archive non riusa gli archivi scritti da una versione precedente
+GENERATOR_VERSION = 2
+
+CRC_TABLE = [
+    0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+    0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400,
+]
+
+
+def fit_crc(data, crc=0):
+    """CRC-16 del protocollo FIT."""
+    for byte in data:
+        tmp = CRC_TABLE[crc & 0xF]
+        crc = (crc >> 4) & 0x0FFF
+        crc = crc ^ tmp ^ CRC_TABLE[byte & 0xF]
+        tmp = CRC_TABLE[crc & 0xF]
+        crc = (crc >> 4) & 0x0FFF
+        crc = crc ^ tmp ^ CRC_TABLE[(byte >> 4) & 0xF]
+    return crc
+
+
+def _definition(local_type, global_num, fields):
+    """Messaggio di definizione: fields è una lista di (numero campo, size, base type)."""
+    out = struct.pack('<BBBHB', 0x40 | local_type, 0, 0, global_num, len(fields))
+    for num, size, base_type in fields:
+        out += struct.pack('<BBB', num, size, base_type)
+    return out
+
+
+def synthetic_streams(duration_s, interval_s=1, seed=0, start_alt_m=0.0):
+    """
+    Serie temporali plausibili di un'uscita in bici (unità fisiche, non ancora codificate FIT).
+    Potenza con blocchi a intensità variabile, FC che insegue la potenza, salite sinusoidali.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(0, duration_s, interval_s, dtype=float)
+    n = len(t)
+
+    # Potenza: base endurance + blocchi di 10 minuti a intensità diverse + rumore
+    blocks = rng.choice([0.6, 0.75, 0.9, 1.05, 1.2], size=int(duration_s // 600) + 1)
+    power = 220 * blocks[(t // 600).astype(int)] + rng.normal(0, 25, n)
+    power[rng.random(n) < 0.03] = 0  # discese/soste senza pedalare
+    power = np.clip(power, 0, 1500)
+
+    # FC: risposta esponenziale alla potenza (costante ~60 s) + lenta deriva
+    hr_target = 95 + power * 0.3 + t / 3600 * 2
+    alpha = 1 - np.exp(-interval_s / 60)
+    hr = np.empty(n)
+    level = hr_target[0]
+    for i in range(n):
+        level += alpha * (hr_target[i] - level)
+        hr[i] = level
+    hr = np.clip(hr + rng.normal(0, 1.5, n), 60, 200)
+
+    cadence = np.where(power > 0, np.clip(85 + rng.normal(0, 6, n), 40, 130), 0)
+
+    altitude = start_alt_m + 150 * (1 - np.cos(2 * np.pi * t / 3600)) + 40 * np.sin(2 * np.pi * t / 700)
+    grade = np.gradient(altitude) / np.maximum(interval_s * 8, 1)
+    speed = np.clip(8.5 + (power - 200) / 60 - grade * 40 + rng.normal(0, 0.3, n), 1.0, 20.0)
+    distance = np.cumsum(speed * interval_s)
+
+    # Traccia GPS: giro ad anello di ~15 km attorno a un punto fisso
+    angle = distance / 15000 * 2 * np.pi
+    lat = 45.5 + 0.02 * np.sin(angle)
+    lon = 9.2 + 0.03 * np.cos(angle)
+
+    return {
+        't': t, 'power': power, 'heart_rate': hr, 'cadence': cadence, 'speed': speed,
+        'distance': distance, 'altitude': altitude, 'lat': lat, 'lon': lon,
+    }
+
+
+def _totals_messages(streams, fields, bryton, start_ts, end_ts):
+    """Messaggi lap (global 19) e session (global 18) con i totali dell'uscita, come a fine attività."""
+    t = streams['t']
+    elapsed = float(t[-1] - t[0]) if len(t) else 0.0
+    values = {
+        'start_time': (2, 0x86, '<I', start_ts),
+        'total_elapsed_time': (7, 0x86, '<I', int(round(elapsed * 1000))),
+        'total_timer_time': (8, 0x86, '<I', int(round(elapsed * 1000))),
+    }
+    if 'distance' in fields:
+        dist = float(streams['distance'][-1])
+        values['total_distance'] = (9, 0x86, '<I', int(round(dist * 100)))
+        values['avg_speed'] = (None, 0x84, '<H', int(round(dist / elapsed * 1000)) if elapsed else 0)
+    if 'heart_rate' in fields:
+        values['avg_heart_rate'] = (None, 0x02, '<B', int(round(streams['heart_rate'].mean())))
+    if 'cadence' in fields:
+        cad = streams['cadence'][streams['cadence'] > 0]
+        values['avg_cadence'] = (None, 0x02, '<B', int(round(cad.mean())) if len(cad) else 0)
+    if 'power' in fields:
+        values['avg_power'] = (None, 0x84, '<H', int(round(streams['power'].mean())))
+        if not bryton and len(streams['power']) >= 30:
+            rolled = np.convolve(streams['power'], np.ones(30) / 30, mode='valid')
+            values['normalized_power'] = (None, 0x84, '<H', int(round(np.mean(rolled ** 4) ** 0.25)))
+    if not bryton and ('enhanced_altitude' in fields or 'altitude' in fields):
+        diffs = np.diff(streams['altitude'])
+        values['total_ascent'] = (None, 0x84, '<H', int(round(diffs[diffs > 0].sum())))
+
+    # Numeri di campo diversi tra lap e session per gli stessi valori
+    numbers = {
+        19: {'avg_speed': 13, 'avg_heart_rate': 15, 'avg_cadence': 17, 'avg_power': 19, 'total_ascent': 21, 'normalized_power': 33},
+        18: {'avg_speed': 14, 'avg_heart_rate': 16, 'avg_cadence': 18, 'avg_power': 20, 'total_ascent': 22, 'normalized_power': 34},
+    }
+    out = bytearray()
+    for local, global_num in ((2, 19), (3, 18)):
+        fields_def = [(253, 4, 0x86)]
+        payload = struct.pack('<B', local) + struct.pack('<I', end_ts)
+        for name, (num, base_type, fmt, value) in values.items():
+            num = num if num is not None else numbers[global_num][name]
+            fields_def.append((num, struct.calcsize(fmt), base_type))
+            payload += struct.pack(fmt, value)
+        out += _definition(local, global_num, fields_def)
+        out += payload
+    return bytes(out)
+
+
+def make_fit_bytes(duration_s=3600, interval_s=1, fields=ALL_FIELDS, bryton=False,
+                   start=datetime.datetime(2024, 5, 1, 8, 0, tzinfo=datetime.timezone.utc), seed=0,
+                   session=True):
+    """
+    Crea un file FIT sintetico e restituisce i byte.
+    duration_s: durata in secondi; interval_s: secondi tra due record (1 = 1Hz)
+    fields: campi da includere tra ALL_FIELDS (timestamp sempre presente)
+    bryton: altitudine solo su 'altitude', partenza in quota e primi campioni mancanti
+    session: scrive in coda i messaggi lap e session con i totali
+    """
+    streams = synthetic_streams(duration_s, interval_s, seed=seed, start_alt_m=320.0 if bryton else 0.0)
+    n = len(streams['t'])
+
+    names = ['timestamp']
+    for f in fields:
+        if f == 'position':
+            names += ['position_lat', 'position_long']
+        elif f in ('altitude', 'enhanced_altitude') and bryton:
+            if 'altitude' not in names:
+                names.append('altitude')
+        elif f in RECORD_FIELDS:
+            names.append(f)
+
+    dtype = np.dtype([('header', 'u1')] + [(name, RECORD_FIELDS[name][2]) for name in names])
+    rec = np.zeros(n, dtype=dtype)
+    rec['header'] = 0  # local message 0
+
+    start_ts = int((start - FIT_EPOCH).total_seconds())
+    rec['timestamp'] = start_ts + streams['t'].astype(np.uint32)
+    semicircles = 2**31 / 180
+    if 'position_lat' in names:
+        rec['position_lat'] = np.round(streams['lat'] * semicircles).astype(np.int32)
+        rec['position_long'] = np.round(streams['lon'] * semicircles).astype(np.int32)
+    if 'power' in names: rec['power'] = np.round(streams['power']).astype(np.uint16)
+    if 'heart_rate' in names: rec['heart_rate'] = np.round(streams['heart_rate']).astype(np.uint8)
+    if 'cadence' in names: rec['cadence'] = np.round(streams['cadence']).astype(np.uint8)
+    if 'speed' in names: rec['speed'] = np.round(streams['speed'] * 1000).astype(np.uint16)
+    if 'distance' in names: rec['distance'] = np.round(streams['distance'] * 100).astype(np.uint32)
+    # Altitudine FIT: scala 5, offset 500
+    alt_raw = np.round((streams['altitude'] + 500) * 5)
+    if 'enhanced_altitude' in names: rec['enhanced_altitude'] = alt_raw.astype(np.uint32)
+    if 'altitude' in names:
+        rec['altitude'] = alt_raw.astype(np.uint16)
+        if bryton:
+            rec['altitude'][:BRYTON_MISSING_ALT_SAMPLES] = INVALID['<u2']
+
+    body = bytearray()
+    # file_id (global 0): type=activity, manufacturer=development, time_created
+    body += _definition(1, 0, [(0, 1, 0x00), (1, 2, 0x84), (4, 4, 0x86)])
+    body += struct.pack('<BBHI', 1, 4, 255, start_ts)
+    body += _definition(0, 20, [(RECORD_FIELDS[name][0], np.dtype(RECORD_FIELDS[name][2]).itemsize, RECORD_FIELDS[name][1]) for name in names])
+    body += rec.tobytes()
+    if session and n:
+        body += _totals_messages(streams, fields, bryton, start_ts, int(rec['timestamp'][-1]))
+
+    header = struct.pack('<BBHI4s', 14, 0x20, 2132, len(body), b'.FIT')
+    header += struct.pack('<H', fit_crc(header))
+    data = header + bytes(body)
+    return data + struct.pack('<H', fit_crc(data))
+
+
+def write_archive(directory, n_files, duration_s=1800, interval_s=1, bryton_every=4):
+    """
+    Scrive n_files attività sintetiche in una sottocartella di directory (nomi AAAAMMGG_xxxx.fit,
+    una al giorno). Un file ogni bryton_every simula un ciclocomputer Bryton. Restituisce i percorsi creati.
+    I file già presenti vengono riusati: la sottocartella porta nel nome la versione del generatore
+    e i parametri, così un archivio scritto con un altro formato o altri parametri non viene mai
+    scambiato per quello richiesto.
+    """
+    directory = os.path.join(directory, f"v{GENERATOR_VERSION}_{duration_s}s_{interval_s}i_b{bryton_every}")
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    day0 = datetime.datetime(2024, 1, 1, 8, 0, tzinfo=datetime.timezone.utc)
+    for i in range(n_files):
+        start = day0 + datetime.timedelta(days=i)
+        path = os.path.join(directory, f"{start:%Y%m%d}_{i:04d}.fit")
+        if not os.path.exists(path):
+            bryton = bryton_every > 0 and i % bryton_every == 0
+            with open(path, 'wb') as fh:
+                fh.write(make_fit_bytes(duration_s, interval_s, bryton=bryton, start=start, seed=i))
+        paths.append(path)
+    return paths
@@ -0,0 +1,59 @@
+"""
+Motore di analisi delle attività FIT, indipendente da Streamlit.
+
+Raccoglie parsing dei file e calcolo delle metriche usati dalla dashboard,
+così da poterli riutilizzare anche da benchmark, script batch e worker.
+
+Le funzioni principali sono esportate qui in modo pigro: `from engine import elevation_gain_m`
+carica solo engine.metrics (pandas), mentre fitparse, plotly e le librerie Google
+vengono importati solo quando si usano parsing, grafici o Drive.
+"""
+import importlib
+
+_EXPORTS = {
+    # Parsing FIT
+    'load_single_fit': 'engine.fit',
+    'read_records': 'engine.fit',
+    'read_summary': 'engine.fit',
+    'read_summary_tail': 'engine.fit',
+    # Metriche
+    'TARGETS_SEC': 'engine.metrics',
+    'active_samples': 'engine.metrics',
+    'aerobic_decoupling': 'engine.metrics',
+    'calculate_ftp_estimate': 'engine.metrics',
+    'calculate_ftp_from_activities': 'engine.metrics',
+    'elevation_gain_m': 'engine.metrics',
+    'format_duration': 'engine.metrics',
+    'grade_pct': 'engine.metrics',
+    'normalized_power': 'engine.metrics',
+    'power_curve': 'engine.metrics',
+    'summary_row': 'engine.metrics',
+    'training_load': 'engine.metrics',
+    'training_stress_score': 'engine.metrics',
+    # Grafici (plotly)
+    'altitude_figure': 'engine.charts',
+    'hr_cadence_power_figure': 'engine.charts',
+    'power_curve_figure': 'engine.charts',
+    # Google Drive
+    'build_service': 'engine.drive',
+    'download_file': 'engine.drive',
+    'download_range': 'engine.drive',
+    'file_size': 'engine.drive',
+    'list_fit_files': 'engine.drive',
+    'list_fit_metadata': 'engine.drive',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module 'engine' has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,297 @@
+"""
+Archivio stagionale a colonne: tutti i campioni di tutte le attività in array concatenati.
+
+Ogni canale è un file binario (float32, timestamp in float64) nella cartella 'stagione'
+dell'archivio locale; index.json dice dove inizia e quanto è lunga ogni attività (offset, n)
+più data e km. L'archivio cresce solo in coda: aggiungere un'uscita scrive i suoi campioni alla
+fine di ogni file e poi aggiorna l'indice, quindi un'interruzione a metà lascia al massimo byte
+in eccesso, che l'aggiunta successiva tronca. Le aggiunte sono serializzate anche tra processi
+(dashboard, CLI e report sulla stessa cartella) da un lock su file. Ogni voce ricorda l'md5 del file: se il file
+cambia su Drive la nuova versione si aggiunge in coda e la vecchia resta solo come byte
+inutilizzati ('sostituita' nell'indice, esclusa da tutte le query). Lo stesso vale per i
+campioni ripuliti con soglie diverse da quelle in uso (impronta 'pulizia' della voce).
+
+All'apertura i canali vengono mappati in memoria (np.memmap): niente viene letto finché una
+query non lo tocca. Le query ("secondi sopra 300 W", "FC a 250 W nel tempo", "miglior 5 minuti
+sulle uscite oltre 100 km") sono operazioni NumPy su tutta la stagione, raggruppate per attività
+con bincount e reduceat invece di caricare i file uno alla volta.
+"""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from engine import store
+from engine.cleaning import rules_key
+
+ARCHIVE_DIR = 'stagione'
+INDEX_FILE = os.path.join(ARCHIVE_DIR, 'index.json')
+# Da incrementare quando cambiano canali, tipi su disco o voci dell'indice
+ARCHIVE_VERSION = 1
+# Lock tra processi per aggiunta in coda e scrittura dell'indice
+LOCK_FILE = os.path.join(ARCHIVE_DIR, 'append.lock')
+
+# Canale -> tipo su disco. 'dt' è la durata di ogni campione (s), per pesare tempi e medie
+CHANNELS = {
+    'timestamp': np.float64,
+    'dt': np.float32,
+    'power': np.float32,
+    'heart_rate': np.float32,
+    'cadence': np.float32,
+    'speed_kmh': np.float32,
+    'altitude_m': np.float32,
+    'distance': np.float32,
+}
+ARCHIVE_FIT_FIELDS = ['power', 'heart_rate', 'cadence', 'speed', 'enhanced_speed', 'altitude', 'enhanced_altitude', 'distance']
+# Oltre questo intervallo tra due campioni il dispositivo era in pausa (come per le zone)
+ARCHIVE_MAX_GAP_S = 10
+
+_append_lock = threading.Lock()
+
+
+def archive_columns(df):
+    """
+    Canali dell'archivio da un DataFrame di record (load_single_fit o colonne grezze di FitScan),
+    come dict di array della stessa lunghezza; NaN dove il canale manca. None senza timestamp.
+    """
+    if df.empty or 'timestamp' not in df.columns:
+        return None
+    n = len(df)
+    times = pd.to_datetime(df['timestamp'])
+    if times.dt.tz is not None:
+        times = times.dt.tz_convert(None)
+    # Secondi dal 1970 indipendenti dalla risoluzione del datetime (s, ms o ns)
+    secs = (times - pd.Timestamp(0)).dt.total_seconds().to_numpy()
+    steps = np.diff(secs)
+    typical = float(np.median(steps[steps > 0])) if (steps > 0).any() else 1.0
+    steps = np.where((steps <= 0) | (steps > ARCHIVE_MAX_GAP_S) | np.isnan(steps), typical, steps)
+
+    def pick(*names, scale=1.0):
+        for name in names:
+            if name in df.columns and df[name].notna().any():
+                return df[name].astype(float).to_numpy() * scale
+        return np.full(n, np.nan)
+
+    return {
+        'timestamp': secs,
+        'dt': np.append(steps, typical),
+        'power': pick('power'),
+        'heart_rate': pick('heart_rate'),
+        'cadence': pick('cadence'),
+        'speed_kmh': pick('speed_kmh') if 'speed_kmh' in df.columns else pick('enhanced_speed', 'speed', scale=3.6),
+        'altitude_m': pick('altitude_m', 'enhanced_altitude', 'altitude'),
+        'distance': pick('distance'),
+    }
+
+
+class SeasonArchive:
+    """Canali concatenati di tutte le attività, mappati in memoria, con indice per attività."""
+
+    def __init__(self, index=None):
+        self.index = index or []
+        self.columns = {}
+        self._map()
+
+    @classmethod
+    def open(cls):
+        """Apre l'archivio salvato (vuoto al primo avvio) mappando i canali in memoria."""
+        return cls(store.read_json(INDEX_FILE, []))
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def samples(self):
+        return self.index[-1]['offset'] + self.index[-1]['n'] if self.index else 0
+
+    def _path(self, channel):
+        return store.cache_path(ARCHIVE_DIR, f"{channel}.bin")
+
+    def _map(self):
+        total = self.samples
+        self.columns = {}
+        for channel, dtype in CHANNELS.items():
+            if total == 0:
+                self.columns[channel] = np.zeros(0, dtype=dtype)
+            else:
+                self.columns[channel] = np.memmap(self._path(channel), dtype=dtype, mode='r', shape=(total,))
+        self._ids = None
+        # Nome -> posizione della versione corrente: has() e select() senza scorrere l'indice
+        self._names = {a['filename']: i for i, a in enumerate(self.index) if not a.get('sostituita')}
+
+    def has(self, filename, md5=None):
+        """
+        True se l'attività è in archivio con le soglie di pulizia in uso (e con lo stesso contenuto,
+        se md5 è indicato). Le voci salvate senza md5 valgono per qualsiasi contenuto.
+        """
+        i = self._names.get(filename)
+        if i is None or self.index[i].get('pulizia') != rules_key():
+            return False
+        saved = self.index[i].get('md5')
+        return not md5 or not saved or saved == md5
+
+    def append(self, filename, columns, md5=None):
+        """
+        Aggiunge in coda i campioni di un'attività (dict di archive_columns). False se era già
+        presente (stesso md5 e stesse soglie di pulizia) o senza campioni; altrimenti la voce
+        precedente viene marcata come sostituita. Le aggiunte concorrenti (thread e processi) sono serializzate.
+        """
+        if columns is None or not len(columns['timestamp']):
+            return False
+        with _append_lock, store.file_lock(LOCK_FILE):
+            # Un'altra sessione o un altro processo può averla aggiunta nel frattempo: si rilegge l'indice
+            self.index = store.read_json(INDEX_FILE, [])
+            self._map()
+            if self.has(filename, md5):
+                return False
+            if filename in self._names:
+                self.index[self._names[filename]]['sostituita'] = True
+            offset = self.samples
+            n = len(columns['timestamp'])
+            for channel, dtype in CHANNELS.items():
+                path = self._path(channel)
+                size = offset * np.dtype(dtype).itemsize
+                # Byte oltre l'indice (aggiunta interrotta) vengono scartati prima di scrivere
+                if os.path.exists(path) and os.path.getsize(path) > size:
+                    os.truncate(path, size)
+                with open(path, 'ab') as fh:
+                    fh.write(np.asarray(columns[channel], dtype=dtype).tobytes())
+            distance = columns['distance'][~np.isnan(columns['distance'])]
+            self.index.append({
+                'filename': filename,
+                'data': pd.Timestamp(columns['timestamp'][0], unit='s').isoformat(),
+                'offset': offset,
+                'n': n,
+                'km': round(float(distance.max()) / 1000, 2) if distance.size else 0.0,
+                'durata_min': round(float(np.sum(columns['dt'])) / 60, 1),
+                'md5': md5,
+                'pulizia': rules_key(),
+            })
+            store.write_json(INDEX_FILE, self.index)
+            self._map()
+        return True
+
+    def activity_frame(self, filename, channels=None):
+        """
+        Campioni di un'attività (versione corrente) come DataFrame dei canali indicati, con
+        timestamp come datetime: per i calcoli per attività senza rileggere il file. None se assente.
+        """
+        i = self._names.get(filename)
+        if i is None:
+            return None
+        a = self.index[i]
+        rows = slice(a['offset'], a['offset'] + a['n'])
+        frame = {}
+        for channel in channels or list(CHANNELS):
+            values = np.asarray(self.columns[channel][rows])
+            frame[channel] = pd.to_datetime(values, unit='s') if channel == 'timestamp' else values.astype(float)
+        return pd.DataFrame(frame)
+
+    # --- Query ---
+
+    def activities(self):
+        """Indice come DataFrame (Filename, Data, km, durata), una riga per attività."""
+        return pd.DataFrame(
+            [{'Filename': a['filename'], 'Data': pd.Timestamp(a['data']), 'Distanza (km)': a['km'],
+              'Durata (min)': a['durata_min']} for a in self.index],
+            columns=['Filename', 'Data', 'Distanza (km)', 'Durata (min)'],
+        )
+
+    def select(self, filenames=None, min_km=None, since=None, until=None):
+        """Posizioni delle attività che rispettano i filtri (nomi, km minimi, intervallo di date)."""
+        keep = []
+        if filenames is None:
+            positions = sorted(self._names.values())
+        else:
+            positions = sorted({self._names[n] for n in filenames if n in self._names})
+        for i in positions:
+            a = self.index[i]
+            if min_km is not None and a['km'] < min_km:
+                continue
+            date = pd.Timestamp(a['data'])
+            if (since is not None and date < pd.Timestamp(since)) or (until is not None and date > pd.Timestamp(until)):
+                continue
+            keep.append(i)
+        return np.asarray(keep, dtype=np.int64)
+
+    def activity_ids(self):
+        """Posizione dell'attività di ogni campione (calcolata una volta per apertura)."""
+        if self._ids is None:
+            self._ids = np.repeat(np.arange(len(self.index)), [a['n'] for a in self.index])
+        return self._ids
+
+    def _sample_mask(self, acts):
+        chosen = np.zeros(len(self.index), dtype=bool)
+        chosen[acts] = True
+        return chosen[self.activity_ids()]
+
+    def _per_activity(self, acts, values):
+        """Tabella per attività (solo quelle scelte) con una o più colonne di valori per posizione."""
+        table = self.activities().iloc[acts].reset_index(drop=True)
+        for name, v in values.items():
+            table[name] = np.asarray(v)[acts]
+        return table
+
+    @staticmethod
+    def _between(x, lo, hi):
+        mask = ~np.isnan(x)
+        if lo is not None:
+            mask &= x >= lo
+        if hi is not None:
+            mask &= x <= hi
+        return mask
+
+    def time_in_range(self, channel, lo=None, hi=None, acts=None):
+        """Secondi con il canale tra lo e hi (estremi inclusi) per attività: es. tempo sopra 300 W."""
+        acts = self.select() if acts is None else acts
+        if not len(acts):
+            return self._per_activity(acts, {'Secondi': []})
+        mask = self._between(np.asarray(self.columns[channel]), lo, hi) & self._sample_mask(acts)
+        ids = self.activity_ids()
+        secs = np.bincount(ids[mask], weights=np.asarray(self.columns['dt'])[mask], minlength=len(self.index))
+        return self._per_activity(acts, {'Secondi': secs})
+
+    def mean_where(self, channel, by, lo=None, hi=None, acts=None, positive=()):
+        """
+        Media di 'channel' (pesata sulla durata dei campioni) quando 'by' è tra lo e hi, per attività:
+        es. FC media a 240-260 W in ogni uscita. Attività senza campioni nella fascia escluse.
+        positive: canali che devono essere > 0 negli stessi campioni (es. FC e cadenza registrate).
+        """
+        acts = self.select() if acts is None else acts
+        if not len(acts):
+            return self._per_activity(acts, {'Media': [], 'Secondi': []})
+        values = np.asarray(self.columns[channel])
+        mask = self._between(np.asarray(self.columns[by]), lo, hi) & ~np.isnan(values) & self._sample_mask(acts)
+        for name in positive:
+            mask &= np.asarray(self.columns[name]) > 0
+        ids = self.activity_ids()[mask]
+        dt = np.asarray(self.columns['dt'])[mask]
+        secs = np.bincount(ids, weights=dt, minlength=len(self.index))
+        total = np.bincount(ids, weights=values[mask] * dt, minlength=len(self.index))
+        means = np.divide(total, secs, out=np.full(len(secs), np.nan), where=secs > 0)
+        table = self._per_activity(acts, {'Media': means, 'Secondi': secs})
+        return table[table['Secondi'] > 0].reset_index(drop=True)
+
+    def best_effort(self, seconds, acts=None):
+        """
+        Miglior potenza media su 'seconds' campioni consecutivi (1Hz, come power_curve) per attività.
+        Una somma cumulativa per attività scelta, sui soli suoi campioni: memoria proporzionale
+        all'uscita più lunga, nessuna finestra a cavallo di due attività.
+        """
+        acts = self.select() if acts is None else acts
+        best = np.full(len(self.index), np.nan)
+        for i in acts:
+            a = self.index[i]
+            if a['n'] < seconds:
+                continue
+            power = np.nan_to_num(np.asarray(self.columns['power'][a['offset']:a['offset'] + a['n']], dtype=np.float64))
+            c = np.concatenate([[0.0], np.cumsum(power)])
+            best[i] = float(np.max(c[seconds:] - c[:-seconds])) / seconds
+        table = self._per_activity(acts, {'Potenza (W)': best})
+        return table.dropna(subset=['Potenza (W)']).reset_index(drop=True)
+
+
+def open_archive():
+    """Archivio stagionale salvato, con i canali mappati in memoria."""
+    return SeasonArchive.open()
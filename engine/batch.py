@@ -0,0 +1,276 @@
+"""
+Elaborazione batch dell'archivio: parsing parallelo e tabelle di riepilogo.
+
+Usa lo stesso parsing (load_single_fit) e le stesse metriche della dashboard,
+così i numeri coincidono con quelli mostrati in Streamlit. Le copie identiche vengono
+saltate prima del parsing (hash del contenuto); le riesportazioni della stessa uscita
+vengono riconosciute dalle impronte e tolte dalle tabelle (engine.dedup).
+"""
+import glob
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from engine import cleaning, dedup
+from engine.efficiency import efficiency_columns, efficiency_metrics
+from engine.fit import load_single_fit, read_summary, read_summary_tail
+from engine.metrics import (
+    TARGETS_SEC,
+    calculate_ftp_from_activities,
+    effort_metrics,
+    normalized_power,
+    power_curve,
+    summary_row,
+    training_load,
+    training_stress_score,
+)
+
+# Byte letti dalla fine del file in modalità solo riepilogo (i messaggi session stanno in coda)
+TAIL_BYTES = 64 * 1024
+
+# Servizio Drive del processo worker (creato una volta dall'initializer)
+_worker_service = None
+
+
+def local_sources(folder):
+    """Lista di tuple (nome_file, percorso) dei file .fit in una cartella locale."""
+    paths = [p for p in glob.glob(os.path.join(folder, '*')) if p.lower().endswith('.fit')]
+    return sorted((os.path.basename(p), p) for p in paths)
+
+
+def drive_sources(service, folder_id):
+    """Lista di tuple (nome_file, file_id) dei file .fit in una cartella Google Drive."""
+    from engine.drive import list_fit_files
+    return sorted(list_fit_files(service, folder_id))
+
+
+def local_hashes(sources):
+    """md5 del contenuto per nome file, leggendo i file locali."""
+    hashes = {}
+    for name, path in sources:
+        with open(path, 'rb') as fh:
+            hashes[name] = dedup.content_hash(fh.read())
+    return hashes
+
+
+def drive_hashes(service, folder_id):
+    """md5 del contenuto per nome file dai metadati Drive, senza scaricare i file."""
+    from engine.drive import list_fit_metadata
+    return {meta['name']: meta['md5'] for meta in list_fit_metadata(service, folder_id).values()}
+
+
+def skip_copies(sources, hashes):
+    """
+    Toglie dalle sorgenti le copie identiche (stesso md5), che non serve decodificare.
+    Restituisce (sorgenti_da_elaborare, {nome_copia: nome_tenuto}).
+    """
+    copies = dedup.duplicates_by_hash({name: hashes.get(name) for name, _ in sources})
+    return [(name, src) for name, src in sources if name not in copies], copies
+
+
+def _init_drive_worker(creds_file):
+    """Initializer dei processi worker: ogni processo ha il proprio client Drive."""
+    global _worker_service
+    from engine.drive import build_service
+    _worker_service = build_service(creds_file=creds_file)
+
+
+def _init_worker(creds_file, rules):
+    """Initializer dei processi worker: soglie di pulizia del processo principale e client Drive."""
+    cleaning.configure(rules)
+    if creds_file:
+        _init_drive_worker(creds_file)
+
+
+def read_source(source):
+    """Dati binari di una sorgente: percorso locale oppure file_id Drive (nel worker)."""
+    if _worker_service is not None:
+        from engine.drive import download_file
+        return download_file(_worker_service, source)
+    with open(source, 'rb') as fh:
+        return io.BytesIO(fh.read())
+
+
+def read_source_tail(source, n_bytes=TAIL_BYTES):
+    """
+    Ultimi n_bytes di una sorgente e dimensione totale del file:
+    lettura parziale (Range HTTP su Drive, seek in locale).
+    """
+    if _worker_service is not None:
+        from engine.drive import download_range, file_size
+        size = file_size(_worker_service, source)
+        return download_range(_worker_service, source, max(0, size - n_bytes), size - 1), size
+    with open(source, 'rb') as fh:
+        size = fh.seek(0, os.SEEK_END)
+        fh.seek(max(0, size - n_bytes))
+        return fh.read(), size
+
+
+def process_summary(filename, source):
+    """
+    Solo riga di riepilogo e NP, leggendo la coda del file quando i totali session bastano;
+    altrimenti scarica il file intero e usa lo scanner veloce. Niente curva di potenza.
+    """
+    try:
+        tail, size = read_source_tail(source)
+        result = read_summary_tail(filename, tail)
+        if result is not None:
+            row, duration_s = result
+            # Dalla sola coda non c'è la traccia: il confronto usa inizio e durata
+            fp = dedup.fingerprint(row, None, [], size)
+        else:
+            data = read_source(source)
+            result = read_summary(filename, data, with_duration=True)
+            if result is None:
+                return {'filename': filename, 'error': "dati mancanti (timestamp)"}
+            row, duration_s = result
+            fp = dedup.fingerprint_fit(row, data)
+        # Stesse colonne per tutte le righe: senza record in coda non ci sono i migliori 5/20 minuti
+        row.pop('Best 5min (W)', None)
+        row.pop('Best 20min (W)', None)
+        return {
+            'filename': filename,
+            'row': row,
+            'np': row['NP (W)'],
+            'duration_s': duration_s,
+            'curve': [],
+            'fingerprint': fp,
+        }
+    except Exception as e:
+        return {'filename': filename, 'error': str(e)}
+
+
+def activity_result(filename, df, md5=None, size=0, durations=TARGETS_SEC):
+    """
+    Risultato di process_activity da un DataFrame già decodificato (es. quello della dashboard);
+    md5 e size servono solo all'impronta per i duplicati. Dict con 'error' se mancano i timestamp.
+    """
+    row = summary_row(filename, df)
+    if row is None:
+        return {'filename': filename, 'error': "dati mancanti (timestamp)"}
+    row.update(effort_metrics(df))
+    row.update(efficiency_columns(efficiency_metrics(df)))
+    duration_s = (df['timestamp'].iloc[-1] - df['timestamp'].iloc[0]).total_seconds()
+    valid_durations, values = power_curve(df['power'], durations)
+    cells = []
+    if 'position_lat' in df.columns and 'position_long' in df.columns:
+        cells = dedup.track_cells(df['position_lat'], df['position_long'])
+    return {
+        'filename': filename,
+        'row': row,
+        'np': normalized_power(df['power']),
+        'duration_s': duration_s,
+        'curve': list(zip(valid_durations, values)),
+        'fingerprint': dedup.fingerprint(row, md5, cells, size),
+        'cleaning': df.attrs.get('pulizia', []),
+    }
+
+
+def analyse_activity(filename, data, durations=TARGETS_SEC):
+    """
+    Risultato di process_activity da dati già letti (BytesIO), più il DataFrame decodificato
+    per chi deve anche disegnare i grafici (report). (dict con 'error', None) se mancano i timestamp.
+    """
+    # Hash e dimensione prima del parsing: fitparse chiude il file
+    md5, size = dedup.content_hash(data), data.getbuffer().nbytes
+    df = load_single_fit(data)
+    res = activity_result(filename, df, md5, size, durations)
+    return res, (None if 'error' in res else df)
+
+
+def process_activity(filename, source, durations=TARGETS_SEC):
+    """
+    Elabora una singola attività: riga di riepilogo trend, curva di potenza,
+    Normalized Power, durata (per il TSS) e impronta per i duplicati.
+    Restituisce un dict con 'error' in caso di problemi.
+    """
+    try:
+        return analyse_activity(filename, read_source(source), durations)[0]
+    except Exception as e:
+        return {'filename': filename, 'error': str(e)}
+
+
+def process_archive(sources, workers=None, creds_file=None, on_progress=None, summary_only=False, task=None):
+    """
+    Elabora in parallelo tutte le sorgenti [(nome_file, sorgente), ...].
+    creds_file: se indicato, le sorgenti sono file_id Drive scaricati dai worker.
+    summary_only: usa process_summary (letture parziali, niente curve di potenza).
+    task: funzione (nome_file, sorgente) -> dict da eseguire al posto delle due precedenti
+    (es. i report di engine.report; deve essere importabile dai processi worker).
+    on_progress(done, total, result) viene chiamato dopo ogni attività.
+    Restituisce i risultati nell'ordine delle sorgenti.
+    """
+    if task is None:
+        task = process_summary if summary_only else process_activity
+    results = {}
+    initargs = (creds_file, cleaning.configured_rules())
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        futures = {pool.submit(task, name, src): name for name, src in sources}
+        for i, fut in enumerate(as_completed(futures), start=1):
+            res = fut.result()
+            results[futures[fut]] = res
+            if on_progress:
+                on_progress(i, len(futures), res)
+    return [results[name] for name, _ in sources]
+
+
+def estimate_ftp(sources, n=5):
+    """FTP stimato sulle ultime N attività in ordine di nome, come nella dashboard."""
+    last = sorted(sources)[-n:]
+    return calculate_ftp_from_activities(load_single_fit(read_source(src)) for _, src in last)
+
+
+def build_tables(results, ftp, copies=None):
+    """
+    Tabelle finali dai risultati dei worker:
+    summary (riepilogo trend + NP/IF/TSS), power_curves (formato lungo), training_load (giornaliero),
+    duplicates (file esclusi perché stessa uscita di un altro) e cleaning (correzioni della pulizia
+    dati per attività). copies: {nome_copia: nome_tenuto} delle copie identiche già saltate
+    da skip_copies.
+    """
+    duplicates = dedup.find_duplicates([res['fingerprint'] for res in results if 'fingerprint' in res])
+    for name, kept in (copies or {}).items():
+        duplicates[name] = (kept, dedup.REASON_CONTENT)
+
+    rows = []
+    curves = []
+    cleaning_rows = []
+    for res in results:
+        if 'row' not in res or res['filename'] in duplicates:
+            continue
+        cleaning_rows.extend({'Filename': res['filename'], **fix} for fix in res.get('cleaning', []))
+        row = dict(res['row'])
+        row['IF'] = round(res['np'] / ftp, 2) if ftp > 0 else 0
+        row['TSS'] = round(training_stress_score(res['duration_s'], res['np'], ftp), 1)
+        rows.append(row)
+        for d, v in res['curve']:
+            curves.append({'Filename': row['Filename'], 'Data': row['Data'], 'Durata (s)': d, 'Potenza (W)': round(float(v), 1)})
+
+    summary = pd.DataFrame(rows)
+    if not summary.empty:
+        summary = summary.sort_values(by='Data').reset_index(drop=True)
+    power_curves = pd.DataFrame(curves, columns=['Filename', 'Data', 'Durata (s)', 'Potenza (W)'])
+    load = training_load(summary['Data'], summary['TSS']) if not summary.empty else training_load([], [])
+    dups = pd.DataFrame(
+        [{'Filename': name, 'Duplicato di': kept, 'Motivo': reason} for name, (kept, reason) in sorted(duplicates.items())],
+        columns=['Filename', 'Duplicato di', 'Motivo'],
+    )
+    cleaned = pd.DataFrame(cleaning_rows, columns=['Filename', 'Regola', 'Campioni', 'Dettaglio'])
+    return {'summary': summary, 'power_curves': power_curves, 'training_load': load, 'duplicates': dups,
+            'cleaning': cleaned}
+
+
+def write_tables(tables, out_dir, fmt='parquet'):
+    """Scrive le tabelle in out_dir come <nome>.parquet o <nome>.csv. Restituisce i percorsi."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for name, df in tables.items():
+        path = os.path.join(out_dir, f"{name}.{fmt}")
+        if fmt == 'parquet':
+            df.to_parquet(path, index=False)
+        else:
+            df.to_csv(path, index=False)
+        paths.append(path)
+    return paths
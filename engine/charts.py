@@ -0,0 +1,257 @@
+"""Costruzione delle figure Plotly più pesanti della dashboard."""
+import plotly.express as px
+import plotly.graph_objects as go
+
+from engine.metrics import format_duration
+from engine.zones import ZONE_COLORS
+
+
+def power_curve_figure(valid_durations, current_pdc, avg_pdc, best_recent_pdc):
+    """Curva di potenza: attività corrente (rossa) vs media e record delle ultime 5."""
+    x_labels = [format_duration(d) for d in valid_durations]
+
+    fig_pdc = go.Figure()
+
+    # 1. Linea MEDIA (Grigio Chiaro, Tratteggiata)
+    if any(v is not None for v in avg_pdc):
+        fig_pdc.add_trace(go.Scatter(
+            x=valid_durations,
+            y=avg_pdc,
+            mode='lines',
+            name='Media (Ultime 5)',
+            line=dict(color='rgba(150, 150, 150, 0.6)', width=2, dash='dash'),
+            hovertemplate="Media: %{y:.0f} W<extra></extra>"
+        ))
+
+    # 2. Linea BEST (Verde, Tratteggiata)
+    if any(v is not None for v in best_recent_pdc):
+        fig_pdc.add_trace(go.Scatter(
+            x=valid_durations,
+            y=best_recent_pdc,
+            mode='lines',
+            name='Record (Ultime 5)',
+            line=dict(color='rgba(46, 204, 64, 0.8)', width=2, dash='dash'), # Verde
+            hovertemplate="Record: %{y:.0f} W<extra></extra>"
+        ))
+
+    # 3. Linea ATTUALE (Rossa, Solida) - SOPRA LE ALTRE
+    fig_pdc.add_trace(go.Scatter(
+        x=valid_durations,
+        y=current_pdc,
+        mode='lines+markers',
+        name='Attività Selezionata',
+        line=dict(color='#FF4136', width=3),
+        marker=dict(size=6),
+        text=x_labels,
+        hovertemplate="<b>%{text}</b><br>Max: %{y:.0f} W<extra></extra>"
+    ))
+
+    fig_pdc.update_layout(
+        xaxis_title="Durata (Scala Logaritmica)",
+        yaxis_title="Potenza Media (Watt)",
+        template="plotly_white",
+        height=500,
+        xaxis=dict(
+            type="log",
+            tickvals=valid_durations,
+            ticktext=x_labels
+        ),
+        hovermode="x unified",
+        legend=dict(orientation="h", y=1.02, x=1, xanchor="right")
+    )
+    return fig_pdc
+
+
+def altitude_figure(df):
+    """Profilo altimetrico con riempimento sempre verso il basso e pendenza in hover."""
+    fig_alt = go.Figure()
+
+    # 1. Preparazione Asse Y
+    if 'distance' in df.columns:
+        x_vals = df["distance"] / 1000
+        x_label = "Distanza (km)"
+    else:
+        x_vals = df["timestamp"]
+        x_label = "Tempo"
+
+    # 2. TRUCCO PER IL RIEMPIMENTO
+    # Calcoliamo il punto più basso e scendiamo ancora un po'
+    min_y = df["altitude_m"].min()
+    margin = (df["altitude_m"].max() - min_y) * 0.1 # 10% di margine
+    floor_value = min_y - margin
+
+    # Aggiungiamo una linea invisibile sul fondo
+    fig_alt.add_trace(go.Scatter(
+        x=x_vals,
+        y=[floor_value] * len(df),
+        mode='lines',
+        line=dict(width=0), # Invisibile
+        showlegend=False,
+        hoverinfo='skip'
+    ))
+
+    # 3. Traccia Principale
+    # Usiamo 'tonexty' che significa "riempi fino alla traccia precedente" (quella invisibile sul fondo)
+    fig_alt.add_trace(go.Scatter(
+        x=x_vals,
+        y=df["altitude_m"],
+        mode='lines',
+        name='Altitudine',
+        fill='tonexty', # <--- ORA RIEMPIE GIÙ FINO AL FONDO (non fino a 0)
+        fillcolor='rgba(255, 140, 0, 0.4)',
+        line=dict(color='#FF8C00', width=2),
+        customdata=df['grade_pct'],
+        hovertemplate="<b>%{x:.2f}</b><br>Alt: %{y:.0f} m<br>Pend: %{customdata:.1f}%<extra></extra>"
+    ))
+
+    fig_alt.update_layout(
+        xaxis_title=x_label,
+        yaxis_title="Altitudine (m)",
+        template="plotly_white",
+        height=400,
+        hovermode="x unified",
+        # Impostiamo il range Y per non vedere troppo spazio vuoto sotto
+        yaxis=dict(range=[floor_value, df["altitude_m"].max() + margin])
+    )
+    return fig_alt
+
+
+def hr_cadence_power_figure(rel_df):
+    """Scatter FC vs cadenza colorato per potenza, con il punto medio evidenziato."""
+    hr_mean = rel_df['heart_rate'].mean()
+    cad_mean = rel_df['cadence'].mean()
+
+    fig_rel = px.scatter(
+        rel_df,
+        x='cadence',
+        y='heart_rate',
+        color='power',
+        color_continuous_scale='Viridis',
+        labels={
+            'cadence': 'Cadenza (rpm)',
+            'heart_rate': 'Frequenza cardiaca (bpm)',
+            'power': 'Potenza (W)'
+        },
+        opacity=0.65
+    )
+    # Punto medio evidenziato in rosso e più grande
+    fig_rel.add_scatter(
+        x=[cad_mean],
+        y=[hr_mean],
+        mode="markers",
+        marker=dict(
+            color="red",
+            size=16,
+            line=dict(color="black", width=1.5)
+        ),
+        name="Media",
+        showlegend=False,
+    )
+
+    fig_rel.update_layout(template="plotly_white")
+    return fig_rel
+
+
+def _compare_x(values, axis):
+    """Asse x dei confronti: km per la distanza, minuti per il tempo."""
+    return (values / 1000, "Distanza (km)") if axis == 'distanza' else (values / 60, "Tempo (min)")
+
+
+def overlay_figure(aligned_by_name, channel, label, axis):
+    """Un canale di più uscite sovrapposte sulla griglia comune (distanza o tempo)."""
+    fig = go.Figure()
+    for name, a in aligned_by_name.items():
+        if channel not in a:
+            continue
+        fig.add_trace(go.Scattergl(x=_compare_x(a['x'], axis)[0], y=a[channel], mode='lines', name=name, line=dict(width=1.5)))
+    fig.update_layout(
+        xaxis_title=_compare_x(0, axis)[1],
+        yaxis_title=label,
+        template="plotly_white",
+        height=350,
+        hovermode="x unified",
+        legend=dict(orientation="h", y=1.02, x=1, xanchor="right")
+    )
+    return fig
+
+
+def gap_figure(gaps, ref_name, axis):
+    """Distacco cumulativo di ogni uscita dal riferimento (secondi per distanza, metri per tempo)."""
+    fig = go.Figure()
+    for name, (x, gap) in gaps.items():
+        fig.add_trace(go.Scatter(x=_compare_x(x, axis)[0], y=gap, mode='lines', name=name))
+    fig.add_hline(y=0, line=dict(color='rgba(150, 150, 150, 0.8)', dash='dash'))
+    fig.update_layout(
+        xaxis_title=_compare_x(0, axis)[1],
+        yaxis_title=f"Distacco da {ref_name} " + ("(s, + = più lento)" if axis == 'distanza' else "(m, + = più avanti)"),
+        template="plotly_white",
+        height=400,
+        hovermode="x unified",
+        legend=dict(orientation="h", y=1.02, x=1, xanchor="right")
+    )
+    return fig
+
+
+def mark_efforts(fig, x, intervals, best=None):
+    """
+    Evidenzia sul grafico della potenza gli intervalli (bande) e un miglior sforzo
+    (segmento alla sua potenza media). x è la colonna dell'asse del grafico, per indice di campione.
+    """
+    for i in intervals:
+        fig.add_vrect(
+            x0=x.iloc[i['i0']], x1=x.iloc[i['i1']],
+            fillcolor='rgba(255, 69, 0, 0.12)', line_width=0, layer='below',
+        )
+    if best:
+        fig.add_trace(go.Scatter(
+            x=[x.iloc[best['i0']], x.iloc[best['i1']]],
+            y=[best['potenza_w'], best['potenza_w']],
+            mode='lines',
+            name=f"Best {format_duration(best['durata_s'])}",
+            line=dict(color='#FF4136', width=3),
+            hovertemplate=f"Best {format_duration(best['durata_s'])}: {best['potenza_w']:.0f} W<extra></extra>",
+        ))
+    return fig
+
+
+def hr_cadence_density_figure(table, color='Potenza media (W)', means=None):
+    """
+    Celle FC x cadenza (density_table) colorate per potenza media o numero di campioni,
+    con il punto medio evidenziato come nello scatter.
+    """
+    grid = table.pivot(index='FC (bpm)', columns='Cadenza (rpm)', values=color)
+    counts = table.pivot(index='FC (bpm)', columns='Cadenza (rpm)', values='Campioni').reindex_like(grid)
+    fig = go.Figure(go.Heatmap(
+        x=grid.columns,
+        y=grid.index,
+        z=grid.to_numpy(),
+        customdata=counts.to_numpy(),
+        colorscale='Viridis',
+        colorbar=dict(title=color),
+        hovertemplate="Cadenza: %{x} rpm<br>FC: %{y} bpm<br>" + color + ": %{z:.0f}<br>Campioni: %{customdata}<extra></extra>",
+    ))
+    if means:
+        fig.add_scatter(
+            x=[means['cadence']],
+            y=[means['heart_rate']],
+            mode="markers",
+            marker=dict(color="red", size=16, line=dict(color="black", width=1.5)),
+            name="Media",
+            showlegend=False,
+        )
+    fig.update_layout(
+        xaxis_title="Cadenza (rpm)",
+        yaxis_title="Frequenza cardiaca (bpm)",
+        template="plotly_white",
+    )
+    return fig
+
+
+def zone_bar_figure(table):
+    """Barre orizzontali del tempo in zona (% e minuti) da una tabella di zone_table."""
+    total = table['Sec'].sum()
+    fig = px.bar(table, x=(table['Sec'] / total) * 100 if total > 0 else table['Sec'], y='Zona', text='Minuti',
+                 orientation='h', color='Zona', color_discrete_sequence=ZONE_COLORS)
+    fig.update_traces(texttemplate='%{text} min', textposition='outside')
+    fig.update_layout(showlegend=False, template="plotly_white", xaxis_title="% Tempo", yaxis_title="")
+    return fig
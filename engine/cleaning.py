@@ -0,0 +1,194 @@
+"""
+Pulizia dei dati all'ingestione: picchi di potenza, buchi di frequenza cardiaca e salti GPS.
+
+Le regole sono vettoriali (mediana mobile, confronti e run di campioni mancanti) e lavorano su
+qualsiasi sottoinsieme di colonne record: DataFrame completo di load_single_fit o sole colonne
+lette con FitScan. clean_activity restituisce il DataFrame corretto e un resoconto per regola
+(campioni toccati e dettaglio), così la dashboard lo salva una volta per attività e tutti i
+grafici, la curva di potenza e la stima FTP partono dagli stessi dati già puliti.
+"""
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+SEMICIRCLE_DEG = 180 / 2 ** 31
+METERS_PER_DEG = 111320
+
+# Soglie predefinite; configure() e clean_activity(df, rules) accettano un dict con le sole chiavi da cambiare
+CLEANING_RULES = {
+    'potenza_max_w': 2000,        # oltre: impossibile, sempre un errore del sensore
+    'picco_finestra': 5,          # campioni della mediana mobile centrata
+    'picco_delta_w': 400,         # picco isolato: sopra la mediana locale di almeno tanto...
+    'picco_rapporto': 2.0,        # ...e di almeno questo fattore
+    'fc_min_bpm': 30,             # sotto: sensore staccato
+    'fc_calo_rapporto': 0.5,      # calo isolato sotto metà della mediana locale
+    'fc_max_buco_s': 30,          # buchi di FC più corti si interpolano, i più lunghi restano vuoti
+    'gps_max_kmh': 120,           # velocità implicita oltre cui un punto GPS è un salto
+    'gps_max_buco_s': 30,
+}
+
+# Soglie impostate da configure(): valgono per tutte le chiamate di clean_activity del processo
+_configured = {}
+
+RULE_LABELS = {
+    'potenza': "Picchi di potenza",
+    'fc': "Buchi frequenza cardiaca",
+    'gps': "Salti GPS",
+}
+
+
+def configure(rules=None):
+    """
+    Imposta le soglie che sostituiscono CLEANING_RULES in questo processo (dashboard: sezione
+    [config.pulizia] dei secrets, CLI e report: --pulizia). ValueError su chiavi sconosciute.
+    Le voci degli archivi locali ricordano rules_key(): dopo un cambio di soglie si ricalcolano.
+    """
+    rules = dict(rules or {})
+    unknown = sorted(set(rules) - set(CLEANING_RULES))
+    if unknown:
+        raise ValueError(f"Soglie di pulizia sconosciute: {', '.join(unknown)}")
+    _configured.clear()
+    _configured.update({key: type(CLEANING_RULES[key])(value) for key, value in rules.items()})
+
+
+def configured_rules():
+    """Soglie impostate con configure() (solo quelle cambiate), da passare ai processi worker."""
+    return dict(_configured)
+
+
+def rules_key():
+    """
+    Impronta delle soglie in uso (predefinite più configurate): ogni voce degli archivi locali
+    la salva, e una voce calcolata con altre soglie non vale più.
+    """
+    rules = {**CLEANING_RULES, **_configured}
+    return hashlib.md5(json.dumps(rules, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def parse_rules(items):
+    """Soglie da argomenti 'chiave=valore' della riga di comando. ValueError se malformati."""
+    rules = {}
+    for item in items or []:
+        key, sep, value = item.partition('=')
+        if not sep or key.strip() not in CLEANING_RULES:
+            raise ValueError(f"Soglia di pulizia non valida: {item} (chiavi: {', '.join(CLEANING_RULES)})")
+        rules[key.strip()] = type(CLEANING_RULES[key.strip()])(value)
+    return rules
+
+
+def _fill_short_gaps(values, max_gap):
+    """Interpola linearmente i run di NaN interni lunghi al massimo max_gap campioni."""
+    missing = np.isnan(values)
+    if not missing.any() or missing.all():
+        return values, 0
+    edges = np.diff(np.concatenate([[0], missing.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    # Solo buchi con un valore valido prima e dopo, non più lunghi di max_gap
+    keep = (starts > 0) & (ends < len(values)) & (ends - starts <= max_gap)
+    fill = np.zeros(len(values), dtype=bool)
+    if keep.any():
+        marks = np.zeros(len(values) + 1, dtype=np.int64)
+        np.add.at(marks, starts[keep], 1)
+        np.add.at(marks, ends[keep], -1)
+        fill = np.cumsum(marks[:-1]) > 0
+    if not fill.any():
+        return values, 0
+    idx = np.arange(len(values))
+    out = values.copy()
+    out[fill] = np.interp(idx[fill], idx[~missing], values[~missing])
+    return out, int(fill.sum())
+
+
+def _sample_step(df):
+    """Passo tipico tra campioni in secondi (1 se mancano i timestamp)."""
+    if 'timestamp' not in df.columns or len(df) < 2:
+        return 1.0
+    steps = np.diff((df['timestamp'] - df['timestamp'].iloc[0]).dt.total_seconds().to_numpy())
+    steps = steps[steps > 0]
+    return float(np.median(steps)) if steps.size else 1.0
+
+
+def clean_power(power, rules):
+    """Picchi oltre il massimo o isolati rispetto alla mediana locale, sostituiti dalla mediana."""
+    values = power.astype(float)
+    median = values.rolling(rules['picco_finestra'], center=True, min_periods=1).median()
+    spikes = (values > rules['potenza_max_w']) | (
+        (values - median > rules['picco_delta_w']) & (values > rules['picco_rapporto'] * median)
+    )
+    n = int(spikes.sum())
+    if not n:
+        return power, None
+    detail = f"max {values[spikes].max():.0f} W → mediana locale"
+    return values.where(~spikes, median.clip(upper=rules['potenza_max_w'])), (n, detail)
+
+
+def clean_heart_rate(hr, rules, step):
+    """Zeri, valori sotto la soglia e cali isolati tolti; buchi brevi interpolati."""
+    values = hr.astype(float)
+    median = values.rolling(5, center=True, min_periods=1).median()
+    bad = (values < rules['fc_min_bpm']) | (values < rules['fc_calo_rapporto'] * median)
+    removed = int(bad.sum())
+    filled_values, filled = _fill_short_gaps(values.where(~bad).to_numpy(), max(int(rules['fc_max_buco_s'] / step), 1))
+    if not removed and not filled:
+        return hr, None
+    # Un valore tolto e poi interpolato è un solo campione cambiato
+    changed = int((bad.to_numpy() | (values.isna().to_numpy() & ~np.isnan(filled_values))).sum())
+    detail = f"{removed} valori anomali tolti, {filled} campioni interpolati"
+    return pd.Series(filled_values, index=hr.index), (changed, detail)
+
+
+def clean_gps(df, rules, step):
+    """
+    Punti GPS a (0, 0) o raggiunti e lasciati a velocità impossibile (andata e ritorno di un
+    singolo punto) tolti e interpolati sui buchi brevi. Restituisce (lat, lon, resoconto).
+    """
+    lat = df['position_lat'].astype(float).to_numpy()
+    lon = df['position_long'].astype(float).to_numpy()
+    if 'timestamp' in df.columns:
+        secs = (df['timestamp'] - df['timestamp'].iloc[0]).dt.total_seconds().to_numpy()
+    else:
+        secs = np.arange(len(df), dtype=float)
+    lat_deg = lat * SEMICIRCLE_DEG
+    dy = np.diff(lat_deg) * METERS_PER_DEG
+    dx = np.diff(lon * SEMICIRCLE_DEG) * METERS_PER_DEG * np.cos(np.radians(np.nan_to_num(lat_deg[1:])))
+    dt = np.maximum(np.diff(secs), step)
+    speed = np.hypot(dx, dy) / dt * 3.6
+    fast = np.nan_to_num(speed, nan=0.0) > rules['gps_max_kmh']
+    jump = np.zeros(len(lat), dtype=bool)
+    jump[1:-1] = fast[:-1] & fast[1:]
+    jump |= (lat == 0) & (lon == 0)
+    removed = int(jump.sum())
+    if not removed:
+        return df['position_lat'], df['position_long'], None
+    max_gap = max(int(rules['gps_max_buco_s'] / step), 1)
+    lat_clean, filled = _fill_short_gaps(np.where(jump, np.nan, lat), max_gap)
+    lon_clean, _ = _fill_short_gaps(np.where(jump, np.nan, lon), max_gap)
+    detail = f"{removed} punti oltre {rules['gps_max_kmh']} km/h, {filled} interpolati"
+    return (pd.Series(lat_clean, index=df.index), pd.Series(lon_clean, index=df.index), (removed, detail))
+
+
+def clean_activity(df, rules=None):
+    """
+    DataFrame record ripulito (copia) e resoconto [{'Regola', 'Campioni', 'Dettaglio'}] delle
+    regole che hanno cambiato qualcosa. rules: soglie da sostituire a CLEANING_RULES e a quelle
+    di configure().
+    """
+    if df.empty:
+        return df, []
+    rules = {**CLEANING_RULES, **_configured, **(rules or {})}
+    step = _sample_step(df)
+    df = df.copy()
+    report = {}
+    if 'power' in df.columns and df['power'].notna().any():
+        df['power'], report['potenza'] = clean_power(df['power'], rules)
+    if 'heart_rate' in df.columns and df['heart_rate'].notna().any():
+        df['heart_rate'], report['fc'] = clean_heart_rate(df['heart_rate'], rules, step)
+    if {'position_lat', 'position_long'} <= set(df.columns) and df['position_lat'].notna().any():
+        df['position_lat'], df['position_long'], report['gps'] = clean_gps(df, rules, step)
+    return df, [
+        {'Regola': RULE_LABELS[key], 'Campioni': n, 'Dettaglio': detail}
+        for key, result in report.items() if result
+        for n, detail in [result]
+    ]
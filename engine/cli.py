@@ -0,0 +1,86 @@
+"""
+Report batch dell'archivio da riga di comando, senza Streamlit.
+
+Uso:
+    python -m engine.cli --folder ./fit --out ./report
+    python -m engine.cli --drive-folder <FOLDER_ID> --credentials credentials.json --out ./report --format csv
+    python -m engine.cli --folder ./fit --out ./report --summary-only
+
+Scrive summary (tabella trend), power_curves (curve di potenza per attività)
+e training_load (TSS giornaliero, CTL/ATL/TSB) in Parquet o CSV, più duplicates con i file
+saltati perché stessa uscita di un altro (le copie identiche non vengono nemmeno decodificate).
+Con --summary-only legge solo la coda dei file (messaggi session): power_curves resta vuota
+e la tabella non ha i migliori 5/20 minuti.
+"""
+import argparse
+import os
+import sys
+
+from engine import batch, cleaning
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report batch sulle attività FIT")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument('--folder', help="cartella locale con i file .fit")
+    src.add_argument('--drive-folder', help="ID della cartella Google Drive")
+    parser.add_argument('--credentials', default='credentials.json',
+                        help="file JSON del Service Account (solo con --drive-folder)")
+    parser.add_argument('--out', required=True, help="cartella di output")
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet')
+    parser.add_argument('--workers', type=int, default=None, help="processi paralleli (default: numero di CPU)")
+    parser.add_argument('--ftp', type=int, default=None,
+                        help="FTP per IF/TSS (default: stimato sulle ultime 5 attività)")
+    parser.add_argument('--summary-only', action='store_true',
+                        help="solo tabella trend dai totali session (letture parziali, senza curve di potenza)")
+    parser.add_argument('--pulizia', action='append', metavar='CHIAVE=VALORE',
+                        help="soglia di pulizia dei dati da cambiare (ripetibile, chiavi di cleaning.CLEANING_RULES)")
+    parser.add_argument('--quiet', action='store_true', help="non mostrare l'avanzamento")
+    args = parser.parse_args(argv)
+    try:
+        cleaning.configure(cleaning.parse_rules(args.pulizia))
+    except ValueError as e:
+        parser.error(str(e))
+
+    creds_file = None
+    if args.drive_folder:
+        if not os.path.exists(args.credentials):
+            parser.error(f"credenziali non trovate: {args.credentials}")
+        creds_file = args.credentials
+        batch._init_drive_worker(creds_file)
+        sources = batch.drive_sources(batch._worker_service, args.drive_folder)
+        hashes = batch.drive_hashes(batch._worker_service, args.drive_folder)
+    else:
+        sources = batch.local_sources(args.folder)
+        hashes = batch.local_hashes(sources)
+    sources, copies = batch.skip_copies(sources, hashes)
+
+    if not sources:
+        print("Nessun file .fit trovato.", file=sys.stderr)
+        return 1
+
+    def progress(done, total, res):
+        if 'error' in res:
+            print(f"Errore durante la lettura del file '{res['filename']}': {res['error']}", file=sys.stderr)
+        if not args.quiet:
+            print(f"\r{done}/{total}", end="", file=sys.stderr, flush=True)
+
+    results = batch.process_archive(sources, workers=args.workers, creds_file=creds_file, on_progress=progress,
+                                    summary_only=args.summary_only)
+    if not args.quiet:
+        print(file=sys.stderr)
+
+    ftp = args.ftp if args.ftp else batch.estimate_ftp(sources)
+    tables = batch.build_tables(results, ftp, copies)
+    for path in batch.write_tables(tables, args.out, args.format):
+        print(path)
+
+    errors = sum(1 for r in results if 'error' in r)
+    print(f"{len(results) - errors} attività elaborate, {errors} errori, "
+          f"{len(tables['duplicates'])} duplicati esclusi, {tables['cleaning']['Filename'].nunique()} attività ripulite, "
+          f"FTP {ftp} W", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
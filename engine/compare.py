@@ -0,0 +1,83 @@
+"""
+Confronto di più uscite allineate per distanza o per tempo trascorso.
+
+Ogni attività viene interpolata (np.interp, vettoriale) su una griglia a passo fisso che parte
+da 0: tutte le uscite condividono gli stessi punti, quindi la griglia di un'attività dipende solo
+dal file e dall'asse e si può mettere in cache da sola. Aggiungere una terza uscita al confronto
+calcola solo la terza.
+"""
+import numpy as np
+import pandas as pd
+
+# Asse -> passo della griglia (metri per la distanza, secondi per il tempo)
+GRID_STEP = {'distanza': 50.0, 'tempo': 10.0}
+COMPARE_CHANNELS = {
+    'power': 'Potenza (W)',
+    'heart_rate': 'FC (bpm)',
+    'speed_kmh': 'Velocità (km/h)',
+    'altitude_m': 'Altitudine (m)',
+}
+
+
+def align_activity(df, axis='distanza', step=None):
+    """
+    Canali dell'attività sulla griglia comune dell'asse ('distanza' o 'tempo'):
+    dict con 'x' (metri o secondi dall'inizio), 'secondi' e 'metri' trascorsi a ogni punto
+    e i canali di COMPARE_CHANNELS presenti. None se l'asse non è disponibile (es. distanza su rulli).
+    """
+    if df.empty or 'timestamp' not in df.columns:
+        return None
+    step = step or GRID_STEP[axis]
+    secs = (df['timestamp'] - df['timestamp'].iloc[0]).dt.total_seconds().to_numpy()
+    metres = None
+    if 'distance' in df.columns and df['distance'].notna().any():
+        # Distanza monotona: i glitch all'indietro renderebbero ambigua l'interpolazione
+        metres = np.maximum.accumulate(df['distance'].astype(float).ffill().fillna(0).to_numpy())
+
+    base = metres if axis == 'distanza' else secs
+    if base is None or base[-1] <= 0:
+        return None
+    grid = np.arange(0, base[-1] + step / 2, step)
+    grid = grid[grid <= base[-1]]
+
+    aligned = {'x': grid, 'secondi': np.interp(grid, base, secs)}
+    if metres is not None:
+        aligned['metri'] = np.interp(grid, base, metres)
+    for col in COMPARE_CHANNELS:
+        if col not in df.columns:
+            continue
+        values = df[col].astype(float).to_numpy()
+        valid = ~np.isnan(values)
+        if valid.sum() >= 2:
+            aligned[col] = np.interp(grid, base[valid], values[valid])
+    return aligned
+
+
+def gap_curve(ref, other, axis='distanza'):
+    """
+    Distacco cumulativo di 'other' rispetto a 'ref' sui punti comuni della griglia.
+    Per distanza: secondi di ritardo (positivo = più lento) a ogni metro.
+    Per tempo: metri di vantaggio (positivo = più avanti) a ogni secondo; None senza distanza.
+    """
+    n = min(len(ref['x']), len(other['x']))
+    if axis == 'distanza':
+        return ref['x'][:n], other['secondi'][:n] - ref['secondi'][:n]
+    if 'metri' not in ref or 'metri' not in other:
+        return None
+    return ref['x'][:n], other['metri'][:n] - ref['metri'][:n]
+
+
+def comparison_table(aligned_by_name):
+    """Riepilogo delle uscite confrontate: distanza, durata e medie dei canali sulla griglia."""
+    rows = []
+    for name, a in aligned_by_name.items():
+        row = {
+            'Attività': name,
+            'Distanza (km)': round(float(a['metri'][-1]) / 1000, 2) if 'metri' in a else 0,
+            'Durata (min)': round(float(a['secondi'][-1]) / 60, 1),
+        }
+        for col, label in COMPARE_CHANNELS.items():
+            if col != 'altitude_m':
+                row[label.replace(' (', ' Avg (')] = round(float(np.mean(a[col])), 1) if col in a else 0
+        rows.append(row)
+    return pd.DataFrame(rows)
@@ -0,0 +1,46 @@
+"""
+Curve di potenza salvate per attività: miglior potenza media per ogni durata di TARGETS_SEC.
+
+La curva si calcola una volta per file (nel passaggio unico della vista trend o all'apertura
+nella vista singola) e si salva con l'md5 del file e la versione del formato: lo storico
+"media e best delle ultime uscite" della vista singola la rilegge invece di decodificare di
+nuovo ogni file, e lo snapshot dell'archivio locale la conserva tra un riavvio e l'altro.
+"""
+from engine import store
+from engine.cleaning import rules_key
+
+CURVES_FILE = 'power_curves.json'
+# Da incrementare quando cambiano le durate o il modo di calcolare la curva
+CURVE_VERSION = 1
+
+
+def load_power_curves():
+    """Curve salvate per file: {nome_file: {'md5', 'versione', 'curva': {durata_s: watt}}}."""
+    return store.read_json(CURVES_FILE, {})
+
+
+def save_power_curves(curves):
+    store.write_json(CURVES_FILE, curves)
+
+
+def curve_entry(durations, values, md5):
+    """Voce per la curva (durate valide e valori di power_curve); chiavi in stringa per il JSON."""
+    return {
+        'md5': md5,
+        'versione': CURVE_VERSION,
+        'pulizia': rules_key(),
+        'curva': {str(int(d)): round(float(v), 1) for d, v in zip(durations, values)},
+    }
+
+
+def stored_curve(saved, filename, md5):
+    """
+    Curva salvata {durata_s: watt} se il contenuto (md5), il formato e le soglie di pulizia sono
+    quelli correnti, altrimenti None. Senza md5 non si può sapere se il file è cambiato: si ricalcola.
+    """
+    entry = saved.get(filename)
+    if not md5 or not entry or entry.get('md5') != md5 or entry.get('versione') != CURVE_VERSION:
+        return None
+    if entry.get('pulizia') != rules_key():
+        return None
+    return {int(d): v for d, v in entry['curva'].items()}
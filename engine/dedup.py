@@ -0,0 +1,163 @@
+"""
+Riconoscimento delle attività duplicate nella cartella (stessa uscita esportata due volte).
+
+Due livelli di impronta, calcolati all'ingestione:
+- hash del contenuto (md5, lo stesso che Drive espone come md5Checksum): copie identiche,
+  riconoscibili già dall'elenco dei file senza scaricarli;
+- inizio, durata e traccia: riesportazioni da piattaforme diverse, con byte diversi ma
+  stessa uscita. La traccia è l'insieme delle celle di una griglia (~TRACK_CELL_M metri)
+  toccate dal GPS; due tracce coincidono se condividono almeno TRACK_OVERLAP delle celle.
+
+Di ogni gruppo di duplicati resta il file più grande (di solito l'export del ciclocomputer,
+con più campi), a parità il primo in ordine di nome.
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from engine.fitscan import FitScan
+
+# Tolleranze per considerare due file la stessa uscita
+DUP_START_TOL_S = 120
+DUP_DURATION_TOL = 0.10
+TRACK_CELL_M = 100
+TRACK_OVERLAP = 0.8
+
+SEMICIRCLE_DEG = 180 / 2 ** 31
+METERS_PER_DEG = 111320
+
+REASON_CONTENT = "contenuto identico"
+REASON_RIDE = "stessa uscita"
+
+
+def content_hash(data):
+    """md5 esadecimale dei dati binari (bytes o BytesIO), confrontabile con md5Checksum di Drive."""
+    if hasattr(data, 'getvalue'):
+        data = data.getvalue()
+    return hashlib.md5(data).hexdigest()
+
+
+def track_cells(lat, lon, cell_m=TRACK_CELL_M):
+    """
+    Celle della griglia toccate dalla traccia (lat/lon in semicerchi FIT, NaN ammessi),
+    come lista ordinata di interi. Lista vuota senza GPS.
+    """
+    lat = np.asarray(lat, dtype=float) * SEMICIRCLE_DEG
+    lon = np.asarray(lon, dtype=float) * SEMICIRCLE_DEG
+    valid = ~(np.isnan(lat) | np.isnan(lon))
+    if not valid.any():
+        return []
+    lat, lon = lat[valid], lon[valid]
+    step_lat = cell_m / METERS_PER_DEG
+    step_lon = step_lat / max(np.cos(np.radians(np.mean(lat))), 0.01)
+    iy = np.floor(lat / step_lat).astype(np.int64)
+    ix = np.floor(lon / step_lon).astype(np.int64)
+    return np.unique((iy << 32) + (ix & 0xFFFFFFFF)).tolist()
+
+
+def track_overlap(cells_a, cells_b):
+    """Quota di celle in comune rispetto alla traccia più corta (0-1)."""
+    if not cells_a or not cells_b:
+        return 0.0
+    common = np.intersect1d(cells_a, cells_b, assume_unique=True).size
+    return common / min(len(cells_a), len(cells_b))
+
+
+def fingerprint(row, md5, cells, size):
+    """
+    Impronta di un'attività dalla riga trend (summary_row/read_summary), hash, celle e dimensione.
+    md5 None (contenuto non letto) e cells vuote (senza GPS) sono ammessi.
+    """
+    return {
+        'filename': row['Filename'],
+        'md5': md5,
+        'start': pd.Timestamp(row['Data']).isoformat(),
+        'duration_s': float(row.get('Durata (min)', 0) or 0) * 60,
+        'cells': cells,
+        'size': int(size),
+    }
+
+
+def fingerprint_fit(row, data, scan=None):
+    """
+    Impronta di un file FIT già riassunto: hash del contenuto e celle dalla sola traccia GPS.
+    scan: FitScan dello stesso file se già disponibile (evita una seconda scansione).
+    """
+    if hasattr(data, 'getvalue'):
+        data = data.getvalue()
+    if scan is None:
+        scan = FitScan(data)
+    cells = []
+    if {'position_lat', 'position_long'} <= set(scan.record_fields()):
+        pos = scan.record_columns(['position_lat', 'position_long'])
+        cells = track_cells(pos['position_lat'], pos['position_long'])
+    return fingerprint(row, content_hash(data), cells, len(data))
+
+
+def same_ride(a, b):
+    """True se due impronte (con hash diversi) descrivono la stessa uscita."""
+    if abs((pd.Timestamp(a['start']) - pd.Timestamp(b['start'])).total_seconds()) > DUP_START_TOL_S:
+        return False
+    longest = max(a['duration_s'], b['duration_s'])
+    if longest > 0 and abs(a['duration_s'] - b['duration_s']) / longest > DUP_DURATION_TOL:
+        return False
+    # Con GPS su entrambi serve anche la stessa traccia; altrimenti bastano inizio e durata
+    if a['cells'] and b['cells']:
+        return track_overlap(a['cells'], b['cells']) >= TRACK_OVERLAP
+    return True
+
+
+def _keeper(fps):
+    return min(fps, key=lambda fp: (-fp['size'], fp['filename']))
+
+
+def duplicates_by_hash(hashes):
+    """
+    Copie identiche da {nome_file: md5}, prima di scaricare o decodificare.
+    Restituisce {nome_duplicato: nome_tenuto}; si tiene il primo nome in ordine.
+    """
+    first = {}
+    dups = {}
+    for name, md5 in sorted(hashes.items()):
+        if md5 and md5 in first:
+            dups[name] = first[md5]
+        else:
+            first.setdefault(md5, name)
+    return dups
+
+
+def find_duplicates(fingerprints):
+    """
+    Duplicati tra le impronte: {nome_duplicato: (nome_tenuto, motivo)}.
+    Ordina per inizio e confronta solo le uscite partite entro DUP_START_TOL_S (n log n).
+    """
+    fps = sorted(fingerprints, key=lambda fp: (fp['start'], fp['filename']))
+    parent = list(range(len(fps)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    starts = [pd.Timestamp(fp['start']) for fp in fps]
+    for i, a in enumerate(fps):
+        for j in range(i + 1, len(fps)):
+            if (starts[j] - starts[i]).total_seconds() > DUP_START_TOL_S:
+                break
+            if (a['md5'] and a['md5'] == fps[j]['md5']) or same_ride(a, fps[j]):
+                parent[root(j)] = root(i)
+
+    groups = {}
+    for i, fp in enumerate(fps):
+        groups.setdefault(root(i), []).append(fp)
+    result = {}
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        keep = _keeper(members)
+        for fp in members:
+            if fp is not keep:
+                result[fp['filename']] = (keep['filename'], REASON_CONTENT if fp['md5'] and fp['md5'] == keep['md5'] else REASON_RIDE)
+    return result
@@ -0,0 +1,143 @@
+"""
+Griglie di densità FC / cadenza / potenza per il grafico "Frequenza Cardiaca e RPM a potenza".
+
+Invece di mandare al browser un punto per campione, i campioni si raggruppano lato server in
+celle (DENSITY_BINS: rpm, bpm e watt per cella) con numero di campioni e somma della potenza.
+La griglia di un'attività è piccola (qualche migliaio di celle al massimo), si salva per
+attività e le griglie di più uscite si sommano: la stessa figura mostra un'uscita o la
+stagione intera, filtrando per fascia di potenza senza tornare ai campioni.
+"""
+import numpy as np
+import pandas as pd
+
+from engine import store
+from engine.cleaning import rules_key
+
+DENSITY_FILE = 'density.json'
+# Da incrementare quando cambia il formato della griglia salvata
+DENSITY_VERSION = 1
+
+# Ampiezza delle celle per canale
+DENSITY_BINS = {'cadence': 2, 'heart_rate': 2, 'power': 20}
+DENSITY_CHANNELS = list(DENSITY_BINS)
+
+
+def density_grid(df):
+    """
+    Celle occupate da FC e cadenza (> 0) con potenza valida: dict con ampiezze 'bin',
+    'celle' ([indice cadenza, indice FC, indice potenza]), 'campioni' e somma 'potenza' per cella.
+    None se mancano i canali o i campioni validi.
+    """
+    if not set(DENSITY_CHANNELS) <= set(df.columns):
+        return None
+    values = {col: df[col].astype(float).to_numpy() for col in DENSITY_CHANNELS}
+    valid = (values['heart_rate'] > 0) & (values['cadence'] > 0) & ~np.isnan(values['power'])
+    if not valid.any():
+        return None
+    idx = np.stack([
+        (np.maximum(values[col][valid], 0) // width).astype(np.int64)
+        for col, width in DENSITY_BINS.items()
+    ], axis=1)
+    cells, inverse = np.unique(idx, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    return {
+        'bin': dict(DENSITY_BINS),
+        'celle': cells.tolist(),
+        'campioni': np.bincount(inverse).tolist(),
+        'potenza': np.round(np.bincount(inverse, weights=values['power'][valid]), 1).tolist(),
+    }
+
+
+def _frame(grid):
+    cells = np.asarray(grid['celle'], dtype=np.int64).reshape(-1, len(DENSITY_CHANNELS))
+    frame = pd.DataFrame(cells, columns=DENSITY_CHANNELS)
+    frame['campioni'] = grid['campioni']
+    frame['potenza_sum'] = grid['potenza']
+    return frame
+
+
+def merge_grids(grids):
+    """Somma di più griglie (stesse ampiezze di cella); None e griglie vuote ignorati."""
+    frames = [_frame(g) for g in grids if g and g['celle'] and g['bin'] == DENSITY_BINS]
+    if not frames:
+        return None
+    total = pd.concat(frames).groupby(DENSITY_CHANNELS, as_index=False)[['campioni', 'potenza_sum']].sum()
+    return {
+        'bin': dict(DENSITY_BINS),
+        'celle': total[DENSITY_CHANNELS].to_numpy().tolist(),
+        'campioni': total['campioni'].tolist(),
+        'potenza': total['potenza_sum'].round(1).tolist(),
+    }
+
+
+def power_range(grid):
+    """Potenza minima e massima (estremi delle celle) presenti nella griglia."""
+    p_idx = [c[2] for c in grid['celle']]
+    width = grid['bin']['power']
+    return min(p_idx) * width, (max(p_idx) + 1) * width
+
+
+def density_table(grid, power_min=None, power_max=None):
+    """
+    Celle FC x cadenza (centro della cella) con numero di campioni e potenza media,
+    limitate ai campioni con potenza tra power_min e power_max (per cella da 20 W).
+    """
+    frame = _frame(grid)
+    width = grid['bin']
+    p_low = frame['power'] * width['power']
+    if power_min is not None:
+        frame = frame[p_low + width['power'] > power_min]
+        p_low = p_low[frame.index]
+    if power_max is not None:
+        frame = frame[p_low <= power_max]
+    table = frame.groupby(['cadence', 'heart_rate'], as_index=False)[['campioni', 'potenza_sum']].sum()
+    return pd.DataFrame({
+        'Cadenza (rpm)': (table['cadence'] + 0.5) * width['cadence'],
+        'FC (bpm)': (table['heart_rate'] + 0.5) * width['heart_rate'],
+        'Campioni': table['campioni'],
+        'Potenza media (W)': (table['potenza_sum'] / table['campioni']).round(0),
+    })
+
+
+def table_means(table):
+    """FC, cadenza e potenza medie pesate sui campioni, dai centri delle celle (punto medio del grafico)."""
+    n = table['Campioni'].sum()
+    if n == 0:
+        return None
+    return {
+        'heart_rate': float((table['FC (bpm)'] * table['Campioni']).sum() / n),
+        'cadence': float((table['Cadenza (rpm)'] * table['Campioni']).sum() / n),
+        'power': float((table['Potenza media (W)'] * table['Campioni']).sum() / n),
+    }
+
+
+def load_density_grids():
+    """Griglie salvate per attività: {nome_file: griglia}."""
+    return store.read_json(DENSITY_FILE, {})
+
+
+def save_density_grids(grids):
+    store.write_json(DENSITY_FILE, grids)
+
+
+def grid_entry(grid, md5):
+    """
+    Voce salvata per un'attività: la griglia con l'md5 del file e l'impronta delle soglie di
+    pulizia. Senza FC, cadenza o potenza si
+    salva una griglia vuota, così il file non si rilegge a ogni analisi per scoprirlo di nuovo.
+    """
+    empty = {'bin': dict(DENSITY_BINS), 'celle': [], 'campioni': [], 'potenza': []}
+    return dict(grid or empty, md5=md5, versione=DENSITY_VERSION, pulizia=rules_key())
+
+
+def stored_grid(saved, filename, md5=None):
+    """
+    Griglia salvata per l'attività se ha formato, ampiezze di cella e soglie di pulizia correnti e,
+    con md5 indicato, viene dallo stesso contenuto del file; altrimenti None.
+    """
+    grid = saved.get(filename)
+    if not grid or grid.get('versione') != DENSITY_VERSION or grid.get('bin') != DENSITY_BINS:
+        return None
+    if grid.get('pulizia') != rules_key():
+        return None
+    return grid if not md5 or grid.get('md5') == md5 else None
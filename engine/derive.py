@@ -0,0 +1,66 @@
+"""
+Prodotti derivati di un file FIT in un solo passaggio, per la vista trend.
+
+Scaricare un file da Drive costa più di qualsiasi calcolo sui suoi byte: tutti i prodotti
+salvati per attività (PRODUCT_FIELDS: riga trend con l'impronta dei duplicati, griglia di densità,
+canali dell'archivio stagionale, traccia dei segmenti...) si ricavano dallo stesso download, da una sola scansione
+(FitScan) e da una sola pulizia delle colonne record. Chi chiama chiede solo i prodotti che
+mancano negli archivi locali, così un file si scarica al massimo una volta.
+Quello che dipende dall'FTP (intervalli, medie a FTP) si ricava poi dall'archivio stagionale.
+"""
+from engine import dedup
+from engine.archive import ARCHIVE_FIT_FIELDS, archive_columns
+from engine.density import DENSITY_CHANNELS, density_grid
+from engine.efficiency import efficiency_columns, efficiency_metrics
+from engine.fit import scan_channels, summary_from_scan
+from engine.fitscan import FitScan
+from engine.metrics import power_curve
+from engine.segments import TRACK_FIT_FIELDS, simplify_track
+from engine.zones import ZONE_CHANNELS, activity_histograms
+
+# Prodotto -> campi record necessari (oltre a timestamp)
+PRODUCT_FIELDS = {
+    'riga': ['power', 'heart_rate'],
+    'curva': ['power'],
+    'zone': list(ZONE_CHANNELS),
+    'densita': DENSITY_CHANNELS,
+    'archivio': ARCHIVE_FIT_FIELDS,
+    'traccia': TRACK_FIT_FIELDS,
+}
+PRODUCTS = tuple(PRODUCT_FIELDS)
+
+
+def derive_fit(filename, data, products=PRODUCTS):
+    """
+    {prodotto: valore} per i prodotti richiesti di un file FIT (bytes o BytesIO):
+    'riga' è (riga trend con EF e Pw:HR, impronta), None se il file non ha né totali né timestamp;
+    'curva' è (durate valide, valori) di power_curve ([], [] senza potenza);
+    'zone' sono gli istogrammi di activity_histograms ({} senza potenza né FC);
+    'densita' è la griglia di density_grid (None senza FC, cadenza o potenza);
+    'archivio' sono le colonne di archive_columns (None senza timestamp);
+    'traccia' è la traccia di simplify_track per i segmenti (None senza GPS).
+    """
+    data = data.getvalue() if hasattr(data, 'getvalue') else data
+    scan = FitScan(data)
+    fields = sorted({f for p in products for f in PRODUCT_FIELDS[p]})
+    columns = scan_channels(scan, ['timestamp'] + fields)
+    derived = {}
+    if 'riga' in products:
+        row = summary_from_scan(filename, scan)
+        if row is not None:
+            # EF e Pw:HR all'ingestione: il trend dell'efficienza non rilegge i file
+            row.update(efficiency_columns(efficiency_metrics(columns)))
+            derived['riga'] = row, dedup.fingerprint_fit(row, data, scan)
+        else:
+            derived['riga'] = None
+    if 'curva' in products:
+        derived['curva'] = power_curve(columns['power']) if 'power' in columns else ([], [])
+    if 'zone' in products:
+        derived['zone'] = activity_histograms(columns)
+    if 'densita' in products:
+        derived['densita'] = density_grid(columns)
+    if 'archivio' in products:
+        derived['archivio'] = archive_columns(columns)
+    if 'traccia' in products:
+        derived['traccia'] = simplify_track(columns)
+    return derived
@@ -0,0 +1,90 @@
+"""
+Accesso a Google Drive con Service Account, senza Streamlit.
+
+Le librerie Google vengono importate solo alla prima chiamata, così chi usa
+il motore senza Drive (benchmark, file locali) non ne paga il costo.
+"""
+import io
+
+SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
+FIT_QUERY = "'{folder_id}' in parents and mimeType != 'application/vnd.google-apps.folder' and name contains '.fit'"
+# File per pagina di files().list (massimo consentito da Drive; senza pageSize sono 100)
+LIST_PAGE_SIZE = 1000
+
+
+def build_service(creds_info=None, creds_file=None):
+    """
+    Crea il servizio Drive v3 da un dict di credenziali (es. secrets) o da un file JSON.
+    Solleva ValueError se non è disponibile nessuna delle due.
+    """
+    from google.oauth2 import service_account
+    from googleapiclient.discovery import build
+
+    if creds_info:
+        creds = service_account.Credentials.from_service_account_info(creds_info, scopes=SCOPES)
+    elif creds_file:
+        creds = service_account.Credentials.from_service_account_file(creds_file, scopes=SCOPES)
+    else:
+        raise ValueError("Credenziali Google non trovate.")
+    return build('drive', 'v3', credentials=creds)
+
+
+def _list_files(service, folder_id, file_fields):
+    """Tutti i file .fit della cartella, pagina per pagina finché Drive restituisce nextPageToken."""
+    query = FIT_QUERY.format(folder_id=folder_id)
+    files, token = [], None
+    while True:
+        results = service.files().list(
+            q=query, pageSize=LIST_PAGE_SIZE, pageToken=token,
+            fields=f"nextPageToken, files({file_fields})",
+        ).execute()
+        files.extend(results.get('files', []))
+        token = results.get('nextPageToken')
+        if not token:
+            return files
+
+
+def list_fit_files(service, folder_id):
+    """Lista di tuple (nome_file, file_id) dei file .fit nella cartella."""
+    return [(f['name'], f['id']) for f in _list_files(service, folder_id, "id, name")]
+
+
+def list_fit_metadata(service, folder_id):
+    """
+    Metadati dei file .fit nella cartella: {file_id: {'name', 'md5', 'size'}}.
+    md5Checksum permette di riconoscere le copie identiche senza scaricarle.
+    """
+    return {
+        f['id']: {'name': f['name'], 'md5': f.get('md5Checksum'), 'size': int(f.get('size', 0) or 0)}
+        for f in _list_files(service, folder_id, "id, name, md5Checksum, size")
+    }
+
+
+def download_file(service, file_id):
+    """Scarica un file e restituisce un BytesIO posizionato all'inizio."""
+    from googleapiclient.http import MediaIoBaseDownload
+
+    request = service.files().get_media(fileId=file_id)
+    file_data = io.BytesIO()
+    downloader = MediaIoBaseDownload(file_data, request)
+    done = False
+    while done is False:
+        status, done = downloader.next_chunk()
+    file_data.seek(0)
+    return file_data
+
+
+def file_size(service, file_id):
+    """Dimensione in byte di un file Drive (0 se non disponibile)."""
+    meta = service.files().get(fileId=file_id, fields="size").execute()
+    return int(meta.get('size', 0) or 0)
+
+
+def download_range(service, file_id, start, end):
+    """
+    Scarica solo i byte [start, end] (estremi inclusi) di un file tramite l'header HTTP Range.
+    Usato per leggere la coda dei file FIT, dove si trovano i messaggi session.
+    """
+    request = service.files().get_media(fileId=file_id)
+    request.headers['Range'] = f"bytes={start}-{end}"
+    return request.execute()
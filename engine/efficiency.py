@@ -0,0 +1,83 @@
+"""
+Fattore di efficienza (EF = Potenza / FC) e disaccoppiamento aerobico con somme cumulative.
+
+efficiency_metrics dà gli stessi valori di aerobic_decoupling (metà dei campioni attivi, stessa
+soglia dei 10 minuti) più l'EF dell'intera uscita, con due somme cumulative invece di filtrare
+il DataFrame. Si calcola all'ingestione di ogni attività e finisce nella riga della tabella trend
+(colonne EF e Pw:HR), quindi negli aggregati salvati: il trend dell'archivio non rilegge i FIT.
+ef_series è l'EF su una finestra mobile di campioni attivi, per vedere dove cala nell'uscita.
+"""
+import numpy as np
+import pandas as pd
+
+# Stesse soglie di active_samples/aerobic_decoupling
+EF_MIN_POWER_W = 10
+EF_MIN_HR_BPM = 60
+EF_MIN_ACTIVE = 600
+EF_WINDOW_S = 600
+
+EF_COLUMNS = ['EF', 'Pw:HR (%)']
+
+
+def _active(df):
+    """Potenza e FC dei soli campioni attivi, come array, più i relativi timestamp se presenti."""
+    power = df['power'].astype(float).to_numpy()
+    hr = df['heart_rate'].astype(float).to_numpy()
+    mask = (power > EF_MIN_POWER_W) & (hr > EF_MIN_HR_BPM)
+    times = df['timestamp'].to_numpy()[mask] if 'timestamp' in df.columns else None
+    return power[mask], hr[mask], times
+
+
+def efficiency_metrics(df):
+    """
+    EF complessivo, EF delle due metà e disaccoppiamento (%) dei campioni attivi.
+    Stesse chiavi di aerobic_decoupling più 'ef'; None senza potenza/FC o sotto i 10 minuti attivi.
+    """
+    if 'power' not in df.columns or 'heart_rate' not in df.columns:
+        return None
+    power, hr, _ = _active(df)
+    n = len(power)
+    if n <= EF_MIN_ACTIVE:
+        return None
+    p_sum = np.cumsum(power)
+    h_sum = np.cumsum(hr)
+    mid = n // 2
+    p1, hr1 = p_sum[mid - 1] / mid, h_sum[mid - 1] / mid
+    p2, hr2 = (p_sum[-1] - p_sum[mid - 1]) / (n - mid), (h_sum[-1] - h_sum[mid - 1]) / (n - mid)
+    ef1 = p1 / hr1 if hr1 > 0 else 0
+    ef2 = p2 / hr2 if hr2 > 0 else 0
+    return {
+        'ef': float(p_sum[-1] / h_sum[-1]) if h_sum[-1] > 0 else 0.0,
+        'p1': float(p1), 'hr1': float(hr1), 'ef1': float(ef1),
+        'p2': float(p2), 'hr2': float(hr2), 'ef2': float(ef2),
+        'decoupling': float((ef1 - ef2) / ef1 * 100) if ef1 > 0 else 0.0,
+    }
+
+
+def efficiency_columns(metrics):
+    """Colonne EF e Pw:HR (%) per la riga trend (0 se l'attività non ha abbastanza dati)."""
+    if metrics is None:
+        return {'EF': 0.0, 'Pw:HR (%)': 0.0}
+    return {'EF': round(metrics['ef'], 3), 'Pw:HR (%)': round(metrics['decoupling'], 1)}
+
+
+def ef_series(df, window=EF_WINDOW_S):
+    """
+    EF sulle ultime 'window' posizioni di campioni attivi (rapporto tra somme, non media dei
+    rapporti), con potenza e FC medie sulla stessa finestra. DataFrame vuoto sotto una finestra.
+    """
+    if 'power' not in df.columns or 'heart_rate' not in df.columns:
+        return pd.DataFrame(columns=['timestamp', 'power', 'heart_rate', 'EF'])
+    power, hr, times = _active(df)
+    if len(power) < window:
+        return pd.DataFrame(columns=['timestamp', 'power', 'heart_rate', 'EF'])
+    p_sum = np.concatenate([[0.0], np.cumsum(power)])
+    h_sum = np.concatenate([[0.0], np.cumsum(hr)])
+    p_win = p_sum[window:] - p_sum[:-window]
+    h_win = h_sum[window:] - h_sum[:-window]
+    return pd.DataFrame({
+        'timestamp': times[window - 1:] if times is not None else np.arange(window - 1, len(power)),
+        'power': p_win / window,
+        'heart_rate': h_win / window,
+        'EF': p_win / h_win,
+    })
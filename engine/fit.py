@@ -0,0 +1,198 @@
+"""
+Lettura dei file FIT e normalizzazione delle colonne.
+
+load_single_fit decodifica tutti i record con fitparse (vista singola attività); read_summary
+e read_summary_tail usano lo scanner di engine.fitscan per la tabella trend, leggendo i totali
+dai messaggi session/lap e solo le colonne dei record che servono davvero. read_channels dà le
+colonne record scelte già ripulite (engine.cleaning) per le metriche calcolate senza fitparse.
+"""
+import pandas as pd
+
+from engine import profiling
+from engine.cleaning import clean_activity
+from engine.fitscan import MESG_LAP, MESG_SESSION, FitScan, find_session_in_tail
+from engine.metrics import effort_metrics, summary_row
+
+
+def read_records(file_data):
+    """Decodifica tutti i messaggi 'record' di un file FIT in un DataFrame grezzo."""
+    # Import pigro: fitparse serve solo quando si decodifica davvero un file
+    import fitparse
+
+    fitfile = fitparse.FitFile(file_data)
+    return pd.DataFrame([{field.name: field.value for field in record} for record in fitfile.get_messages("record")])
+
+
+def load_single_fit(file_data):
+    """
+    Carica i dati completi di un singolo file da dati binari, ripuliti da picchi di potenza,
+    buchi di FC e salti GPS. Il resoconto della pulizia è in df.attrs['pulizia'].
+    """
+    try:
+        with profiling.stage('fitparse', 'parse'):
+            df = read_records(file_data)
+
+        with profiling.stage('normalizza colonne', 'derive'):
+            if 'timestamp' in df.columns:
+                df['timestamp'] = pd.to_datetime(df['timestamp'])
+                start = df['timestamp'].iloc[0]
+                df['minuti_trascorsi'] = (df['timestamp'] - start).dt.total_seconds() / 60
+
+            if 'speed' in df.columns: df['speed_kmh'] = df['speed'] * 3.6
+            # Altitudine: Bryton/cyclocomputer possono avere enhanced_altitude o altitude; nessun fillna(0)
+            # per non creare falsi salti da 0 alla prima quota reale (Bryton parte spesso da quota > 0)
+            if 'enhanced_altitude' in df.columns and df['enhanced_altitude'].notna().any():
+                df['altitude_m'] = df['enhanced_altitude'].astype(float).ffill().bfill()
+            elif 'altitude' in df.columns and df['altitude'].notna().any():
+                df['altitude_m'] = df['altitude'].astype(float).ffill().bfill()
+            elif 'enhanced_altitude' in df.columns:
+                df['altitude_m'] = df['enhanced_altitude'].astype(float).ffill().bfill()
+            elif 'altitude' in df.columns:
+                df['altitude_m'] = df['altitude'].astype(float).ffill().bfill()
+            if 'altitude_m' in df.columns and df['altitude_m'].isna().any():
+                df['altitude_m'] = df['altitude_m'].fillna(0)
+            if 'power' not in df.columns:
+                df['power'] = 0
+
+        # Una sola pulizia all'ingestione: il resoconto viaggia con il DataFrame (anche in cache)
+        with profiling.stage('pulizia dati', 'derive'):
+            df, report = clean_activity(df)
+            df.attrs['pulizia'] = report
+
+        return df
+    except Exception as e:
+        return pd.DataFrame()
+
+
+# Campi del riepilogo trend -> colonne dei record da cui ricalcolarli se session/lap non li riportano
+SUMMARY_FALLBACK_COLUMNS = {
+    'Distanza (km)': ['distance'],
+    'Velocità Avg (km/h)': ['speed'],
+    'Potenza Avg (W)': ['power'],
+    'Cadenza Avg (rpm)': ['cadence'],
+    'FC Avg (bpm)': ['heart_rate'],
+    'Dislivello (m)': ['enhanced_altitude', 'altitude'],
+    'Durata (min)': [],
+    'Data': [],
+}
+
+
+def _sum_field(msgs, name):
+    values = [m[name] for m in msgs]
+    return None if not values or any(v is None for v in values) else sum(values)
+
+
+def _weighted_field(msgs, name):
+    """Media pesata sul tempo di più session/lap (None se manca anche in uno solo)."""
+    values = [m[name] for m in msgs]
+    if not values or any(v is None for v in values):
+        return None
+    weights = [m['total_timer_time'] or m['total_elapsed_time'] or 0 for m in msgs]
+    if sum(weights) <= 0:
+        return sum(values) / len(values)
+    return sum(v * w for v, w in zip(values, weights)) / sum(weights)
+
+
+def session_totals(msgs):
+    """
+    Campi del riepilogo trend dai messaggi session (o lap): None dove il dispositivo non li scrive.
+    Più messaggi (multisport o lap) vengono sommati o mediati sul tempo.
+    """
+    if not msgs:
+        return {k: None for k in SUMMARY_FALLBACK_COLUMNS}
+    starts = [m['start_time'] for m in msgs if m['start_time'] is not None]
+    dist = _sum_field(msgs, 'total_distance')
+    elapsed = _sum_field(msgs, 'total_elapsed_time')
+    speed = _weighted_field(msgs, 'enhanced_avg_speed')
+    if speed is None:
+        speed = _weighted_field(msgs, 'avg_speed')
+    return {
+        'Data': min(starts) if starts else None,
+        'Distanza (km)': dist / 1000 if dist is not None else None,
+        'Velocità Avg (km/h)': speed * 3.6 if speed is not None else None,
+        'Potenza Avg (W)': _weighted_field(msgs, 'avg_power'),
+        'Cadenza Avg (rpm)': _weighted_field(msgs, 'avg_cadence'),
+        'FC Avg (bpm)': _weighted_field(msgs, 'avg_heart_rate'),
+        'Dislivello (m)': _sum_field(msgs, 'total_ascent'),
+        'Durata (min)': elapsed / 60 if elapsed is not None else None,
+    }
+
+
+def _format_summary(filename, totals):
+    """Riga nel formato di summary_row (valori mancanti a 0, come per i file Bryton)."""
+    t = {k: (0 if v is None else v) for k, v in totals.items()}
+    return {
+        'Filename': filename, 'Data': pd.Timestamp(t['Data']), 'Distanza (km)': round(float(t['Distanza (km)']), 2),
+        'Velocità Avg (km/h)': round(float(t['Velocità Avg (km/h)']), 1), 'Potenza Avg (W)': int(t['Potenza Avg (W)']),
+        'Cadenza Avg (rpm)': int(t['Cadenza Avg (rpm)']), 'FC Avg (bpm)': int(t['FC Avg (bpm)']),
+        'Dislivello (m)': int(t['Dislivello (m)']), 'Durata (min)': int(t['Durata (min)'])
+    }
+
+
+def read_summary(filename, file_data, efforts=True, with_duration=False):
+    """
+    Riga della tabella trend senza decodificare tutto il file: i totali vengono dai messaggi
+    session (o lap) e solo i campi mancanti si ricalcolano dalle colonne dei record necessarie.
+    Con efforts=True aggiunge NP e migliori 5/20 minuti (serve la sola colonna potenza).
+    Con with_duration=True restituisce (riga, durata_s) con la durata esatta, per il TSS.
+    Restituisce None se il file non ha né totali né timestamp.
+    """
+    data = file_data.getvalue() if hasattr(file_data, 'getvalue') else file_data
+    return summary_from_scan(filename, FitScan(data), efforts, with_duration)
+
+
+def summary_from_scan(filename, scan, efforts=True, with_duration=False):
+    """read_summary su un file già scandito (FitScan), per chi ne ricava anche altri prodotti."""
+    totals = session_totals(scan.messages(MESG_SESSION) or scan.messages(MESG_LAP))
+
+    missing = [k for k, v in totals.items() if v is None]
+    available = set(scan.record_fields())
+    if missing and 'timestamp' in available:
+        columns = {'timestamp'}
+        for key in missing:
+            columns.update(c for c in SUMMARY_FALLBACK_COLUMNS[key] if c in available)
+        records = scan.record_columns(sorted(columns))
+        fallback = summary_row(filename, records)
+        if fallback is None:
+            return None
+        for key in missing:
+            totals[key] = fallback[key]
+        if 'Durata (min)' in missing:
+            totals['Durata (min)'] = (records['timestamp'].iloc[-1] - records['timestamp'].iloc[0]).total_seconds() / 60
+    elif totals['Data'] is None:
+        return None
+
+    row = _format_summary(filename, totals)
+    if efforts:
+        row.update(effort_metrics(scan_channels(scan, ['power'])))
+    return (row, totals['Durata (min)'] * 60) if with_duration else row
+
+
+def scan_channels(scan, names):
+    """Colonne record indicate (solo quelle presenti, timestamp sempre) ripulite come all'ingestione."""
+    available = set(scan.record_fields())
+    columns = scan.record_columns([n for n in names if n == 'timestamp' or n in available])
+    return clean_activity(columns)[0]
+
+
+def read_channels(file_data, names):
+    """scan_channels su un file FIT (bytes o BytesIO), senza decodificare gli altri campi."""
+    data = file_data.getvalue() if hasattr(file_data, 'getvalue') else file_data
+    return scan_channels(FitScan(data), names)
+
+
+def read_summary_tail(filename, tail):
+    """
+    Riga della tabella trend dai soli ultimi byte del file (lettura parziale), dove i dispositivi
+    scrivono i messaggi session. Restituisce (riga, durata_s) con 'NP (W)' dal messaggio session
+    (0 se il dispositivo non lo scrive), oppure None se i totali nel frammento non bastano:
+    in quel caso serve il file intero (read_summary).
+    """
+    sessions = find_session_in_tail(tail)
+    totals = session_totals(sessions)
+    # Senza questi campi non possiamo evitare i record; sensori assenti (potenza, FC, cadenza) valgono 0
+    if any(totals[k] is None for k in ('Data', 'Distanza (km)', 'Durata (min)', 'Dislivello (m)')):
+        return None
+    row = _format_summary(filename, totals)
+    row['NP (W)'] = int(_weighted_field(sessions, 'normalized_power') or 0)
+    return row, totals['Durata (min)'] * 60
@@ -0,0 +1,306 @@
+"""
+Lettura rapida dei file FIT senza decodificare ogni messaggio.
+
+fitparse costruisce un oggetto per ogni campo di ogni messaggio: per il solo riepilogo
+è lavoro sprecato. FitScan percorre gli header dei messaggi, salta i dati per dimensione
+e decodifica solo session/lap; dei record estrae con NumPy le sole colonne richieste.
+"""
+import struct
+
+import numpy as np
+import pandas as pd
+
+# Secondi tra epoca Unix ed epoca FIT (31/12/1989 00:00 UTC)
+FIT_EPOCH_S = 631065600
+
+MESG_SESSION = 18
+MESG_LAP = 19
+MESG_RECORD = 20
+
+# Base type FIT (5 bit bassi) -> (dtype NumPy senza endianness, valore invalido; None = NaN)
+BASE_TYPES = {
+    0: ('u1', 0xFF), 1: ('i1', 0x7F), 2: ('u1', 0xFF), 3: ('i2', 0x7FFF), 4: ('u2', 0xFFFF),
+    5: ('i4', 0x7FFFFFFF), 6: ('u4', 0xFFFFFFFF), 8: ('f4', None), 9: ('f8', None),
+    10: ('u1', 0), 11: ('u2', 0), 12: ('u4', 0), 13: ('u1', 0xFF),
+    14: ('i8', 0x7FFFFFFFFFFFFFFF), 15: ('u8', 0xFFFFFFFFFFFFFFFF), 16: ('u8', 0),
+}
+
+# Campi del profilo FIT usati qui: numero campo -> (nome, scala, offset)
+PROFILE = {
+    MESG_RECORD: {
+        253: ('timestamp', 1, 0), 0: ('position_lat', 1, 0), 1: ('position_long', 1, 0),
+        2: ('altitude', 5, 500), 3: ('heart_rate', 1, 0), 4: ('cadence', 1, 0),
+        5: ('distance', 100, 0), 6: ('speed', 1000, 0), 7: ('power', 1, 0),
+        73: ('enhanced_speed', 1000, 0), 78: ('enhanced_altitude', 5, 500),
+    },
+    MESG_SESSION: {
+        253: ('timestamp', 1, 0), 2: ('start_time', 1, 0), 7: ('total_elapsed_time', 1000, 0),
+        8: ('total_timer_time', 1000, 0), 9: ('total_distance', 100, 0), 14: ('avg_speed', 1000, 0),
+        16: ('avg_heart_rate', 1, 0), 18: ('avg_cadence', 1, 0), 20: ('avg_power', 1, 0),
+        22: ('total_ascent', 1, 0), 34: ('normalized_power', 1, 0), 124: ('enhanced_avg_speed', 1000, 0),
+    },
+    MESG_LAP: {
+        253: ('timestamp', 1, 0), 2: ('start_time', 1, 0), 7: ('total_elapsed_time', 1000, 0),
+        8: ('total_timer_time', 1000, 0), 9: ('total_distance', 100, 0), 13: ('avg_speed', 1000, 0),
+        15: ('avg_heart_rate', 1, 0), 17: ('avg_cadence', 1, 0), 19: ('avg_power', 1, 0),
+        21: ('total_ascent', 1, 0), 33: ('normalized_power', 1, 0), 110: ('enhanced_avg_speed', 1000, 0),
+    },
+}
+DATETIME_FIELDS = {'timestamp', 'start_time'}
+
+
+class FitScanError(ValueError):
+    """File FIT non valido o troncato."""
+
+
+class _Definition:
+    __slots__ = ('global_num', 'big_endian', 'fields', 'size', 'ts_pos')
+
+    def __init__(self, global_num, big_endian, fields, size):
+        self.global_num = global_num
+        self.big_endian = big_endian
+        # fields: numero campo -> (posizione nel messaggio, size, base type)
+        self.fields = fields
+        self.size = size
+        ts = fields.get(253)
+        self.ts_pos = ts[0] if ts and ts[1] == 4 else None
+
+
+class FitScan:
+    """
+    Indice dei messaggi di un file FIT (o di una sua parte).
+    data: bytes del file; start/end: limiti della zona dati (default: da header).
+    strict=False: si ferma senza errore al primo messaggio con definizione sconosciuta
+    (serve per le letture parziali in coda al file).
+    """
+
+    def __init__(self, data, start=None, end=None, strict=True, wanted=(MESG_SESSION, MESG_LAP, MESG_RECORD)):
+        self.data = data if isinstance(data, (bytes, bytearray)) else bytes(data)
+        if start is None:
+            start, end = self._data_bounds()
+        self.offsets = {g: [] for g in wanted}
+        self.defs = {g: [] for g in wanted}
+        self.timestamps = []   # timestamp FIT di ogni record (anche con header compressi)
+        self._scan(start, end if end is not None else len(self.data), strict, set(wanted))
+
+    def _data_bounds(self):
+        data = self.data
+        if len(data) < 12 or data[8:12] != b'.FIT':
+            raise FitScanError("header FIT non valido")
+        header_size = data[0]
+        data_size = struct.unpack_from('<I', data, 4)[0]
+        end = header_size + data_size
+        if end > len(data):
+            raise FitScanError("file FIT troncato")
+        return header_size, end
+
+    def _scan(self, pos, end, strict, wanted):
+        data = self.data
+        local_defs = {}
+        last_ts = None
+        offsets, defs, timestamps = self.offsets, self.defs, self.timestamps
+        while pos < end:
+            header = data[pos]
+            pos += 1
+            if header & 0x80:
+                # Header con timestamp compresso: tipo locale nei bit 5-6, offset nei 5 bit bassi
+                local = (header >> 5) & 0x03
+                time_offset = header & 0x1F
+                compressed = True
+            elif header & 0x40:
+                pos = self._read_definition(data, pos, header, local_defs)
+                continue
+            else:
+                local = header & 0x0F
+                compressed = False
+
+            d = local_defs.get(local)
+            if d is None:
+                if strict:
+                    raise FitScanError(f"messaggio con tipo locale {local} non definito")
+                return
+            if pos + d.size > end:
+                if strict:
+                    raise FitScanError("messaggio troncato")
+                return
+
+            if compressed and last_ts is not None:
+                ts = (last_ts & ~0x1F) + time_offset
+                if time_offset < (last_ts & 0x1F):
+                    ts += 0x20
+                last_ts = ts
+            elif d.ts_pos is not None:
+                ts = struct.unpack_from('>I' if d.big_endian else '<I', data, pos + d.ts_pos)[0]
+                if ts == 0xFFFFFFFF:
+                    # Timestamp invalido: NaN in record_columns, non una data nel 2125
+                    ts = None
+                else:
+                    last_ts = ts
+            else:
+                ts = last_ts
+
+            if d.global_num in wanted:
+                offsets[d.global_num].append(pos)
+                defs[d.global_num].append(d)
+                if d.global_num == MESG_RECORD:
+                    timestamps.append(ts)
+            pos += d.size
+
+    @staticmethod
+    def _read_definition(data, pos, header, local_defs):
+        if pos + 5 > len(data):
+            raise FitScanError("definizione troncata")
+        big_endian = data[pos + 1] == 1
+        global_num = struct.unpack_from('>H' if big_endian else '<H', data, pos + 2)[0]
+        n_fields = data[pos + 4]
+        pos += 5
+        if pos + 3 * n_fields > len(data):
+            raise FitScanError("definizione troncata")
+        fields = {}
+        size = 0
+        for _ in range(n_fields):
+            num, fsize, base = data[pos], data[pos + 1], data[pos + 2]
+            fields[num] = (size, fsize, base & 0x1F)
+            size += fsize
+            pos += 3
+        if header & 0x20:
+            # Campi developer: contano solo per la dimensione del messaggio
+            if pos >= len(data) or pos + 1 + 3 * data[pos] > len(data):
+                raise FitScanError("definizione troncata")
+            n_dev = data[pos]
+            pos += 1
+            for _ in range(n_dev):
+                size += data[pos + 1]
+                pos += 3
+        local_defs[header & 0x0F] = _Definition(global_num, big_endian, fields, size)
+        return pos
+
+    def messages(self, global_num):
+        """Messaggi session/lap decodificati come dict {nome: valore} (None se invalido)."""
+        profile = PROFILE[global_num]
+        out = []
+        for pos, d in zip(self.offsets.get(global_num, []), self.defs.get(global_num, [])):
+            msg = {}
+            for num, (name, scale, offset) in profile.items():
+                field = d.fields.get(num)
+                msg[name] = self._decode_value(pos, d, field, scale, offset) if field else None
+                if name in DATETIME_FIELDS and msg[name] is not None:
+                    msg[name] = pd.Timestamp(msg[name] + FIT_EPOCH_S, unit='s')
+            out.append(msg)
+        return out
+
+    def _decode_value(self, pos, d, field, scale, offset):
+        fpos, fsize, base = field
+        dtype, invalid = BASE_TYPES.get(base, (None, None))
+        if dtype is None or np.dtype(dtype).itemsize != fsize:
+            return None
+        value = np.frombuffer(self.data, dtype=('>' if d.big_endian else '<') + dtype, count=1, offset=pos + fpos)[0]
+        if (invalid is None and np.isnan(value)) or (invalid is not None and value == invalid):
+            return None
+        return float(value) / scale - offset
+
+    def record_columns(self, names):
+        """
+        Colonne dei messaggi 'record' come DataFrame (stessi nomi e unità di fitparse),
+        estratte in blocco con NumPy. I valori invalidi diventano NaN.
+        """
+        offsets = np.asarray(self.offsets.get(MESG_RECORD, []), dtype=np.int64)
+        defs = self.defs.get(MESG_RECORD, [])
+        n = len(offsets)
+        by_name = {v[0]: (k, v[1], v[2]) for k, v in PROFILE[MESG_RECORD].items()}
+        buf = np.frombuffer(self.data, dtype=np.uint8)
+        # Indici dei record per definizione: in un file possono convivere layout diversi
+        groups = {}
+        for i, d in enumerate(defs):
+            groups.setdefault(d, []).append(i)
+        columns = {}
+        for name in names:
+            if name == 'timestamp':
+                ts = np.array([t if t is not None else np.nan for t in self.timestamps], dtype=float)
+                columns[name] = pd.to_datetime(ts + FIT_EPOCH_S, unit='s')
+                continue
+            num, scale, offset = by_name[name]
+            col = np.full(n, np.nan)
+            present = False
+            for d, idx in groups.items():
+                field = d.fields.get(num)
+                if field is None:
+                    continue
+                fpos, fsize, base = field
+                dtype, invalid = BASE_TYPES.get(base, (None, None))
+                if dtype is None or np.dtype(dtype).itemsize != fsize:
+                    continue
+                idx = np.asarray(idx, dtype=np.int64)
+                raw = buf[(offsets[idx] + fpos)[:, None] + np.arange(fsize)]
+                values = raw.copy().view(('>' if d.big_endian else '<') + dtype).ravel().astype(float)
+                if invalid is not None:
+                    values[values == invalid] = np.nan
+                col[idx] = values / scale - offset
+                present = True
+            if present:
+                columns[name] = col
+        return pd.DataFrame(columns)
+
+    def record_fields(self):
+        """Nomi dei campi record (tra quelli del profilo) presenti in almeno una definizione."""
+        nums = set()
+        for d in set(self.defs.get(MESG_RECORD, [])):
+            nums.update(d.fields)
+        return [name for num, (name, _, _) in PROFILE[MESG_RECORD].items() if num in nums]
+
+
+def find_session_in_tail(tail):
+    """
+    Cerca i messaggi session in un frammento finale del file (lettura parziale).
+    Prova ogni possibile definizione di 'session' nel frammento e restituisce i messaggi
+    della prima che si decodifica in modo coerente, oppure [] se non ce n'è nessuna.
+    """
+    start = 0
+    while True:
+        i = _next_session_definition(tail, start)
+        if i < 0:
+            return []
+        try:
+            scan = FitScan(tail, start=i, end=len(tail) - 2, strict=False, wanted=(MESG_SESSION,))
+            sessions = [s for s in scan.messages(MESG_SESSION)
+                        if s['start_time'] is not None and s['total_elapsed_time'] is not None]
+            if sessions:
+                return sessions
+        except (FitScanError, IndexError, struct.error):
+            pass
+        start = i + 1
+
+
+def _next_session_definition(tail, start):
+    """Posizione del prossimo header di definizione con global message 18 (session), o -1."""
+    best = -1
+    # reserved=0, architettura 0 (little endian, 18 = 12 00) oppure 1 (big endian, 18 = 00 12)
+    for pattern in (b'\x00\x00\x12\x00', b'\x00\x01\x00\x12'):
+        j = tail.find(pattern, start + 1)
+        while j >= 1:
+            header = tail[j - 1]
+            if header & 0xD0 == 0x40 and _plausible_definition(tail, j - 1):
+                break
+            j = tail.find(pattern, j + 1)
+        if j >= 1 and (best < 0 or j - 1 < best):
+            best = j - 1
+    return best
+
+
+def _plausible_definition(tail, i):
+    """Controllo di coerenza dei campi di una definizione candidata."""
+    if i + 6 > len(tail):
+        return False
+    n_fields = tail[i + 5]
+    if n_fields == 0 or i + 6 + 3 * n_fields > len(tail):
+        return False
+    for k in range(n_fields):
+        fsize, base = tail[i + 7 + 3 * k], tail[i + 8 + 3 * k] & 0x1F
+        if fsize == 0:
+            return False
+        if base == 7:   # stringa: qualsiasi lunghezza
+            continue
+        entry = BASE_TYPES.get(base)
+        if entry is None or fsize % np.dtype(entry[0]).itemsize:
+            return False
+    return True
@@ -0,0 +1,181 @@
+"""
+Intervalli di lavoro e posizione dei migliori sforzi in un'attività, in tempo lineare.
+
+detect_intervals liscia la potenza con una media mobile centrata da somme cumulative (i confini
+degli intervalli restano allineati ai dati grezzi), trova i tratti
+sopra soglia (frazione dell'FTP) con un'unica passata vettoriale sui cambi di stato, unisce i
+tratti separati da brevi cali e scarta quelli troppo corti. best_effort_windows restituisce, per
+ogni durata di TARGETS_SEC, dove si trova la finestra migliore (stessi valori di power_curve).
+
+I risultati si salvano per attività nell'archivio locale (intervals.json) insieme all'FTP usato
+e all'md5 del file, così la vista trend mostra numero e durata degli intervalli senza rileggere
+i file; per un altro FTP li ricalcola dai canali dell'archivio stagionale.
+"""
+import numpy as np
+
+from engine import store
+from engine.cleaning import rules_key
+from engine.metrics import TARGETS_SEC
+
+INTERVALS_FILE = 'intervals.json'
+# Da incrementare quando cambia il modo di rilevare intervalli o migliori sforzi
+INTERVALS_VERSION = 1
+
+INTERVAL_THRESHOLD = 0.90   # frazione dell'FTP
+INTERVAL_SMOOTH_S = 10
+INTERVAL_MIN_S = 60
+INTERVAL_MAX_GAP_S = 15
+
+INTERVAL_CHANNELS = ['timestamp', 'power', 'heart_rate', 'distance']
+
+
+def _centered_mean(values, window):
+    """
+    Media mobile centrata su 'window' posizioni con somme cumulative (finestre più corte ai bordi).
+    Una media sulle posizioni precedenti sposterebbe inizio e fine dei tratti di circa 'window' campioni.
+    """
+    c = np.concatenate([[0.0], np.cumsum(values)])
+    idx = np.arange(len(values))
+    lo = np.maximum(idx - window // 2, 0)
+    hi = np.minimum(idx - window // 2 + window, len(values))
+    return (c[hi] - c[lo]) / (hi - lo)
+
+
+def _runs(mask):
+    """Coppie (inizio, fine esclusa) dei tratti True consecutivi."""
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _seconds(df):
+    if 'timestamp' in df.columns:
+        return (df['timestamp'] - df['timestamp'].iloc[0]).dt.total_seconds().to_numpy()
+    return np.arange(len(df), dtype=float)
+
+
+def detect_intervals(df, ftp, threshold=INTERVAL_THRESHOLD, min_s=INTERVAL_MIN_S, max_gap_s=INTERVAL_MAX_GAP_S):
+    """
+    Intervalli con potenza (media mobile centrata di INTERVAL_SMOOTH_S) sopra threshold x FTP.
+    Tratti separati da cali più brevi di max_gap_s diventano un solo intervallo; restano quelli
+    di almeno min_s secondi. Restituisce una lista di dict (indici, inizio/durata in secondi,
+    km di partenza, potenza e FC medie, % FTP).
+    """
+    if 'power' not in df.columns or len(df) < 2 or ftp <= 0:
+        return []
+    power = df['power'].astype(float).fillna(0).to_numpy()
+    secs = _seconds(df)
+    starts, ends = _runs(_centered_mean(power, INTERVAL_SMOOTH_S) >= threshold * ftp)
+    if not starts.size:
+        return []
+
+    # Unione dei tratti separati da cali brevi: un confronto per coppia adiacente
+    gaps = secs[starts[1:]] - secs[ends[:-1] - 1]
+    keep_break = np.concatenate([[True], gaps > max_gap_s])
+    group = np.cumsum(keep_break) - 1
+    g_start = starts[keep_break]
+    g_end = np.zeros(group[-1] + 1, dtype=np.int64)
+    np.maximum.at(g_end, group, ends)
+
+    power_sum = np.concatenate([[0.0], np.cumsum(power)])
+    hr = df['heart_rate'].astype(float).to_numpy() if 'heart_rate' in df.columns else np.full(len(df), np.nan)
+    hr_ok = ~np.isnan(hr)
+    hr_sum = np.concatenate([[0.0], np.cumsum(np.where(hr_ok, hr, 0))])
+    hr_cnt = np.concatenate([[0], np.cumsum(hr_ok)])
+    km = df['distance'].astype(float).ffill().fillna(0).to_numpy() / 1000 if 'distance' in df.columns else None
+
+    intervals = []
+    for i0, i1 in zip(g_start, g_end):
+        duration = secs[i1 - 1] - secs[i0] + 1
+        if duration < min_s:
+            continue
+        p_avg = (power_sum[i1] - power_sum[i0]) / (i1 - i0)
+        n_hr = hr_cnt[i1] - hr_cnt[i0]
+        intervals.append({
+            'i0': int(i0),
+            'i1': int(i1 - 1),
+            'inizio_s': float(secs[i0]),
+            'durata_s': float(duration),
+            'km': round(float(km[i0]), 2) if km is not None else None,
+            'potenza_w': round(float(p_avg), 1),
+            'fc_bpm': round(float((hr_sum[i1] - hr_sum[i0]) / n_hr), 1) if n_hr else 0.0,
+            'pct_ftp': round(float(p_avg / ftp * 100), 1),
+        })
+    return intervals
+
+
+def best_effort_windows(df, durations=TARGETS_SEC):
+    """
+    Posizione della miglior finestra per ogni durata (campioni a 1Hz, come power_curve):
+    lista di dict con durata, potenza, indici e inizio in secondi.
+    """
+    if 'power' not in df.columns:
+        return []
+    power = df['power'].astype(float).fillna(0).to_numpy()
+    secs = _seconds(df)
+    c = np.concatenate([[0.0], np.cumsum(power)])
+    windows = []
+    for d in durations:
+        if d > len(power):
+            continue
+        means = (c[d:] - c[:-d]) / d
+        i0 = int(np.argmax(means))
+        if means[i0] <= 0:
+            continue
+        windows.append({
+            'durata_s': int(d),
+            'potenza_w': round(float(means[i0]), 1),
+            'i0': i0,
+            'i1': i0 + d - 1,
+            'inizio_s': float(secs[i0]),
+        })
+    return windows
+
+
+def interval_summary(intervals):
+    """Numero e durata totale (minuti) degli intervalli, per la tabella trend."""
+    return {
+        'Intervalli': len(intervals),
+        'Tempo in intervalli (min)': round(sum(i['durata_s'] for i in intervals) / 60, 1),
+    }
+
+
+def load_intervals():
+    """Risultati salvati per attività: {nome_file: {'ftp', 'md5', 'versione', 'intervalli', 'best'}}."""
+    return store.read_json(INTERVALS_FILE, {})
+
+
+def save_intervals(results):
+    store.write_json(INTERVALS_FILE, results)
+
+
+def _current(entry):
+    return entry.get('versione') == INTERVALS_VERSION and entry.get('pulizia') == rules_key()
+
+
+def stored_for(results, filename, ftp, md5=None):
+    """
+    Risultato salvato per l'attività se calcolato con lo stesso FTP, con formato e soglie di pulizia
+    correnti e,
+    con md5 indicato, sullo stesso contenuto del file (un file sostituito con lo stesso nome non
+    riusa i vecchi intervalli); altrimenti None.
+    """
+    entry = results.get(filename)
+    if not entry or entry.get('ftp') != ftp or not _current(entry):
+        return None
+    return entry if not md5 or entry.get('md5') == md5 else None
+
+
+def is_current(results, filename, md5):
+    """True se la voce salvata è dello stesso contenuto del file (md5), formato e soglie di pulizia."""
+    entry = results.get(filename) or {}
+    return entry.get('md5') == md5 and _current(entry)
+
+
+def intervals_entry(result, md5):
+    """Voce salvata per un'attività: il risultato di analyse con md5 del file, versione e soglie di pulizia."""
+    return dict(result, md5=md5, versione=INTERVALS_VERSION, pulizia=rules_key())
+
+
+def analyse(df, ftp):
+    """Intervalli e migliori sforzi dell'attività, nel formato salvato in intervals.json."""
+    return {'ftp': ftp, 'intervalli': detect_intervals(df, ftp), 'best': best_effort_windows(df)}
@@ -0,0 +1,245 @@
+"""Metriche calcolate sulle attività (dislivello, FTP, curva di potenza, Pw:HR)."""
+import pandas as pd
+
+# Smoothing altitudine: solo per ciclocomputer/Bryton (partenza in quota). Soglia: prima quota valida > 50 m
+ALT_SMOOTH_WINDOW = 30   # più finestra = dislivello più vicino a riferimento esterno (es. 180 m)
+ALT_SMOOTH_THRESHOLD_M = 50
+# Pendenza max Bryton: solo segmenti lunghi, 95° percentile e cap 25% per evitare 66% da rumore
+GRADE_MIN_DIST_M_BRYTON = 30
+GRADE_MAX_CAP_PCT = 25
+
+# Intervalli critici della curva di potenza (secondi)
+TARGETS_SEC = [
+    1, 5, 10, 30,           # Scatti
+    60, 120, 180, 300,      # 1-5 min
+    600, 1200, 1800, 3600,  # 10-60 min
+    5400, 7200              # Endurance
+]
+
+
+def elevation_gain_m(alt_series, threshold=0):
+    """
+    Calcola dislivello per Indoor/Rulli (Rumore = 0).
+    Sostituzione diretta: somma aritmetica di ogni incremento positivo.
+    """
+    if alt_series is None or len(alt_series) < 2:
+        return 0.0
+
+    # Calcoliamo le differenze punto per punto
+    diffs = alt_series.diff()
+
+    # Sommiamo solo dove la differenza è positiva (> 0)
+    # Nessun filtro, nessuna media mobile: prendiamo tutto.
+    gain = diffs[diffs > 0].sum()
+
+    return gain
+
+
+def calculate_ftp_estimate(df):
+    """Calcola l'FTP stimato come il 95% della miglior potenza media di 20 minuti."""
+    if 'power' in df.columns and df['power'].max() > 0:
+        # Assumendo campionamento a 1Hz, 20 minuti = 1200 record
+        window = 1200
+        if len(df) >= window:
+            mmp20 = df['power'].rolling(window=window).mean().max()
+            return int(mmp20 * 0.95)
+        else:
+            # Se l'attività è più corta di 20 min, facciamo una stima prudenziale sulla potenza media
+            return int(df['power'].mean())
+    return 250
+
+
+def calculate_ftp_from_activities(dfs):
+    """
+    FTP stimato su più attività: concatena quelle con dati di potenza
+    e riutilizza la logica di calculate_ftp_estimate.
+    """
+    dfs = [d for d in dfs if not d.empty and 'power' in d.columns and d['power'].max() > 0]
+    if not dfs:
+        return 250
+    return calculate_ftp_estimate(pd.concat(dfs, ignore_index=True))
+
+
+def normalized_power(power):
+    """
+    Normalized Power (campionamento 1Hz): media mobile a 30 s, media delle quarte potenze,
+    radice quarta. Per attività sotto i 30 s restituisce la potenza media.
+    """
+    pwr_series = power.fillna(0)
+    if len(pwr_series) < 30:
+        return float(pwr_series.mean()) if len(pwr_series) else 0.0
+    rolled = pwr_series.rolling(window=30).mean().dropna()
+    return float((rolled ** 4).mean() ** 0.25)
+
+
+def effort_metrics(df):
+    """Normalized Power e migliori 5/20 minuti di un'attività (colonne aggiuntive della tabella trend)."""
+    if 'power' not in df.columns or df.empty:
+        return {'NP (W)': 0, 'Best 5min (W)': 0, 'Best 20min (W)': 0}
+    durations, values = power_curve(df['power'], [300, 1200])
+    best = dict(zip(durations, values))
+    return {
+        'NP (W)': int(normalized_power(df['power'])),
+        'Best 5min (W)': int(best.get(300, 0)),
+        'Best 20min (W)': int(best.get(1200, 0)),
+    }
+
+
+def training_stress_score(duration_s, np_w, ftp):
+    """TSS = durata(s) x NP x IF / (FTP x 3600) x 100, con IF = NP / FTP."""
+    if ftp <= 0 or np_w <= 0:
+        return 0.0
+    intensity = np_w / ftp
+    return duration_s * np_w * intensity / (ftp * 3600) * 100
+
+
+# Costanti di tempo del carico di allenamento (giorni)
+CTL_DAYS = 42   # Fitness (Chronic Training Load)
+ATL_DAYS = 7    # Fatica (Acute Training Load)
+
+
+def training_load(dates, tss):
+    """
+    Carico di allenamento giornaliero dalle date e dai TSS delle attività.
+    Restituisce un DataFrame con un giorno per riga (anche i giorni di riposo):
+    TSS del giorno, CTL e ATL (medie esponenziali) e TSB = CTL - ATL del giorno precedente.
+    """
+    columns = ['Data', 'TSS', 'CTL', 'ATL', 'TSB']
+    if len(dates) == 0:
+        return pd.DataFrame(columns=columns)
+    daily = pd.Series(list(tss), index=pd.to_datetime(list(dates)).normalize()).groupby(level=0).sum()
+    daily = daily.asfreq('D', fill_value=0)
+    # CTL e ATL partono da 0 il giorno prima della prima attività
+    seeded = pd.concat([pd.Series([0.0], index=[daily.index[0] - pd.Timedelta(days=1)]), daily.astype(float)])
+    ctl = seeded.ewm(alpha=1 / CTL_DAYS, adjust=False).mean()
+    atl = seeded.ewm(alpha=1 / ATL_DAYS, adjust=False).mean()
+    tsb = (ctl - atl).shift(1).iloc[1:]
+    ctl, atl = ctl.iloc[1:], atl.iloc[1:]
+    return pd.DataFrame({
+        'Data': daily.index, 'TSS': daily.values.round(1), 'CTL': ctl.values.round(1),
+        'ATL': atl.values.round(1), 'TSB': tsb.values.round(1),
+    })
+
+
+def format_duration(s):
+    """Etichetta leggibile per una durata in secondi (es. 5s, 20m, 1h 30m)."""
+    if s < 60: return f"{s}s"
+    if s < 3600: return f"{int(s/60)}m"
+    h = int(s/3600)
+    m = int((s%3600)/60)
+    return f"{h}h {m}m" if m > 0 else f"{h}h"
+
+
+def power_curve(power, durations=TARGETS_SEC):
+    """
+    Miglior potenza media per ogni durata (campionamento 1Hz).
+    Restituisce (durate_valide, valori): una durata è valida se l'attività è abbastanza lunga
+    e il valore è > 0.
+    """
+    pwr_series = power.fillna(0)
+    values = []
+    valid_durations = []
+    for d in durations:
+        if d <= len(pwr_series):
+            val = pwr_series.rolling(window=d).mean().max()
+            if pd.notna(val) and val > 0:
+                values.append(val)
+                valid_durations.append(d)
+    return valid_durations, values
+
+
+def grade_pct(df):
+    """Pendenza punto per punto (%) da altitudine e distanza, pulita e limitata a ±30%."""
+    if 'altitude_m' not in df.columns or 'distance' not in df.columns:
+        return pd.Series(0.0, index=df.index)
+    # 1. Calcolo differenze
+    d_alt = df['altitude_m'].diff()
+    d_dist = df['distance'].diff()
+
+    # 2. Calcolo Pendenza
+    grade = (d_alt / d_dist) * 100
+
+    # 3. Pulizia (NaN e Inf -> 0)
+    grade = grade.replace([float('inf'), -float('inf')], 0.0).fillna(0.0)
+
+    # 4. Se fermo (distanza <=0), pendenza 0
+    grade[d_dist <= 0] = 0.0
+
+    # 5. Clip grafico
+    return grade.clip(-30, 30)
+
+
+def active_samples(df):
+    """
+    Campioni "attivi" per il Pw:HR: escludiamo i momenti in cui non si pedala (potenza < 10W)
+    o il cuore è a riposo (< 60bpm), per non falsare il calcolo con discese o pause caffè.
+    """
+    return df[(df['power'] > 10) & (df['heart_rate'] > 60)]
+
+
+def aerobic_decoupling(df_active):
+    """
+    Disaccoppiamento aerobico (Pw:HR) confrontando l'efficienza (EF = Potenza / FC)
+    della prima e della seconda metà dei campioni attivi.
+    Restituisce None se l'attività attiva dura meno di 10 minuti.
+    """
+    if len(df_active) <= 600:
+        return None
+
+    # Divisione in due metà
+    midpoint = len(df_active) // 2
+    first_half = df_active.iloc[:midpoint]
+    second_half = df_active.iloc[midpoint:]
+
+    p1 = first_half['power'].mean()
+    hr1 = first_half['heart_rate'].mean()
+    ef1 = p1 / hr1 if hr1 > 0 else 0
+
+    p2 = second_half['power'].mean()
+    hr2 = second_half['heart_rate'].mean()
+    ef2 = p2 / hr2 if hr2 > 0 else 0
+
+    # Formula: (EF1 - EF2) / EF1
+    decoupling = ((ef1 - ef2) / ef1) * 100 if ef1 > 0 else 0
+
+    return {'p1': p1, 'hr1': hr1, 'ef1': ef1, 'p2': p2, 'hr2': hr2, 'ef2': ef2, 'decoupling': decoupling}
+
+
+def summary_row(filename, df_temp):
+    """
+    Riga della tabella trend calcolata dai record grezzi di un'attività.
+    Restituisce None se mancano i timestamp.
+    """
+    if df_temp.empty or 'timestamp' not in df_temp.columns:
+        return None
+
+    date = pd.to_datetime(df_temp['timestamp'].iloc[0])
+    dist = df_temp['distance'].max() / 1000 if 'distance' in df_temp.columns else 0
+    speed_avg = (df_temp['speed'].mean() * 3.6) if 'speed' in df_temp.columns else 0
+    power_avg = df_temp['power'].mean() if 'power' in df_temp.columns else 0
+    cad_avg = df_temp[df_temp['cadence'] > 0]['cadence'].mean() if 'cadence' in df_temp.columns else 0
+    hr_avg = df_temp['heart_rate'].mean() if 'heart_rate' in df_temp.columns else 0
+
+    ele_gain = 0
+    if 'enhanced_altitude' in df_temp.columns:
+        ele_gain = elevation_gain_m(df_temp['enhanced_altitude'])
+    elif 'altitude' in df_temp.columns:
+        ele_gain = elevation_gain_m(df_temp['altitude'])
+
+    duration_min = (df_temp['timestamp'].iloc[-1] - df_temp['timestamp'].iloc[0]).total_seconds() / 60
+
+    # Coerciamo NaN a 0 per file Bryton/cyclocomputer senza alcuni campi
+    if pd.isna(speed_avg): speed_avg = 0
+    if pd.isna(power_avg): power_avg = 0
+    if pd.isna(cad_avg): cad_avg = 0
+    if pd.isna(hr_avg): hr_avg = 0
+    if pd.isna(dist): dist = 0
+    if pd.isna(ele_gain): ele_gain = 0
+    if pd.isna(duration_min): duration_min = 0
+
+    return {
+        'Filename': filename, 'Data': date, 'Distanza (km)': round(float(dist), 2),
+        'Velocità Avg (km/h)': round(float(speed_avg), 1), 'Potenza Avg (W)': int(power_avg),
+        'Cadenza Avg (rpm)': int(cad_avg), 'FC Avg (bpm)': int(hr_avg),
+        'Dislivello (m)': int(ele_gain), 'Durata (min)': int(duration_min)
+    }
@@ -0,0 +1,130 @@
+"""
+Strumentazione dei tempi per fase (download, parse, derive, compute, render).
+
+Ogni rerun della dashboard apre un Profiler con start_run(); le funzioni instrumentate
+usano stage(...) che registra sul profiler corrente del thread, oppure non fa nulla
+se nessun profiler è attivo (es. benchmark o script batch).
+"""
+import contextlib
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger("fitstorage.profiling")
+
+# Categorie delle fasi, nell'ordine in cui vengono mostrate
+CATEGORIES = ['download', 'parse', 'derive', 'compute', 'render']
+
+_local = threading.local()
+
+
+class Profiler:
+    """Raccoglie i tempi delle fasi di un singolo rerun."""
+
+    def __init__(self, label=""):
+        self.label = label
+        self.records = []
+        self._stack = []
+        self._t0 = time.perf_counter()
+        self.started_at = time.time()
+
+    @contextlib.contextmanager
+    def stage(self, name, category, cached=False, **info):
+        """
+        Misura il blocco come fase 'name' di categoria 'category'.
+        cached=True: la fase passa da una cache; resta 'hit' a meno che il corpo
+        della funzione in cache chiami mark_cache_miss().
+        """
+        rec = {
+            'name': name,
+            'category': category,
+            'depth': len(self._stack),
+            'cache': 'hit' if cached else None,
+            'start_ms': (time.perf_counter() - self._t0) * 1000,
+            **info,
+        }
+        rec['_child_ms'] = 0.0
+        self._stack.append(rec)
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            rec['ms'] = (time.perf_counter() - t0) * 1000
+            # Tempo proprio: escludiamo le fasi annidate per non contarle due volte
+            rec['self_ms'] = max(rec['ms'] - rec.pop('_child_ms'), 0.0)
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1]['_child_ms'] += rec['ms']
+            self.records.append(rec)
+
+    def mark_cache_miss(self):
+        """Segna come 'miss' la fase in cache più interna attualmente aperta."""
+        for rec in reversed(self._stack):
+            if rec['cache'] is not None:
+                rec['cache'] = 'miss'
+                return
+
+    def total_ms(self):
+        """Durata complessiva del rerun fino ad ora."""
+        return (time.perf_counter() - self._t0) * 1000
+
+    def sorted_records(self):
+        """Fasi in ordine di inizio."""
+        return sorted(self.records, key=lambda r: r['start_ms'])
+
+    def by_category(self):
+        """Tempo proprio (ms) sommato per categoria."""
+        totals = {c: 0.0 for c in CATEGORIES}
+        for rec in self.records:
+            totals[rec['category']] = totals.get(rec['category'], 0.0) + rec['self_ms']
+        return totals
+
+    def cache_counts(self):
+        """Numero di hit e miss delle fasi in cache."""
+        counts = {'hit': 0, 'miss': 0}
+        for rec in self.records:
+            if rec['cache'] in counts:
+                counts[rec['cache']] += 1
+        return counts
+
+    def to_jsonl(self):
+        """Esporta le fasi come JSON Lines (una fase per riga)."""
+        lines = []
+        for rec in self.sorted_records():
+            lines.append(json.dumps({'run': self.label, 'ts': self.started_at, **rec}, default=str))
+        return "\n".join(lines)
+
+    def log(self, level=logging.INFO):
+        """Scrive le fasi sul logger 'fitstorage.profiling' come log strutturati."""
+        for line in self.to_jsonl().splitlines():
+            logger.log(level, line)
+
+
+def start_run(label=""):
+    """Crea un nuovo profiler e lo rende corrente per il thread."""
+    _local.profiler = Profiler(label)
+    return _local.profiler
+
+
+def current():
+    """Profiler corrente del thread, o None."""
+    return getattr(_local, 'profiler', None)
+
+
+@contextlib.contextmanager
+def stage(name, category, cached=False, **info):
+    """Come Profiler.stage sul profiler corrente; senza profiler attivo non misura nulla."""
+    prof = current()
+    if prof is None:
+        yield {}
+        return
+    with prof.stage(name, category, cached=cached, **info) as rec:
+        yield rec
+
+
+def mark_cache_miss():
+    """Da chiamare nel corpo di una funzione in cache: il corpo gira solo in caso di miss."""
+    prof = current()
+    if prof is not None:
+        prof.mark_cache_miss()
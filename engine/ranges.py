@@ -0,0 +1,82 @@
+"""
+Statistiche istantanee su un intervallo dell'attività (tempo o distanza) con somme cumulative.
+
+prefix_sums calcola una volta per attività le somme cumulative dei canali e dei campioni validi;
+range_stats ricava poi medie, distanza, durata e dislivello di qualsiasi intervallo con due
+sottrazioni per canale, invece di filtrare il DataFrame a ogni selezione. Le medie seguono le
+stesse regole dei KPI dell'attività intera: NaN esclusi, cadenza senza gli zeri (soste).
+"""
+import numpy as np
+
+# Canale -> etichetta della statistica; la cadenza ignora gli zeri come nei KPI
+RANGE_CHANNELS = {
+    'power': 'Potenza Avg (W)',
+    'heart_rate': 'FC Avg (bpm)',
+    'cadence': 'Cadenza Avg (rpm)',
+    'speed_kmh': 'Velocità Avg (km/h)',
+}
+AXES = ('km', 'minuti')
+
+
+def _cumulative(values):
+    """Somma cumulativa con uno zero iniziale: somma di [i0, i1] = c[i1 + 1] - c[i0]."""
+    return np.concatenate([[0], np.cumsum(values)])
+
+
+def prefix_sums(df):
+    """
+    Array per le statistiche di intervallo: assi 'km' e 'minuti' (non decrescenti),
+    somme e conteggi cumulativi dei canali presenti e dislivello cumulativo.
+    """
+    n = len(df)
+    ps = {'n': n}
+    if 'minuti_trascorsi' in df.columns:
+        ps['minuti'] = df['minuti_trascorsi'].astype(float).ffill().fillna(0).to_numpy()
+    else:
+        ps['minuti'] = np.arange(n) / 60
+    if 'distance' in df.columns:
+        # Distanza mancante o che torna indietro (glitch GPS): l'asse resta monotono
+        ps['km'] = np.maximum.accumulate(df['distance'].astype(float).ffill().fillna(0).to_numpy()) / 1000
+    else:
+        ps['km'] = np.zeros(n)
+
+    for col in RANGE_CHANNELS:
+        if col not in df.columns:
+            continue
+        values = df[col].astype(float).to_numpy()
+        valid = ~np.isnan(values)
+        if col == 'cadence':
+            valid &= values > 0
+        ps[f'{col}_sum'] = _cumulative(np.where(valid, values, 0))
+        ps[f'{col}_cnt'] = _cumulative(valid.astype(np.int64))
+
+    if 'altitude_m' in df.columns and n > 1:
+        diffs = np.diff(df['altitude_m'].astype(float).to_numpy())
+        ps['gain'] = np.concatenate([[0], np.cumsum(np.where(diffs > 0, diffs, 0))])
+    return ps
+
+
+def index_range(ps, start, end, axis='km'):
+    """Indici [i0, i1] dei campioni con asse ('km' o 'minuti') compreso tra start ed end (O(log n))."""
+    x = ps[axis]
+    i0 = int(np.searchsorted(x, start, side='left'))
+    i1 = int(np.searchsorted(x, end, side='right')) - 1
+    i0 = min(max(i0, 0), ps['n'] - 1)
+    return i0, max(i0, min(i1, ps['n'] - 1))
+
+
+def range_stats(ps, i0, i1):
+    """Statistiche dei campioni [i0, i1] (estremi inclusi) in tempo costante."""
+    stats = {
+        'Distanza (km)': float(ps['km'][i1] - ps['km'][i0]),
+        'Durata (min)': float(ps['minuti'][i1] - ps['minuti'][i0]),
+        'Dislivello (m)': float(ps['gain'][i1] - ps['gain'][i0]) if 'gain' in ps else 0.0,
+    }
+    for col, label in RANGE_CHANNELS.items():
+        if f'{col}_sum' not in ps:
+            stats[label] = 0.0
+            continue
+        count = ps[f'{col}_cnt'][i1 + 1] - ps[f'{col}_cnt'][i0]
+        total = ps[f'{col}_sum'][i1 + 1] - ps[f'{col}_sum'][i0]
+        stats[label] = float(total / count) if count > 0 else 0.0
+    return stats
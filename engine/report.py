@@ -0,0 +1,484 @@
+"""
+Report statici HTML per attività e per periodo, da mandare agli atleti senza la dashboard.
+
+Ogni attività diventa una pagina con i KPI e i grafici della vista singola (potenza con intervalli
+e miglior 5 minuti, zone, velocità, cadenza, cardio, altimetria, curva di potenza, FC e cadenza a
+potenza); ogni settimana o mese una pagina con le sue uscite, più un indice con la tabella trend e
+il carico (CTL/ATL/TSB). Le pagine caricano plotly.js da un unico plotly.min.js nella cartella di
+output (funzionano anche offline senza ripetere la libreria, circa 5 MB, in ogni pagina); in
+alternativa la libreria si include in ogni pagina o si carica da CDN. Con --images ogni grafico è
+salvato anche in PNG (serve il pacchetto kaleido).
+
+Le attività si elaborano in parallelo con batch.process_archive. report.json nella cartella di
+output ricorda per ogni attività la chiave (md5 del file + impostazioni) e il risultato di
+analyse_activity: alla generazione successiva i file invariati non vengono né scaricati né
+decodificati, e le pagine di periodo si rifanno dai risultati salvati riscrivendo solo quelle
+con uscite cambiate. L'FTP, che entra nella chiave, è quello passato con --ftp o quello dei
+report già scritti: si stima sulle ultime attività solo alla prima generazione, così una nuova
+uscita non fa rigenerare tutti i report.
+
+Uso:
+    python -m engine.report --folder ./fit --out ./report
+    python -m engine.report --drive-folder <FOLDER_ID> --credentials credentials.json --out ./report --period W
+"""
+import argparse
+import hashlib
+import html
+import importlib.util
+import json
+import math
+import os
+import sys
+import tempfile
+from functools import partial
+
+import pandas as pd
+import plotly
+import plotly.express as px
+import plotly.graph_objects as go
+
+from engine import batch, cleaning
+from engine.charts import altitude_figure, hr_cadence_density_figure, mark_efforts, power_curve_figure, zone_bar_figure
+from engine.density import density_grid, density_table, table_means
+from engine.intervals import INTERVAL_THRESHOLD, analyse
+from engine.metrics import format_duration, grade_pct
+from engine.trends import FREQS, Rollups, period_start
+from engine.zones import HR_ZONE_FRACTIONS, HR_ZONES, POWER_ZONE_FRACTIONS, POWER_ZONES, activity_histograms, zone_edges, zone_table
+
+# Da incrementare quando cambia il contenuto delle pagine: tutti i report vengono rigenerati
+REPORT_VERSION = 3
+MANIFEST_FILE = 'report.json'
+# Libreria condivisa dalle pagine con plotlyjs 'file', nella cartella di output
+PLOTLY_FILE = 'plotly.min.js'
+ACTIVITY_DIR = 'attivita'
+PERIOD_DIR = 'periodi'
+# Punti per grafico: i campioni oltre questo numero vengono diradati (la pagina resta leggera)
+REPORT_MAX_POINTS = 3000
+
+PAGE_STYLE = """
+body { font-family: -apple-system, 'Segoe UI', Roboto, sans-serif; margin: 2rem auto; max-width: 1200px; color: #262730; }
+h1 { margin-bottom: 0.2rem; } h2 { margin-top: 2rem; border-bottom: 1px solid #e6e6e6; padding-bottom: 0.3rem; }
+.sottotitolo { color: #808495; margin-top: 0; }
+.kpi { display: grid; grid-template-columns: repeat(auto-fill, minmax(150px, 1fr)); gap: 0.8rem; }
+.kpi div { background: #f5f6f8; border-radius: 6px; padding: 0.6rem 0.8rem; }
+.kpi span { display: block; font-size: 0.8rem; color: #808495; } .kpi b { font-size: 1.3rem; }
+table.tabella { border-collapse: collapse; width: 100%; font-size: 0.9rem; }
+table.tabella th, table.tabella td { border-bottom: 1px solid #e6e6e6; padding: 0.3rem 0.5rem; text-align: right; }
+table.tabella th:first-child, table.tabella td:first-child { text-align: left; }
+"""
+
+
+def report_key(*parts):
+    """Chiave di un report: cambia se cambia una qualsiasi delle sue sorgenti o impostazioni."""
+    return hashlib.md5(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def activity_page(filename):
+    """Percorso della pagina di un'attività, relativo alla cartella di output."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    safe = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in stem)
+    return f"{ACTIVITY_DIR}/{safe}.html"
+
+
+def _write(path, text):
+    """Scrive un file di testo in modo atomico (un report a metà non sostituisce il precedente)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            fh.write(text)
+        # mkstemp crea file leggibili solo dal proprietario: i report si condividono
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _kpi(items):
+    return '<div class="kpi">' + ''.join(
+        f"<div><span>{html.escape(label)}</span><b>{html.escape(value)}</b></div>" for label, value in items
+    ) + '</div>'
+
+
+def _link(href, text):
+    return f'<a href="{html.escape(href)}">{html.escape(str(text))}</a>'
+
+
+def render_page(title, subtitle, blocks, plotlyjs='inline', root=''):
+    """
+    Pagina HTML da blocchi (titolo, contenuto): contenuto HTML, DataFrame (tabella) o figura Plotly.
+    plotlyjs 'inline' include la libreria una volta nella pagina, 'cdn' la carica da CDN, 'file'
+    da PLOTLY_FILE nella cartella di output (root: percorso relativo della cartella, es. '../').
+    """
+    body = []
+    js = {'inline': True, 'cdn': 'cdn', 'file': f"{root}{PLOTLY_FILE}"}[plotlyjs]
+    for heading, item in blocks:
+        if heading:
+            body.append(f"<h2>{html.escape(heading)}</h2>")
+        if isinstance(item, go.Figure):
+            # La libreria solo con la prima figura, le altre la riusano
+            body.append(item.to_html(full_html=False, include_plotlyjs=js, config={'displaylogo': False}))
+            js = False
+        elif isinstance(item, pd.DataFrame):
+            body.append(item.to_html(index=False, classes='tabella', border=0, escape=False, na_rep=''))
+        else:
+            body.append(item)
+    return (
+        f"<!DOCTYPE html>\n<html lang=\"it\"><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title>"
+        f"<style>{PAGE_STYLE}</style></head><body>"
+        f"<h1>{html.escape(title)}</h1><p class=\"sottotitolo\">{html.escape(subtitle)}</p>"
+        + '\n'.join(body) + "</body></html>\n"
+    )
+
+
+def _thin(df):
+    """Un campione ogni n, per non superare REPORT_MAX_POINTS punti per grafico."""
+    return df.iloc[::max(1, math.ceil(len(df) / REPORT_MAX_POINTS))]
+
+
+def _line(view, x, y, label, color, x_label):
+    fig = px.line(view, x=x, y=y, color_discrete_sequence=[color])
+    fig.update_layout(xaxis_title=x_label, yaxis_title=label, template="plotly_white", height=350)
+    return fig
+
+
+def activity_report(res, df, settings):
+    """
+    Pagina di un'attività da risultato di analyse_activity e DataFrame decodificato.
+    Restituisce (html, {nome: figura}) per salvare anche le immagini.
+    """
+    row, ftp, peso = res['row'], settings['ftp'], settings['peso']
+    durata_min = res['duration_s'] / 60
+    if_ = res['np'] / ftp if ftp > 0 else 0
+    tss = durata_min * 60 * res['np'] ** 2 / (ftp ** 2 * 36) if ftp > 0 else 0
+    kpi = _kpi([
+        ("Distanza", f"{row['Distanza (km)']:.2f} km"),
+        ("Durata", f"{durata_min:.0f} min"),
+        ("Velocità Avg", f"{row['Velocità Avg (km/h)']:.1f} km/h"),
+        ("Potenza Avg", f"{row['Potenza Avg (W)']:.0f} W"),
+        ("NP", f"{res['np']:.0f} W"),
+        ("IF / TSS", f"{if_:.2f} / {tss:.0f}"),
+        ("W/kg Sessione", f"{row['Potenza Avg (W)'] / peso:.2f} W/kg" if peso > 0 else "-"),
+        ("FC Media", f"{row['FC Avg (bpm)']:.0f} bpm"),
+        ("Cadenza Avg", f"{row['Cadenza Avg (rpm)']:.0f} rpm"),
+        ("Dislivello", f"{row['Dislivello (m)']:.0f} m"),
+        ("Consumo stimato", f"{0.3 * peso * row['Distanza (km)']:.0f} kcal"),
+        ("Best 5min / 20min", f"{row.get('Best 5min (W)', 0):.0f} / {row.get('Best 20min (W)', 0):.0f} W"),
+        ("EF", f"{row.get('EF', 0):.2f}"),
+        ("Pw:HR", f"{row.get('Pw:HR (%)', 0):.1f}%"),
+    ])
+    blocks = [(None, kpi)]
+    figs = {}
+
+    if 'distance' in df.columns:
+        x, x_label = df['distance'] / 1000, "Distanza (km)"
+    else:
+        x, x_label = df['minuti_trascorsi'], "Minuti"
+    df = df.assign(x_report=x)
+    hists = activity_histograms(df)
+
+    if 'power' in df.columns and df['power'].notna().any():
+        analisi = analyse(df, ftp)
+        view = _thin(df.assign(p_smooth=df['power'].rolling(10).mean()))
+        fig = px.area(view, x='x_report', y='p_smooth', color_discrete_sequence=['#FFA500'])
+        fig.update_traces(fillcolor='rgba(255, 165, 0, 0.3)', line=dict(width=1))
+        fig.update_layout(xaxis_title=x_label, yaxis_title="Watt", template="plotly_white", height=350)
+        best_5m = next((b for b in analisi['best'] if b['durata_s'] == 300), None)
+        mark_efforts(fig, df['x_report'], analisi['intervalli'], best_5m)
+        figs['potenza'] = fig
+        blocks.append(("⚡ Potenza (media 10 s, intervalli e miglior 5 minuti)", fig))
+        figs['zone_potenza'] = zone_bar_figure(
+            zone_table(hists.get('potenza'), zone_edges(ftp, POWER_ZONE_FRACTIONS), POWER_ZONES))
+        blocks.append((f"📊 Zone di potenza (FTP {ftp} W)", figs['zone_potenza']))
+        if analisi['intervalli']:
+            blocks.append((f"🔁 Intervalli sopra {int(INTERVAL_THRESHOLD * 100)}% FTP", pd.DataFrame([{
+                'Inizio (min)': round(i['inizio_s'] / 60, 1),
+                'Inizio (km)': i['km'],
+                'Durata': format_duration(int(i['durata_s'])),
+                'Potenza (W)': int(i['potenza_w']),
+                '% FTP': i['pct_ftp'],
+                'FC (bpm)': int(i['fc_bpm']),
+            } for i in analisi['intervalli']])))
+        if res['curve']:
+            durations, values = zip(*res['curve'])
+            figs['curva_potenza'] = power_curve_figure(list(durations), list(values), [None] * len(values), [None] * len(values))
+            blocks.append(("⚡ Curva di potenza", figs['curva_potenza']))
+
+    view = _thin(df)
+    for col, label, color, title in [
+        ('speed_kmh', "km/h", '#00BFFF', "📈 Velocità"),
+        ('cadence', "rpm", '#32CD32', "🦵 Cadenza"),
+        ('heart_rate', "bpm", '#FF4136', "❤️ Cardio"),
+    ]:
+        if col in df.columns and df[col].notna().any():
+            figs[col] = _line(view, 'x_report', col, label, color, x_label)
+            blocks.append((title, figs[col]))
+    if 'heart_rate' in df.columns and df['heart_rate'].notna().any():
+        figs['zone_cardio'] = zone_bar_figure(
+            zone_table(hists.get('fc'), zone_edges(settings['max_hr'], HR_ZONE_FRACTIONS), HR_ZONES))
+        blocks.append((f"📊 Zone cardio (FC max {settings['max_hr']} bpm)", figs['zone_cardio']))
+
+    if 'altitude_m' in df.columns and df['altitude_m'].notna().any():
+        figs['altimetria'] = altitude_figure(_thin(df.assign(grade_pct=grade_pct(df))))
+        blocks.append(("🗻 Altimetria", figs['altimetria']))
+
+    grid = density_grid(df)
+    if grid:
+        table = density_table(grid)
+        figs['fc_cadenza'] = hr_cadence_density_figure(table, means=table_means(table))
+        blocks.append(("❤️🦵 FC e cadenza a potenza", figs['fc_cadenza']))
+
+    if res.get('cleaning'):
+        blocks.append(("🧹 Pulizia dati", pd.DataFrame(res['cleaning'])))
+
+    subtitle = f"{pd.Timestamp(row['Data']):%d/%m/%Y %H:%M} · FTP {ftp} W · peso {peso} kg"
+    return render_page(row['Filename'], subtitle, blocks, settings.get('plotlyjs', 'inline'), '../'), figs
+
+
+def save_images(figs, prefix):
+    """Salva le figure come PNG (<prefix>_<nome>.png); serve il pacchetto kaleido."""
+    for name, fig in figs.items():
+        fig.write_image(f"{prefix}_{name}.png", width=1100, height=fig.layout.height or 450)
+
+
+def _jsonable(res):
+    """Risultato di analyse_activity salvabile in report.json (date in ISO, curva come liste)."""
+    res = dict(res)
+    res['row'] = dict(res['row'], Data=pd.Timestamp(res['row']['Data']).isoformat())
+    res['curve'] = [[int(d), float(v)] for d, v in res['curve']]
+    res['np'] = float(res['np'])
+    return res
+
+
+def _from_manifest(res):
+    return dict(res, row=dict(res['row'], Data=pd.Timestamp(res['row']['Data'])))
+
+
+def render_activity(filename, source, out_dir, settings, images=False):
+    """
+    Worker: decodifica l'attività, scrive la sua pagina (e le immagini) e restituisce il risultato
+    di analyse_activity con 'report' (percorso relativo). Dict con 'error' in caso di problemi.
+    """
+    try:
+        res, df = batch.analyse_activity(filename, batch.read_source(source))
+        if df is None:
+            return res
+        page, figs = activity_report(res, df, settings)
+        rel = activity_page(filename)
+        path = os.path.join(out_dir, rel)
+        _write(path, page)
+        if images:
+            save_images(figs, os.path.splitext(path)[0])
+        return dict(_jsonable(res), report=rel)
+    except Exception as e:
+        return {'filename': filename, 'error': str(e)}
+
+
+def period_report(label, rides, settings):
+    """Pagina di un periodo dalle righe della tabella trend (con IF/TSS) delle sue uscite."""
+    kpi = _kpi([
+        ("Attività", f"{len(rides)}"),
+        ("Distanza", f"{rides['Distanza (km)'].sum():.0f} km"),
+        ("Ore", f"{rides['Durata (min)'].sum() / 60:.1f} h"),
+        ("Dislivello", f"{rides['Dislivello (m)'].sum():.0f} m"),
+        ("TSS", f"{rides['TSS'].sum():.0f}"),
+        ("Best 20min", f"{rides['Best 20min (W)'].max():.0f} W" if 'Best 20min (W)' in rides else "-"),
+    ])
+    table = rides.copy()
+    table['Data'] = table['Data'].dt.strftime('%d/%m/%Y')
+    table['Filename'] = [_link(f"../{rel}", name) for rel, name in zip(table['Report'], table['Filename'])]
+    table = table.drop(columns=['Report', 'Periodo'])
+    fig_dist = px.bar(rides, x='Data', y='Distanza (km)', color_discrete_sequence=['#00BFFF'])
+    fig_dist.update_layout(template="plotly_white", height=300)
+    fig_pwr = px.line(rides, x='Data', y=[c for c in ['Potenza Avg (W)', 'NP (W)'] if c in rides], markers=True)
+    fig_pwr.update_layout(template="plotly_white", height=300, yaxis_title="Watt", legend_title="")
+    blocks = [(None, kpi), ("🚴 Uscite", table), ("📅 Distanza per uscita", fig_dist), ("⚡ Potenza per uscita", fig_pwr)]
+    return render_page(label, f"FTP {settings['ftp']} W", blocks, settings.get('plotlyjs', 'inline'), '../')
+
+
+def index_report(summary, load, freq, settings, pages):
+    """Indice: tabella trend per periodo (con link alle pagine), grafici di volume, potenza e carico."""
+    rollups = Rollups()
+    rollups.update_from_summary(summary)
+    trend = rollups.table(freq, settings['ftp'])
+    periodo = FREQS[freq]
+    table = trend.copy()
+    table['Periodo'] = [_link(pages[key], f"{ts:%d/%m/%Y}") for key, ts in
+                        zip(table['Periodo'].dt.strftime('%Y-%m-%d'), table['Periodo'])]
+    fig_dist = px.bar(trend, x='Periodo', y='Distanza (km)', color_discrete_sequence=['#00BFFF'])
+    fig_dist.update_layout(template="plotly_white", height=300)
+    fig_pwr = px.line(trend, x='Periodo', y=['Potenza Avg (W)', 'Best 5min (W)', 'Best 20min (W)'], markers=True)
+    fig_pwr.update_layout(template="plotly_white", height=300, yaxis_title="Watt", legend_title="")
+    fig_tss = px.bar(trend, x='Periodo', y='TSS', color_discrete_sequence=['#FF8C00'])
+    fig_tss.update_layout(template="plotly_white", height=300)
+    fig_load = px.line(load, x='Data', y=['CTL', 'ATL', 'TSB'])
+    fig_load.update_layout(template="plotly_white", height=350, yaxis_title="TSS/giorno", legend_title="")
+    blocks = [
+        (f"📋 Trend per {periodo}", table),
+        (f"📅 Distanza per {periodo}", fig_dist),
+        (f"⚡ Potenza per {periodo}", fig_pwr),
+        (f"🏋️ Carico (TSS) per {periodo}", fig_tss),
+        ("📈 Forma: CTL, ATL e TSB", fig_load),
+    ]
+    first, last = summary['Data'].min(), summary['Data'].max()
+    subtitle = f"{len(summary)} uscite dal {first:%d/%m/%Y} al {last:%d/%m/%Y} · FTP {settings['ftp']} W"
+    return render_page("Report allenamenti", subtitle, blocks, settings.get('plotlyjs', 'inline'))
+
+
+def _load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE), encoding='utf-8') as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        manifest = None
+    if not manifest or manifest.get('versione') != REPORT_VERSION:
+        return {'versione': REPORT_VERSION, 'attivita': {}, 'pagine': {}}
+    return manifest
+
+
+def stored_ftp(out_dir):
+    """FTP con cui sono stati scritti i report in out_dir (None se non ce ne sono)."""
+    return _load_manifest(out_dir).get('ftp')
+
+
+def _write_plotlyjs(out_dir, manifest):
+    """Scrive PLOTLY_FILE in out_dir se manca o se è di un'altra versione di plotly."""
+    path = os.path.join(out_dir, PLOTLY_FILE)
+    if manifest.get('plotly') == plotly.__version__ and os.path.exists(path):
+        return
+    _write(path, plotly.offline.get_plotlyjs())
+    manifest['plotly'] = plotly.__version__
+
+
+def generate_reports(sources, hashes, out_dir, settings, freq='M', workers=None, creds_file=None,
+                     images=False, copies=None, on_progress=None):
+    """
+    Report di tutte le sorgenti [(nome_file, sorgente)] in out_dir: pagine delle attività nuove o
+    cambiate (in parallelo), pagine dei periodi con uscite cambiate e indice.
+    hashes: {nome_file: md5}; senza md5 l'attività si rigenera sempre.
+    settings: {'ftp', 'max_hr', 'peso', 'plotlyjs'}; l'FTP si salva nel manifest per le generazioni
+    successive (stored_ftp). Restituisce {'scritte', 'saltate', 'periodi', 'errori'}.
+    """
+    manifest = _load_manifest(out_dir)
+    manifest['ftp'] = settings['ftp']
+    if settings.get('plotlyjs') == 'file':
+        _write_plotlyjs(out_dir, manifest)
+    saved = manifest['attivita']
+    keys = {
+        name: report_key(REPORT_VERSION, hashes.get(name), settings, images, cleaning.configured_rules()) if hashes.get(name) else None
+        for name, _ in sources
+    }
+    todo = [
+        (name, src) for name, src in sources
+        if keys[name] is None or saved.get(name, {}).get('chiave') != keys[name]
+        or not os.path.exists(os.path.join(out_dir, saved[name]['risultato']['report']))
+    ]
+    task = partial(render_activity, out_dir=out_dir, settings=settings, images=images)
+    new = batch.process_archive(todo, workers=workers, creds_file=creds_file, on_progress=on_progress, task=task) if todo else []
+    errors = [res for res in new if 'error' in res]
+    for res in new:
+        if 'error' not in res:
+            saved[res['filename']] = {'chiave': keys[res['filename']], 'risultato': res}
+    # Attività tolte dall'archivio: fuori dai periodi (la loro pagina resta)
+    names = {name for name, _ in sources}
+    for name in [n for n in saved if n not in names]:
+        del saved[name]
+
+    results = [_from_manifest(saved[name]['risultato']) for name, _ in sources if name in saved]
+    written_periods = 0
+    if results:
+        tables = batch.build_tables(results, settings['ftp'], copies)
+        summary = tables['summary']
+        reports = {res['filename']: res['report'] for res in results}
+        summary['Report'] = summary['Filename'].map(reports)
+        summary['Periodo'] = [period_start(d, freq) for d in summary['Data']]
+        pages = {}
+        for key, rides in summary.groupby('Periodo'):
+            rel = f"{PERIOD_DIR}/{FREQS[freq].lower()}_{key}.html"
+            pages[key] = rel
+            page_key = report_key(REPORT_VERSION, settings, sorted(saved[n]['chiave'] or n for n in rides['Filename']))
+            if manifest['pagine'].get(rel) == page_key and os.path.exists(os.path.join(out_dir, rel)):
+                continue
+            label = f"{FREQS[freq]} dal {pd.Timestamp(key):%d/%m/%Y}"
+            _write(os.path.join(out_dir, rel), period_report(label, rides.reset_index(drop=True), settings))
+            manifest['pagine'][rel] = page_key if all(saved[n]['chiave'] for n in rides['Filename']) else None
+            written_periods += 1
+        index_key = report_key(REPORT_VERSION, settings, freq, sorted(manifest['pagine'].get(p) or p for p in pages.values()))
+        if manifest['pagine'].get('index.html') != index_key or written_periods:
+            _write(os.path.join(out_dir, 'index.html'), index_report(summary, tables['training_load'], freq, settings, pages))
+            manifest['pagine']['index.html'] = index_key
+    _write(os.path.join(out_dir, MANIFEST_FILE), json.dumps(manifest, default=str))
+    return {'scritte': len(new) - len(errors), 'saltate': len(sources) - len(todo),
+            'periodi': written_periods, 'errori': errors}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report HTML statici per attività e per periodo")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument('--folder', help="cartella locale con i file .fit")
+    src.add_argument('--drive-folder', help="ID della cartella Google Drive")
+    parser.add_argument('--credentials', default='credentials.json',
+                        help="file JSON del Service Account (solo con --drive-folder)")
+    parser.add_argument('--out', required=True, help="cartella dei report")
+    parser.add_argument('--period', choices=list(FREQS), default='M', help="pagine per settimana (W) o mese (M)")
+    parser.add_argument('--ftp', type=int, default=None,
+                        help="FTP per zone, IF e TSS (default: quello dei report già scritti, "
+                             "altrimenti stimato sulle ultime 5 attività)")
+    parser.add_argument('--max-hr', type=int, default=190, help="FC massima per le zone cardio")
+    parser.add_argument('--weight', type=float, default=60, help="peso (kg) per W/kg e consumo stimato")
+    parser.add_argument('--plotlyjs', choices=['file', 'inline', 'cdn'], default='file',
+                        help=f"plotly.js da un unico {PLOTLY_FILE} accanto alle pagine (default), "
+                             "incluso in ogni pagina o caricato da CDN")
+    parser.add_argument('--images', action='store_true', help="salva anche ogni grafico in PNG (richiede kaleido)")
+    parser.add_argument('--workers', type=int, default=None, help="processi paralleli (default: numero di CPU)")
+    parser.add_argument('--pulizia', action='append', metavar='CHIAVE=VALORE',
+                        help="soglia di pulizia dei dati da cambiare (ripetibile, chiavi di cleaning.CLEANING_RULES)")
+    parser.add_argument('--quiet', action='store_true', help="non mostrare l'avanzamento")
+    args = parser.parse_args(argv)
+    try:
+        cleaning.configure(cleaning.parse_rules(args.pulizia))
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.images and importlib.util.find_spec('kaleido') is None:
+        parser.error("--images richiede il pacchetto kaleido (pip install kaleido)")
+
+    creds_file = None
+    if args.drive_folder:
+        if not os.path.exists(args.credentials):
+            parser.error(f"credenziali non trovate: {args.credentials}")
+        creds_file = args.credentials
+        batch._init_drive_worker(creds_file)
+        sources = batch.drive_sources(batch._worker_service, args.drive_folder)
+        hashes = batch.drive_hashes(batch._worker_service, args.drive_folder)
+    else:
+        sources = batch.local_sources(args.folder)
+        hashes = batch.local_hashes(sources)
+    sources, copies = batch.skip_copies(sources, hashes)
+
+    if not sources:
+        print("Nessun file .fit trovato.", file=sys.stderr)
+        return 1
+
+    def progress(done, total, res):
+        if 'error' in res:
+            print(f"Errore durante la lettura del file '{res['filename']}': {res['error']}", file=sys.stderr)
+        if not args.quiet:
+            print(f"\r{done}/{total}", end="", file=sys.stderr, flush=True)
+
+    ftp = args.ftp or stored_ftp(args.out) or batch.estimate_ftp(sources)
+    settings = {'ftp': ftp, 'max_hr': args.max_hr, 'peso': args.weight, 'plotlyjs': args.plotlyjs}
+    stats = generate_reports(sources, hashes, args.out, settings, args.period, args.workers, creds_file,
+                             args.images, copies, progress)
+    if not args.quiet and stats['scritte'] + len(stats['errori']):
+        print(file=sys.stderr)
+    print(os.path.join(args.out, 'index.html'))
+    print(f"{stats['scritte']} report di attività scritti, {stats['saltate']} invariati, "
+          f"{stats['periodi']} pagine di periodo aggiornate, {len(stats['errori'])} errori, FTP {ftp} W", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,371 @@
+"""
+Segmenti (tratti ripetuti, es. salite) e loro storico su tutte le attività.
+
+Ogni attività con GPS viene ridotta a una traccia semplificata: un punto ogni SIMPLIFY_M metri
+con coordinate piane, tempo, energia e battiti cumulativi (così tempo, potenza e FC di qualsiasi
+tratto sono differenze, come in engine.ranges). Due indici a griglia (celle di INDEX_CELL_M metri)
+evitano di scorrere tutte le tracce:
+- start_index: cella -> segmenti che partono lì. Una nuova uscita guarda solo le celle che
+  attraversa e verifica i pochi segmenti trovati;
+- track_index: cella -> attività che la attraversano. Un nuovo segmento guarda solo le celle
+  della sua partenza e carica le sole tracce candidate.
+
+Le tracce stanno in file separati (tracks/<chiave>.json) e vengono lette solo per le verifiche.
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from engine import store
+
+SEGMENTS_FILE = 'segments.json'
+TRACKS_DIR = 'tracks'
+# Da incrementare quando cambia il formato dei segmenti (e indici) o delle tracce semplificate
+SEGMENTS_VERSION = 1
+TRACK_VERSION = 1
+
+# Campi record per simplify_track da colonne grezze di FitScan (derive_fit, senza decodifica completa)
+TRACK_FIT_FIELDS = ['position_lat', 'position_long', 'distance', 'power', 'heart_rate', 'altitude', 'enhanced_altitude']
+
+SIMPLIFY_M = 50
+INDEX_CELL_M = 250
+MATCH_RADIUS_M = 50
+LENGTH_TOL = 0.15
+COVERAGE_MIN = 0.9
+
+# Salite scoperte automaticamente
+CLIMB_MIN_GAIN_M = 40
+CLIMB_MIN_LENGTH_M = 500
+CLIMB_MIN_GRADE = 3.0
+CLIMB_MAX_DIP_M = 10
+CLIMB_SMOOTH_POINTS = 4
+
+SEMICIRCLE_DEG = 180 / 2 ** 31
+METERS_PER_DEG = 111320
+
+KIND_MANUAL = "manuale"
+KIND_CLIMB = "salita"
+
+
+def project(lat_deg, lon_deg):
+    """Coordinate piane approssimate in metri (equirettangolare), sufficienti per distanze locali."""
+    lat_deg = np.asarray(lat_deg, dtype=float)
+    y = lat_deg * METERS_PER_DEG
+    x = np.asarray(lon_deg, dtype=float) * METERS_PER_DEG * np.cos(np.radians(lat_deg))
+    return x, y
+
+
+def simplify_track(df, step=SIMPLIFY_M):
+    """
+    Traccia semplificata dell'attività: dict di liste con un punto ogni 'step' metri
+    (d distanza, x/y coordinate, t secondi, e energia J, h e hn battiti e secondi con FC valida,
+    alt quota) e 'start' (inizio attività). None senza GPS. Accetta il DataFrame di load_single_fit
+    o le colonne grezze di FitScan (quota da enhanced_altitude o altitude).
+    """
+    if not {'position_lat', 'position_long', 'timestamp'} <= set(df.columns):
+        return None
+    valid = df[['position_lat', 'position_long']].notna().all(axis=1).to_numpy()
+    if valid.sum() < 2:
+        return None
+    sub = df[valid]
+    x, y = project(sub['position_lat'].to_numpy(float) * SEMICIRCLE_DEG,
+                   sub['position_long'].to_numpy(float) * SEMICIRCLE_DEG)
+    secs = (sub['timestamp'] - df['timestamp'].iloc[0]).dt.total_seconds().to_numpy()
+    if 'distance' in sub.columns and sub['distance'].notna().any():
+        d = np.maximum.accumulate(sub['distance'].astype(float).ffill().fillna(0).to_numpy())
+    else:
+        d = np.concatenate([[0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))])
+    if d[-1] < step:
+        return None
+
+    # Integrali nel tempo: la media di un tratto è (valore finale - iniziale) / durata
+    dt = np.diff(secs, prepend=secs[0])
+    power = sub['power'].astype(float).fillna(0).to_numpy() if 'power' in sub.columns else np.zeros(len(sub))
+    hr = sub['heart_rate'].astype(float).to_numpy() if 'heart_rate' in sub.columns else np.full(len(sub), np.nan)
+    hr_ok = ~np.isnan(hr)
+    alt = np.zeros(len(sub))
+    for name in ('altitude_m', 'enhanced_altitude', 'altitude'):
+        if name in sub.columns and sub[name].notna().any():
+            alt = sub[name].astype(float).ffill().bfill().to_numpy()
+            break
+
+    grid = np.arange(0, d[-1], step)
+    columns = {
+        'x': x, 'y': y, 't': secs,
+        'e': np.cumsum(power * dt),
+        'h': np.cumsum(np.where(hr_ok, hr, 0) * dt),
+        'hn': np.cumsum(hr_ok * dt),
+        'alt': alt,
+    }
+    track = {'start': pd.Timestamp(df['timestamp'].iloc[0]).isoformat(), 'd': grid.round().tolist()}
+    for name, values in columns.items():
+        track[name] = np.interp(grid, d, values).round(1).tolist()
+    return track
+
+
+def _arrays(track):
+    return {k: np.asarray(v, dtype=float) for k, v in track.items() if k != 'start'}
+
+
+def _cell(x, y):
+    return f"{int(np.floor(x / INDEX_CELL_M))},{int(np.floor(y / INDEX_CELL_M))}"
+
+
+def cells_around(x, y, radius=MATCH_RADIUS_M):
+    """Celle della griglia che toccano il quadrato di lato 2*radius centrato nel punto."""
+    c = INDEX_CELL_M
+    return {
+        f"{ix},{iy}"
+        for ix in range(int(np.floor((x - radius) / c)), int(np.floor((x + radius) / c)) + 1)
+        for iy in range(int(np.floor((y - radius) / c)), int(np.floor((y + radius) / c)) + 1)
+    }
+
+
+def track_cells(track):
+    """Celle attraversate da una traccia semplificata."""
+    return {_cell(x, y) for x, y in zip(track['x'], track['y'])}
+
+
+def segment_from_track(track, d_start, d_end, name, kind=KIND_MANUAL, origin=""):
+    """Segmento dal tratto [d_start, d_end] (metri) di una traccia semplificata; None se troppo corto."""
+    a = _arrays(track)
+    sel = (a['d'] >= d_start) & (a['d'] <= d_end)
+    if sel.sum() < 2:
+        return None
+    alt = a['alt'][sel]
+    return {
+        'nome': name,
+        'tipo': kind,
+        'origine': origin,
+        'x': a['x'][sel].round(1).tolist(),
+        'y': a['y'][sel].round(1).tolist(),
+        'lunghezza_m': float(a['d'][sel][-1] - a['d'][sel][0]),
+        'dislivello_m': float(np.clip(np.diff(alt), 0, None).sum()),
+    }
+
+
+def discover_climbs(track):
+    """
+    Salite della traccia: tratti da un minimo al massimo successivo (tollerando discese sotto
+    CLIMB_MAX_DIP_M) con almeno CLIMB_MIN_GAIN_M di dislivello, CLIMB_MIN_LENGTH_M di lunghezza
+    e CLIMB_MIN_GRADE % di pendenza media. Restituisce [(d_inizio, d_fine, dislivello, pendenza)].
+    """
+    a = _arrays(track)
+    d = a['d']
+    alt = pd.Series(a['alt']).rolling(CLIMB_SMOOTH_POINTS, center=True, min_periods=1).mean().to_numpy()
+    climbs = []
+
+    def close(start, peak):
+        gain = alt[peak] - alt[start]
+        length = d[peak] - d[start]
+        if gain >= CLIMB_MIN_GAIN_M and length >= CLIMB_MIN_LENGTH_M and gain / length * 100 >= CLIMB_MIN_GRADE:
+            climbs.append((float(d[start]), float(d[peak]), float(gain), float(gain / length * 100)))
+
+    start = peak = 0
+    for i in range(1, len(alt)):
+        if alt[i] >= alt[peak]:
+            peak = i
+        elif alt[peak] - alt[i] > CLIMB_MAX_DIP_M:
+            close(start, peak)
+            start = peak = i
+        if alt[i] < alt[start]:
+            start = peak = i
+    close(start, peak)
+    return climbs
+
+
+def match_segment(track, seg):
+    """
+    Passaggi della traccia sul segmento (anche più giri): partenza e arrivo entro MATCH_RADIUS_M,
+    distanza percorsa entro LENGTH_TOL della lunghezza e almeno COVERAGE_MIN dei punti del
+    segmento vicini alla traccia. Restituisce una lista di sforzi (tempo, potenza, FC, velocità).
+    """
+    a = _arrays(track)
+    sx, sy = np.asarray(seg['x']), np.asarray(seg['y'])
+    length = seg['lunghezza_m']
+    ds = np.hypot(a['x'] - sx[0], a['y'] - sy[0])
+    near = np.flatnonzero(ds <= MATCH_RADIUS_M)
+    efforts = []
+    last_end = -1
+    # Gruppi di punti consecutivi vicini alla partenza: un gruppo per passaggio
+    for group in np.split(near, np.flatnonzero(np.diff(near) > 1) + 1) if near.size else []:
+        i0 = int(group[np.argmin(ds[group])])
+        if i0 <= last_end:
+            continue
+        win = np.flatnonzero((a['d'] >= a['d'][i0] + length * (1 - LENGTH_TOL)) &
+                             (a['d'] <= a['d'][i0] + length * (1 + LENGTH_TOL)))
+        if not win.size:
+            continue
+        de = np.hypot(a['x'][win] - sx[-1], a['y'][win] - sy[-1])
+        if de.min() > MATCH_RADIUS_M:
+            continue
+        i1 = int(win[np.argmin(de)])
+        px, py = a['x'][i0:i1 + 1], a['y'][i0:i1 + 1]
+        nearest = np.hypot(sx[:, None] - px[None, :], sy[:, None] - py[None, :]).min(axis=1)
+        if (nearest <= MATCH_RADIUS_M).mean() < COVERAGE_MIN:
+            continue
+        secs = a['t'][i1] - a['t'][i0]
+        if secs <= 0:
+            continue
+        hr_secs = a['hn'][i1] - a['hn'][i0]
+        efforts.append({
+            'inizio': (pd.Timestamp(track['start']) + pd.Timedelta(seconds=float(a['t'][i0]))).isoformat(),
+            'tempo_s': float(secs),
+            'potenza_w': float((a['e'][i1] - a['e'][i0]) / secs),
+            'fc_bpm': float((a['h'][i1] - a['h'][i0]) / hr_secs) if hr_secs > 0 else 0.0,
+            'velocita_kmh': float(length / secs * 3.6),
+        })
+        last_end = i1
+    return efforts
+
+
+def _track_key(filename):
+    return hashlib.md5(filename.encode('utf-8')).hexdigest()
+
+
+def save_track(filename, track):
+    store.write_json(f"{TRACKS_DIR}/{_track_key(filename)}.json", track)
+
+
+def load_track(filename):
+    return store.read_json(f"{TRACKS_DIR}/{_track_key(filename)}.json")
+
+
+class SegmentStore:
+    """Segmenti, sforzi per segmento e i due indici a griglia (partenze dei segmenti, celle delle tracce)."""
+
+    def __init__(self, segments=None, efforts=None, start_index=None, track_index=None, tracks=None, next_id=1):
+        self.segments = segments or {}
+        self.efforts = efforts or {}
+        self.start_index = start_index or {}
+        self.track_index = track_index or {}
+        self.tracks = tracks or []
+        self.next_id = next_id
+
+    def has_track(self, filename):
+        """True se l'attività è già stata indicizzata (con o senza GPS)."""
+        return filename in self.tracks
+
+    def add_track(self, filename, track):
+        """
+        Indicizza la traccia di un'attività e la confronta con i soli segmenti che partono
+        nelle celle che attraversa. Restituisce il numero di sforzi trovati.
+        """
+        if self.has_track(filename):
+            return 0
+        # Anche le attività senza GPS vengono ricordate, per non rileggerle a ogni indicizzazione
+        self.tracks.append(filename)
+        if track is None:
+            return 0
+        save_track(filename, track)
+        cells = track_cells(track)
+        for cell in cells:
+            self.track_index.setdefault(cell, []).append(filename)
+        candidates = {seg_id for cell in cells for seg_id in self.start_index.get(cell, [])}
+        found = 0
+        for seg_id in candidates:
+            efforts = match_segment(track, self.segments[seg_id])
+            if efforts:
+                self.efforts.setdefault(seg_id, {})[filename] = efforts
+                found += len(efforts)
+        return found
+
+    def find_similar(self, seg):
+        """Id di un segmento esistente con partenza e arrivo entro MATCH_RADIUS_M (None se nuovo)."""
+        candidates = {s for cell in cells_around(seg['x'][0], seg['y'][0]) for s in self.start_index.get(cell, [])}
+        for seg_id in candidates:
+            other = self.segments[seg_id]
+            if (np.hypot(other['x'][0] - seg['x'][0], other['y'][0] - seg['y'][0]) <= MATCH_RADIUS_M and
+                    np.hypot(other['x'][-1] - seg['x'][-1], other['y'][-1] - seg['y'][-1]) <= MATCH_RADIUS_M):
+                return seg_id
+        return None
+
+    def add_segment(self, seg):
+        """
+        Aggiunge un segmento e lo confronta con le sole attività che passano vicino alla partenza.
+        Restituisce l'id (quello esistente se il segmento c'è già).
+        """
+        existing = self.find_similar(seg)
+        if existing is not None:
+            return existing
+        seg_id = str(self.next_id)
+        self.next_id += 1
+        self.segments[seg_id] = seg
+        start_cells = cells_around(seg['x'][0], seg['y'][0])
+        for cell in start_cells:
+            self.start_index.setdefault(cell, []).append(seg_id)
+        candidates = {name for cell in start_cells for name in self.track_index.get(cell, [])}
+        for name in candidates:
+            track = load_track(name)
+            efforts = match_segment(track, seg) if track else []
+            if efforts:
+                self.efforts.setdefault(seg_id, {})[name] = efforts
+        return seg_id
+
+    def remove_segment(self, seg_id):
+        seg = self.segments.pop(seg_id, None)
+        if seg is None:
+            return False
+        for cell in cells_around(seg['x'][0], seg['y'][0]):
+            ids = [s for s in self.start_index.get(cell, []) if s != seg_id]
+            if ids:
+                self.start_index[cell] = ids
+            else:
+                self.start_index.pop(cell, None)
+        self.efforts.pop(seg_id, None)
+        return True
+
+    def activity_efforts(self, filename):
+        """Sforzi di un'attività su tutti i segmenti, come DataFrame."""
+        rows = []
+        for seg_id, by_file in self.efforts.items():
+            for effort in by_file.get(filename, []):
+                rows.append(_effort_row(self.segments[seg_id], effort, filename))
+        return pd.DataFrame(rows)
+
+    def history(self, seg_id):
+        """Storico di un segmento: uno sforzo per riga, ordinati per data, con il migliore tempo in 'PR'."""
+        seg = self.segments[seg_id]
+        rows = [_effort_row(seg, e, name) for name, efforts in self.efforts.get(seg_id, {}).items() for e in efforts]
+        df = pd.DataFrame(rows)
+        if not df.empty:
+            df = df.sort_values(by='Data').reset_index(drop=True)
+            df['PR'] = df['Tempo (s)'] == df['Tempo (s)'].min()
+        return df
+
+    def to_dict(self):
+        return {
+            'segments': self.segments, 'efforts': self.efforts, 'start_index': self.start_index,
+            'track_index': self.track_index, 'tracks': self.tracks, 'next_id': self.next_id,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if not data:
+            return cls()
+        return cls(**{k: data.get(k) for k in ('segments', 'efforts', 'start_index', 'track_index', 'tracks')},
+                   next_id=data.get('next_id', 1))
+
+
+def _effort_row(seg, effort, filename):
+    return {
+        'Segmento': seg['nome'],
+        'Attività': filename,
+        'Data': pd.Timestamp(effort['inizio']).floor('s'),
+        'Tempo (s)': round(effort['tempo_s']),
+        'Potenza Avg (W)': round(effort['potenza_w']),
+        'FC Avg (bpm)': round(effort['fc_bpm']),
+        'Velocità Avg (km/h)': round(effort['velocita_kmh'], 1),
+        'Lunghezza (km)': round(seg['lunghezza_m'] / 1000, 2),
+        'Dislivello (m)': round(seg['dislivello_m']),
+    }
+
+
+def load_segments():
+    """Segmenti salvati nell'archivio locale (vuoti al primo avvio)."""
+    return SegmentStore.from_dict(store.read_json(SEGMENTS_FILE))
+
+
+def save_segments(segments):
+    store.write_json(SEGMENTS_FILE, segments.to_dict())
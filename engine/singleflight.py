@@ -0,0 +1,104 @@
+"""
+Coalescenza delle richieste concorrenti (single-flight), indipendente da Streamlit.
+
+Streamlit esegue ogni sessione in un thread dello stesso processo: se più utenti aprono
+la stessa attività prima che la cache sia pronta, ognuno scaricherebbe e decodificherebbe
+lo stesso file. Con do(key, fn) la prima richiesta per una chiave esegue fn e le richieste
+concorrenti con la stessa chiave ne attendono il risultato invece di ripetere il lavoro.
+Non è una cache: terminato il calcolo la chiave viene liberata.
+"""
+import threading
+import time
+
+
+class _Call:
+    """Calcolo in corso per una chiave."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Gruppo di calcoli in corso, con contatori per tipo di chiave."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {}
+
+    def _counters(self, key):
+        # Le chiavi sono tuple (tipo, id): i contatori si aggregano per tipo
+        kind = key[0] if isinstance(key, tuple) else key
+        return self._stats.setdefault(kind, {'runs': 0, 'waits': 0, 'wait_ms': 0.0})
+
+    def do(self, key, fn):
+        """
+        Esegue fn() una sola volta per le richieste concorrenti con la stessa chiave.
+        Restituisce (risultato, condiviso): condiviso=True se si è atteso il calcolo di un altro thread,
+        che quindi restituisce lo stesso oggetto. Un'eccezione di fn viene rilanciata anche a chi attende.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            counters = self._counters(key)
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                    counters['runs'] += 1
+                call.done.set()
+            return call.result, False
+
+        t0 = time.perf_counter()
+        call.done.wait()
+        with self._lock:
+            counters['waits'] += 1
+            counters['wait_ms'] += (time.perf_counter() - t0) * 1000
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    def in_flight(self):
+        """Numero di calcoli attualmente in corso."""
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        """Contatori per tipo: esecuzioni, attese, quota deduplicata e attesa media."""
+        with self._lock:
+            snapshot = {kind: dict(c) for kind, c in self._stats.items()}
+        rows = []
+        for kind, c in sorted(snapshot.items()):
+            total = c['runs'] + c['waits']
+            rows.append({
+                'kind': kind,
+                'runs': c['runs'],
+                'waits': c['waits'],
+                'dedup_pct': round(100 * c['waits'] / total, 1) if total else 0.0,
+                'avg_wait_ms': round(c['wait_ms'] / c['waits'], 1) if c['waits'] else 0.0,
+            })
+        return rows
+
+
+# Gruppo condiviso da tutte le sessioni del processo
+_group = SingleFlight()
+
+
+def do(key, fn):
+    """do() sul gruppo condiviso del processo."""
+    return _group.do(key, fn)
+
+
+def stats():
+    """stats() del gruppo condiviso del processo."""
+    return _group.stats()
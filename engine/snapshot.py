@@ -0,0 +1,208 @@
+"""
+Snapshot dell'archivio locale: tutti i dati derivati in un solo file tar.gz versionato.
+
+Sui deploy con disco effimero (container che ripartono da zero) il primo utente dopo un riavvio
+rileggerebbe e ricalcolerebbe tutto: righe trend, aggregati, curve di potenza, istogrammi delle
+zone, griglie di densità, intervalli, segmenti con le tracce e l'archivio stagionale a colonne. Lo snapshot li
+raccoglie con un manifest che riporta la versione del formato di ogni archivio; al ripristino si
+prendono solo gli archivi con la versione corrente, gli altri restano vuoti e la dashboard li
+ricostruisce man mano, attività per attività, come al primo avvio.
+
+Uso da riga di comando (stessa cartella FITSTORAGE_CACHE_DIR della dashboard):
+    python -m engine.snapshot export snapshot.tar.gz
+    python -m engine.snapshot import snapshot.tar.gz [--overwrite]
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+
+import numpy as np
+
+from engine import store
+from engine.archive import ARCHIVE_DIR, ARCHIVE_VERSION, CHANNELS, INDEX_FILE
+from engine.curves import CURVE_VERSION, CURVES_FILE
+from engine.density import DENSITY_FILE, DENSITY_VERSION
+from engine.intervals import INTERVALS_FILE, INTERVALS_VERSION
+from engine.segments import SEGMENTS_FILE, SEGMENTS_VERSION, TRACK_VERSION, TRACKS_DIR
+from engine.summaries import SUMMARIES_FILE, SUMMARY_VERSION
+from engine.trends import ROLLUPS_FILE, ROLLUPS_VERSION
+from engine.zones import ZONES_FILE, ZONES_VERSION
+
+SNAPSHOT_VERSION = 1
+MANIFEST = 'manifest.json'
+
+# Versione del formato di ogni archivio: le costanti stanno nei moduli che li scrivono
+STORE_VERSIONS = {
+    SUMMARIES_FILE: SUMMARY_VERSION,
+    ROLLUPS_FILE: ROLLUPS_VERSION,
+    CURVES_FILE: CURVE_VERSION,
+    ZONES_FILE: ZONES_VERSION,
+    DENSITY_FILE: DENSITY_VERSION,
+    INTERVALS_FILE: INTERVALS_VERSION,
+    SEGMENTS_FILE: SEGMENTS_VERSION,
+    TRACKS_DIR: TRACK_VERSION,
+    ARCHIVE_DIR: ARCHIVE_VERSION,
+}
+
+
+def _read(name):
+    try:
+        with open(store.cache_path(name), 'rb') as fh:
+            return fh.read()
+    except OSError:
+        return None
+
+
+def _archive_files():
+    """
+    File dell'archivio stagionale: di ogni canale solo i byte coperti dall'indice (un'aggiunta
+    in corso non finisce nello snapshot a metà), indice per ultimo.
+    """
+    index = _read(INDEX_FILE)
+    if index is None:
+        return
+    entries = json.loads(index)
+    samples = entries[-1]['offset'] + entries[-1]['n'] if entries else 0
+    for channel, dtype in CHANNELS.items():
+        data = _read(os.path.join(ARCHIVE_DIR, f"{channel}.bin")) or b''
+        yield os.path.join(ARCHIVE_DIR, f"{channel}.bin"), data[:samples * np.dtype(dtype).itemsize]
+    yield INDEX_FILE, index
+
+
+def _store_files(entry):
+    """(percorso relativo, byte) dei file salvati per un archivio di STORE_VERSIONS."""
+    if entry == ARCHIVE_DIR:
+        yield from _archive_files()
+    elif entry == TRACKS_DIR:
+        folder = os.path.join(store.CACHE_DIR, TRACKS_DIR)
+        for name in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+            data = _read(os.path.join(TRACKS_DIR, name))
+            if data is not None:
+                yield os.path.join(TRACKS_DIR, name), data
+    else:
+        data = _read(entry)
+        if data is not None:
+            yield entry, data
+
+
+def _add(tar, name, data):
+    info = tarfile.TarInfo(name.replace(os.sep, '/'))
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+
+
+def write_snapshot(fileobj):
+    """Scrive nello stream lo snapshot tar.gz dell'archivio locale. Restituisce il manifest."""
+    manifest = {
+        'versione': SNAPSHOT_VERSION,
+        'creato': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'archivi': {},
+    }
+    with tarfile.open(fileobj=fileobj, mode='w:gz') as tar:
+        for entry, version in STORE_VERSIONS.items():
+            files = 0
+            for name, data in _store_files(entry):
+                _add(tar, name, data)
+                files += 1
+            if files:
+                manifest['archivi'][entry] = {'versione': version, 'file': files}
+        # Il manifest chiude l'archivio: uno snapshot troncato non ha manifest e viene rifiutato
+        _add(tar, MANIFEST, json.dumps(manifest, indent=1).encode('utf-8'))
+    return manifest
+
+
+def export_snapshot():
+    """Snapshot dell'archivio locale come bytes (per download o upload)."""
+    buffer = io.BytesIO()
+    write_snapshot(buffer)
+    return buffer.getvalue()
+
+
+def _entry_of(name):
+    """Archivio di STORE_VERSIONS a cui appartiene un membro dello snapshot (None se estraneo)."""
+    path = os.path.normpath(name)
+    if os.path.isabs(path) or path.startswith('..'):
+        return None
+    top = path.split(os.sep)[0]
+    return top if top in STORE_VERSIONS else None
+
+
+def _present(entry):
+    if entry == ARCHIVE_DIR:
+        return os.path.exists(os.path.join(store.CACHE_DIR, INDEX_FILE))
+    path = os.path.join(store.CACHE_DIR, entry)
+    return bool(os.listdir(path)) if os.path.isdir(path) else os.path.exists(path)
+
+
+def restore_snapshot(fileobj, overwrite=False):
+    """
+    Ripristina nell'archivio locale gli archivi dello snapshot con la versione corrente.
+    Con overwrite=False quelli già presenti in locale (più recenti) restano come sono.
+    Restituisce {'creato', 'ripristinati': [...], 'scartati': {archivio: motivo}};
+    ValueError se il file non è uno snapshot leggibile o ha un'altra versione.
+    """
+    try:
+        with tarfile.open(fileobj=fileobj, mode='r:gz') as tar:
+            members = {m.name: m for m in tar.getmembers() if m.isfile()}
+            if MANIFEST not in members:
+                raise ValueError("Snapshot senza manifest (incompleto?).")
+            manifest = json.loads(tar.extractfile(members[MANIFEST]).read())
+            if manifest.get('versione') != SNAPSHOT_VERSION:
+                raise ValueError(f"Versione snapshot {manifest.get('versione')} non supportata (attesa {SNAPSHOT_VERSION}).")
+
+            restored, skipped = [], {}
+            for entry, info in manifest.get('archivi', {}).items():
+                if STORE_VERSIONS.get(entry) != info.get('versione'):
+                    skipped[entry] = f"versione {info.get('versione')}, attesa {STORE_VERSIONS.get(entry)}"
+                elif _present(entry) and not overwrite:
+                    skipped[entry] = "già presente in locale"
+                else:
+                    restored.append(entry)
+
+            names = [n for n in members if _entry_of(n) in restored]
+            # Indice dell'archivio stagionale per ultimo: prima i canali, poi chi dice quanto leggerne
+            names.sort(key=lambda n: os.path.normpath(n) == os.path.normpath(INDEX_FILE))
+            for name in names:
+                store.write_bytes(os.path.normpath(name), tar.extractfile(members[name]).read())
+    except (tarfile.TarError, OSError, EOFError, KeyError, json.JSONDecodeError) as e:
+        raise ValueError(f"Snapshot non leggibile: {e}") from e
+    return {'creato': manifest.get('creato'), 'ripristinati': restored, 'scartati': skipped}
+
+
+def import_snapshot(data, overwrite=False):
+    """restore_snapshot da bytes (es. file scaricato da Drive)."""
+    return restore_snapshot(io.BytesIO(data), overwrite)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Esporta o ripristina lo snapshot dell'archivio locale.")
+    parser.add_argument('azione', choices=['export', 'import'])
+    parser.add_argument('file', help="file .tar.gz dello snapshot")
+    parser.add_argument('--overwrite', action='store_true', help="sostituisce anche gli archivi già presenti (import)")
+    args = parser.parse_args(argv)
+
+    if args.azione == 'export':
+        with open(args.file, 'wb') as fh:
+            manifest = write_snapshot(fh)
+        print(f"{len(manifest['archivi'])} archivi esportati in {args.file} "
+              f"({os.path.getsize(args.file) / 1e6:.1f} MB)", file=sys.stderr)
+        return 0
+    try:
+        with open(args.file, 'rb') as fh:
+            report = restore_snapshot(fh, args.overwrite)
+    except (OSError, ValueError) as e:
+        print(f"Errore: {e}", file=sys.stderr)
+        return 1
+    print(f"Snapshot del {report['creato']}: ripristinati {', '.join(report['ripristinati']) or 'nessuno'}", file=sys.stderr)
+    for entry, reason in report['scartati'].items():
+        print(f"  scartato {entry}: {reason}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
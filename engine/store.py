@@ -0,0 +1,78 @@
+"""
+Archivio locale dei dati derivati (JSON), condiviso da dashboard e script batch.
+
+La cartella si configura con la variabile FITSTORAGE_CACHE_DIR; le scritture sono
+atomiche (file temporaneo + rename) per non lasciare file a metà tra sessioni concorrenti.
+Le scritture che non possono esserlo (aggiunte in coda all'archivio stagionale) si fanno sotto
+file_lock, un lock esclusivo tra processi: dashboard, CLI e report usano la stessa cartella.
+"""
+import contextlib
+import json
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+CACHE_DIR = os.environ.get('FITSTORAGE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'fitstorage'))
+
+
+def cache_path(*parts):
+    """Percorso di un file nell'archivio locale (crea le cartelle mancanti)."""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def read_json(name, default=None):
+    """Legge un JSON dall'archivio; default se manca o è illeggibile."""
+    try:
+        with open(cache_path(name), encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return default
+
+
+def _write_atomic(name, mode, write):
+    path = cache_path(name)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode, encoding=None if 'b' in mode else 'utf-8') as fh:
+            write(fh)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def write_json(name, data):
+    """Scrive un JSON nell'archivio in modo atomico."""
+    _write_atomic(name, 'w', lambda fh: json.dump(data, fh, default=str))
+
+
+def write_bytes(name, data):
+    """Scrive un file binario nell'archivio in modo atomico (es. ripristino di uno snapshot)."""
+    _write_atomic(name, 'wb', lambda fh: fh.write(data))
+
+
+@contextlib.contextmanager
+def file_lock(name):
+    """Lock esclusivo tra processi sul file 'name' dell'archivio locale (attende se è già preso)."""
+    with open(cache_path(name), 'a+b') as fh:
+        if fcntl:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        else:
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
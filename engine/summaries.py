@@ -0,0 +1,48 @@
+"""
+Indice locale delle righe trend: riga riassuntiva e impronta di ogni file, per nome.
+
+Ogni voce ricorda l'md5 del file (dai metadati Drive) e la versione del formato della riga:
+al riavvio, o dopo aver ripristinato uno snapshot, la tabella trend riusa le righe dei file
+invariati e rilegge solo quelli nuovi, modificati o salvati con un formato precedente.
+"""
+import pandas as pd
+
+from engine import store
+from engine.cleaning import rules_key
+
+SUMMARIES_FILE = 'summaries.json'
+# Da incrementare quando cambiano le colonne della riga trend o dell'impronta
+SUMMARY_VERSION = 1
+
+
+def load_summaries():
+    """Righe salvate per file: {nome_file: {'md5', 'versione', 'riga', 'impronta'}}."""
+    return store.read_json(SUMMARIES_FILE, {})
+
+
+def save_summaries(summaries):
+    store.write_json(SUMMARIES_FILE, summaries)
+
+
+def summary_entry(row, fp, md5):
+    """Voce dell'indice per una riga trend e la sua impronta (date in ISO per il JSON)."""
+    return {
+        'md5': md5,
+        'versione': SUMMARY_VERSION,
+        'pulizia': rules_key(),
+        'riga': dict(row, Data=pd.Timestamp(row['Data']).isoformat()),
+        'impronta': fp,
+    }
+
+
+def stored_summary(saved, filename, md5):
+    """
+    (riga, impronta) salvate per il file se il contenuto (md5), il formato e le soglie di pulizia
+    sono quelli correnti, altrimenti None. Senza md5 non si può sapere se il file è cambiato: si rilegge.
+    """
+    entry = saved.get(filename)
+    if not md5 or not entry or entry.get('md5') != md5 or entry.get('versione') != SUMMARY_VERSION:
+        return None
+    if entry.get('pulizia') != rules_key():
+        return None
+    return dict(entry['riga'], Data=pd.Timestamp(entry['riga']['Data'])), entry['impronta']
@@ -0,0 +1,186 @@
+"""
+Aggregati settimanali e mensili della tabella trend, aggiornati in modo incrementale.
+
+Ogni attività contribuisce solo al proprio bucket (settimana ISO che parte dal lunedì e mese):
+aggiungere un'uscita aggiorna due bucket, non l'intero archivio. Le somme sono indipendenti
+dall'FTP (il TSS si ricava da sum(durata x NP^2) al momento della lettura), così cambiare FTP
+non invalida gli aggregati.
+"""
+import pandas as pd
+
+from engine import store
+
+ROLLUPS_FILE = 'rollups.json'
+# Da incrementare quando cambiano i campi dei bucket o delle attività salvate
+ROLLUPS_VERSION = 1
+FREQS = {'W': 'Settimana', 'M': 'Mese'}
+# Somme per bucket; i migliori sforzi sono massimi
+SUM_FIELDS = ['attivita', 'distanza_km', 'durata_min', 'dislivello_m', 'tss_units', 'lavoro',
+              'ef_min', 'disacc_min', 'ef_durata_min']
+MAX_FIELDS = ['best_5min', 'best_20min']
+
+
+def period_start(date, freq):
+    """Inizio del bucket (lunedì della settimana o primo del mese) come stringa AAAA-MM-GG."""
+    ts = pd.Timestamp(date)
+    period = ts.to_period('W-SUN' if freq == 'W' else 'M')
+    return period.start_time.strftime('%Y-%m-%d')
+
+
+def auto_freq(dates, max_points=60):
+    """
+    Granularità dei grafici per l'archivio: None (un punto per uscita) fino a max_points uscite,
+    poi settimanale se l'intervallo copre al massimo due anni, altrimenti mensile.
+    """
+    if len(dates) <= max_points:
+        return None
+    span_days = (pd.Timestamp(max(dates)) - pd.Timestamp(min(dates))).days
+    return 'W' if span_days <= 730 else 'M'
+
+
+def activity_entry(row):
+    """Contributo di una riga della tabella trend agli aggregati."""
+    durata_min = float(row.get('Durata (min)', 0) or 0)
+    np_w = float(row.get('NP (W)', 0) or 0)
+    ef = float(row.get('EF', 0) or 0)
+    disacc = float(row.get('Pw:HR (%)', 0) or 0)
+    return {
+        'data': pd.Timestamp(row['Data']).isoformat(),
+        'attivita': 1,
+        'distanza_km': float(row.get('Distanza (km)', 0) or 0),
+        'durata_min': durata_min,
+        'dislivello_m': float(row.get('Dislivello (m)', 0) or 0),
+        # TSS x FTP^2 x 36: sum(durata_s x NP^2), diviso per FTP^2 x 36 alla lettura
+        'tss_units': durata_min * 60 * np_w ** 2,
+        'lavoro': float(row.get('Potenza Avg (W)', 0) or 0) * durata_min,
+        'best_5min': float(row.get('Best 5min (W)', 0) or 0),
+        'best_20min': float(row.get('Best 20min (W)', 0) or 0),
+        # EF e Pw:HR dell'uscita; per periodo medie pesate sulla durata delle sole uscite con EF
+        'ef': ef,
+        'disaccoppiamento': disacc,
+        'ef_min': ef * durata_min,
+        'disacc_min': disacc * durata_min if ef > 0 else 0.0,
+        'ef_durata_min': durata_min if ef > 0 else 0.0,
+    }
+
+
+def _empty_bucket():
+    bucket = {f: 0.0 for f in SUM_FIELDS + MAX_FIELDS}
+    bucket['membri'] = []
+    return bucket
+
+
+class Rollups:
+    """Aggregati incrementali per settimana e mese, indicizzati per nome file."""
+
+    def __init__(self, activities=None, buckets=None):
+        self.activities = activities or {}
+        self.buckets = buckets or {freq: {} for freq in FREQS}
+
+    def add(self, filename, entry):
+        """Aggiunge (o sostituisce) un'attività aggiornando solo i suoi bucket. True se cambia qualcosa."""
+        if self.activities.get(filename) == entry:
+            return False
+        if filename in self.activities:
+            self.remove(filename)
+        self.activities[filename] = entry
+        for freq in FREQS:
+            bucket = self.buckets[freq].setdefault(period_start(entry['data'], freq), _empty_bucket())
+            for f in SUM_FIELDS:
+                bucket[f] = bucket.get(f, 0.0) + entry.get(f, 0.0)
+            for f in MAX_FIELDS:
+                bucket[f] = max(bucket[f], entry[f])
+            bucket['membri'].append(filename)
+        return True
+
+    def remove(self, filename):
+        """Toglie un'attività ricalcolando solo i bucket che la contenevano."""
+        entry = self.activities.pop(filename, None)
+        if entry is None:
+            return False
+        for freq in FREQS:
+            key = period_start(entry['data'], freq)
+            members = [m for m in self.buckets[freq].get(key, {}).get('membri', []) if m != filename]
+            self.buckets[freq].pop(key, None)
+            if members:
+                bucket = _empty_bucket()
+                for m in members:
+                    other = self.activities[m]
+                    for f in SUM_FIELDS:
+                        bucket[f] += other.get(f, 0.0)
+                    for f in MAX_FIELDS:
+                        bucket[f] = max(bucket[f], other[f])
+                bucket['membri'] = members
+                self.buckets[freq][key] = bucket
+        return True
+
+    def update_from_summary(self, df_summary):
+        """Aggiunge le righe della tabella trend non ancora presenti. Restituisce quante ne ha aggiornate."""
+        changed = 0
+        for row in df_summary.to_dict('records'):
+            if self.add(row['Filename'], activity_entry(row)):
+                changed += 1
+        return changed
+
+    def prune(self, current):
+        """
+        Toglie le attività che non sono più tra i file correnti (cancellati o rinominati nella
+        cartella), così gli aggregati seguono il contenuto dell'archivio. Restituisce quante ne ha tolte.
+        current deve essere l'elenco completo (paginato) della cartella: un elenco vuoto, di solito
+        un elenco fallito, non toglie nulla.
+        """
+        current = set(current)
+        if not current:
+            return 0
+        return sum(self.remove(name) for name in [n for n in self.activities if n not in current])
+
+    def table(self, freq, ftp, filenames=None):
+        """
+        Tabella per bucket (freq 'W' o 'M'). Con filenames limita ai soli file indicati:
+        in quel caso i bucket si ricalcolano dalle attività scelte invece di usare gli aggregati.
+        """
+        if filenames is not None and set(filenames) != set(self.activities):
+            subset = Rollups()
+            for name in filenames:
+                if name in self.activities:
+                    subset.add(name, self.activities[name])
+            return subset.table(freq, ftp)
+
+        rows = []
+        for key, b in sorted(self.buckets[freq].items()):
+            durata_h = b['durata_min'] / 60
+            rows.append({
+                'Periodo': pd.Timestamp(key),
+                'Attività': int(b['attivita']),
+                'Distanza (km)': round(b['distanza_km'], 1),
+                'Durata (h)': round(durata_h, 1),
+                'Dislivello (m)': int(b['dislivello_m']),
+                'TSS': round(b['tss_units'] / (ftp ** 2 * 36), 0) if ftp > 0 else 0,
+                'Potenza Avg (W)': int(b['lavoro'] / b['durata_min']) if b['durata_min'] > 0 else 0,
+                'Velocità Avg (km/h)': round(b['distanza_km'] / durata_h, 1) if durata_h > 0 else 0,
+                'Best 5min (W)': int(b['best_5min']),
+                'Best 20min (W)': int(b['best_20min']),
+                'EF': round(b.get('ef_min', 0) / b['ef_durata_min'], 3) if b.get('ef_durata_min') else None,
+                'Pw:HR (%)': round(b.get('disacc_min', 0) / b['ef_durata_min'], 1) if b.get('ef_durata_min') else None,
+            })
+        columns = ['Periodo', 'Attività', 'Distanza (km)', 'Durata (h)', 'Dislivello (m)', 'TSS',
+                   'Potenza Avg (W)', 'Velocità Avg (km/h)', 'Best 5min (W)', 'Best 20min (W)', 'EF', 'Pw:HR (%)']
+        return pd.DataFrame(rows, columns=columns)
+
+    def to_dict(self):
+        return {'activities': self.activities, 'buckets': self.buckets}
+
+    @classmethod
+    def from_dict(cls, data):
+        if not data:
+            return cls()
+        return cls(activities=data.get('activities'), buckets=data.get('buckets'))
+
+
+def load_rollups():
+    """Aggregati salvati nell'archivio locale (vuoti al primo avvio)."""
+    return Rollups.from_dict(store.read_json(ROLLUPS_FILE))
+
+
+def save_rollups(rollups):
+    store.write_json(ROLLUPS_FILE, rollups.to_dict())
@@ -0,0 +1,151 @@
+"""
+Tempo in zona di potenza e frequenza cardiaca da istogrammi fini salvati per attività.
+
+Ogni attività si riassume una volta in due istogrammi (POWER_BIN_W watt e HR_BIN_BPM bpm per
+classe) pesati sulla durata reale di ogni campione, non sul numero di campioni: i file a 2-5 s
+o con buchi di registrazione contano il tempo giusto. Le zone per qualsiasi FTP o FC massima si
+ricavano poi dall'istogramma (interpolando la cumulata ai confini di zona) senza rileggere i
+dati, e le distribuzioni settimanali o stagionali sono semplici somme di istogrammi.
+"""
+import numpy as np
+import pandas as pd
+
+from engine import store
+from engine.cleaning import rules_key
+
+ZONES_FILE = 'zones.json'
+# Da incrementare quando cambia il modo di calcolare gli istogrammi (pesi, canali)
+ZONES_VERSION = 1
+
+POWER_BIN_W = 5
+HR_BIN_BPM = 2
+# Oltre questo intervallo tra due campioni il dispositivo era in pausa: il campione vale il passo tipico
+ZONE_MAX_GAP_S = 10
+
+# Confini di zona come frazione di FTP e di FC massima
+POWER_ZONES = ['Z1 Recupero', 'Z2 Resistenza', 'Z3 Tempo', 'Z4 Soglia', 'Z5+ VO2Max']
+POWER_ZONE_FRACTIONS = [0.55, 0.75, 0.90, 1.05]
+HR_ZONES = ['Z1 Recupero', 'Z2 Aerobico', 'Z3 Tempo', 'Z4 Soglia', 'Z5 VO2Max']
+HR_ZONE_FRACTIONS = [0.60, 0.70, 0.80, 0.90]
+ZONE_COLORS = ['#A0A0A0', '#00BFFF', '#32CD32', '#FFD700', '#FF4500']
+
+# Canale -> (chiave dell'istogramma, ampiezza della classe)
+ZONE_CHANNELS = {'power': ('potenza', POWER_BIN_W), 'heart_rate': ('fc', HR_BIN_BPM)}
+
+
+def sample_durations(df):
+    """Secondi rappresentati da ogni campione: distanza dal successivo, pause ridotte al passo tipico."""
+    n = len(df)
+    if 'timestamp' not in df.columns or n < 2:
+        return np.ones(n)
+    secs = (df['timestamp'] - df['timestamp'].iloc[0]).dt.total_seconds().to_numpy()
+    steps = np.diff(secs)
+    typical = float(np.median(steps[steps > 0])) if (steps > 0).any() else 1.0
+    steps = np.where((steps <= 0) | (steps > ZONE_MAX_GAP_S) | np.isnan(steps), typical, steps)
+    return np.append(steps, typical)
+
+
+def histogram(values, durations, width):
+    """Secondi per classe di ampiezza 'width' (classe i = [i*width, (i+1)*width)), NaN esclusi."""
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return []
+    idx = (np.maximum(values[valid], 0) // width).astype(np.int64)
+    return np.round(np.bincount(idx, weights=durations[valid]), 2).tolist()
+
+
+def activity_histograms(df):
+    """Istogrammi di potenza e FC dell'attività: {'potenza': {'bin', 'sec'}, 'fc': {...}}, canali presenti."""
+    durations = sample_durations(df)
+    hists = {}
+    for col, (key, width) in ZONE_CHANNELS.items():
+        if col in df.columns:
+            sec = histogram(df[col].to_numpy(), durations, width)
+            if sec:
+                hists[key] = {'bin': width, 'sec': sec}
+    return hists
+
+
+def sum_histograms(hists):
+    """Somma di istogrammi con la stessa ampiezza di classe (None e mancanti ignorati)."""
+    hists = [h for h in hists if h]
+    if not hists:
+        return None
+    total = np.zeros(max(len(h['sec']) for h in hists))
+    for h in hists:
+        total[:len(h['sec'])] += h['sec']
+    return {'bin': hists[0]['bin'], 'sec': total.tolist()}
+
+
+def zone_edges(reference, fractions):
+    """Confini interni delle zone in watt o bpm (FTP o FC massima per le frazioni)."""
+    return [reference * f for f in fractions]
+
+
+def zone_seconds(hist, edges):
+    """
+    Secondi per zona dai confini interni 'edges'. Le classi a cavallo di un confine si dividono
+    in proporzione (cumulata interpolata linearmente), quindi il risultato non dipende dall'ampiezza
+    della classe più di mezza classe.
+    """
+    sec = np.asarray(hist['sec'], dtype=float)
+    bounds = np.arange(len(sec) + 1) * hist['bin']
+    cum = np.concatenate([[0.0], np.cumsum(sec)])
+    at_edges = np.interp(edges, bounds, cum)
+    return np.diff(np.concatenate([[0.0], at_edges, [cum[-1]]]))
+
+
+def zone_table(hist, edges, labels):
+    """Tabella Zona / Sec / Minuti per il grafico delle zone."""
+    sec = zone_seconds(hist, edges) if hist else np.zeros(len(labels))
+    table = pd.DataFrame({'Zona': labels, 'Sec': sec})
+    table['Minuti'] = (table['Sec'] / 60).round(1)
+    return table
+
+
+def load_zone_histograms():
+    """Istogrammi salvati per attività: {nome_file: {'potenza': ..., 'fc': ...}}."""
+    return store.read_json(ZONES_FILE, {})
+
+
+def save_zone_histograms(hists):
+    store.write_json(ZONES_FILE, hists)
+
+
+def histograms_entry(hists, md5):
+    """
+    Voce salvata per un'attività: gli istogrammi (anche nessuno, senza potenza né FC) con l'md5
+    del file e l'impronta delle soglie di pulizia.
+    """
+    return dict(hists or {}, md5=md5, versione=ZONES_VERSION, pulizia=rules_key())
+
+
+def stored_histograms(saved, filename, md5=None):
+    """
+    Istogrammi salvati per l'attività se hanno formato, ampiezze di classe e soglie di pulizia
+    correnti e, con md5 indicato, vengono dallo stesso contenuto del file; altrimenti None.
+    """
+    entry = saved.get(filename)
+    if entry is None or entry.get('versione') != ZONES_VERSION or entry.get('pulizia') != rules_key():
+        return None
+    if md5 and entry.get('md5') != md5:
+        return None
+    for col, (key, width) in ZONE_CHANNELS.items():
+        if key in entry and entry[key]['bin'] != width:
+            return None
+    return entry
+
+
+def zone_distribution(groups, edges, labels, key_name='Periodo'):
+    """
+    Ore per zona di ogni gruppo ({chiave: [istogrammi]}, es. settimane o uscite) in formato lungo
+    (chiave, Zona, Ore) per un grafico a barre impilate.
+    """
+    rows = []
+    for key, hists in groups.items():
+        total = sum_histograms(hists)
+        sec = zone_seconds(total, edges) if total else np.zeros(len(labels))
+        for label, s in zip(labels, sec):
+            rows.append({key_name: key, 'Zona': label, 'Ore': round(float(s) / 3600, 2)})
+    return pd.DataFrame(rows, columns=[key_name, 'Zona', 'Ore'])